@@ -1,10 +1,45 @@
 import bpy
+import gpu
+import json
 import time
 import bmesh
-import random
-import operator
+import hashlib
+import threading
+import numpy as np
 from pathlib import Path
-from bpy.ops import _BPyOpsSubModOp
+from collections import OrderedDict
+from contextlib import contextmanager
+from mathutils.kdtree import KDTree
+from bpy.app.handlers import persistent
+from bpy_extras.io_utils import ExportHelper, ImportHelper
+from gpu_extras.batch import batch_for_shader
+
+from .thesis_core import (
+    LabeledMesh,
+    Convergence,
+    DetectionState,
+    Profile,
+    TopologyCache,
+    cut_edge_star,
+    iter_converge_non_manifold,
+    iter_fix_non_manifold,
+    iter_non_manifold,
+    label_components,
+    load_cached,
+    load_mesh,
+)
+from .thesis_core import kernels
+from .thesis_core.instrument import count, phase
+from .thesis_core.multi import iter_map_meshes
+from .thesis_core.parallel import MIN_PARALLEL_VERTS, worker_count
+from .thesis_core.roi import (
+    box_mask,
+    detect_non_manifold_roi,
+    frustum_mask,
+    ring_mask,
+    sphere_mask,
+)
+from .thesis_core.topology import csr_ranges, unique
 
 
 bl_info = {
@@ -21,8 +56,594 @@ bl_info = {
 }
 
 
-def dummy_view_layer_update(context):
-    pass
+# Blender adapters over the array core (thesis_core)
+#
+# Operators run in the mode they are invoked in and never switch it: in
+# Object mode the Mesh arrays are read and written with foreach_get /
+# foreach_set, in Edit mode the edit mesh is synced to the Mesh once to be
+# read and only the changed elements of the edit BMesh are written. The
+# undo step of a run then holds its own edit, not a chain of mode switches.
+
+
+def mesh_to_arrays(me):
+    """Read a Mesh into a LabeledMesh with foreach_get"""
+    with phase("read arrays"):
+        n_faces = len(me.polygons)
+
+        loop_start = np.empty(n_faces, dtype=np.int32)
+        loop_total = np.empty(n_faces, dtype=np.int32)
+        labels = np.empty(n_faces, dtype=np.int32)
+        loop_verts = np.empty(len(me.loops), dtype=np.int32)
+
+        me.polygons.foreach_get("loop_start", loop_start)
+        me.polygons.foreach_get("loop_total", loop_total)
+        me.polygons.foreach_get("material_index", labels)
+        me.loops.foreach_get("vertex_index", loop_verts)
+
+        face_offsets = np.zeros(n_faces + 1, dtype=np.int64)
+        np.cumsum(loop_total, out=face_offsets[1:])
+
+        # Gather loops in polygon order, loop_start is not required to be sorted
+        shift = np.repeat(loop_start - face_offsets[:-1], loop_total)
+        face_verts = loop_verts[np.arange(face_offsets[-1]) + shift]
+
+        verts = np.empty(len(me.vertices) * 3, dtype=np.float32)
+        me.vertices.foreach_get("co", verts)
+
+        return LabeledMesh(verts, face_offsets, face_verts, labels)
+
+
+def arrays_to_mesh(name, mesh, obj_axes=False):
+    """Build a Mesh datablock from a LabeledMesh with foreach_set
+
+    obj_axes converts from the OBJ convention (Y up, -Z forward) the way
+    Blender's OBJ importer does.
+    """
+    verts = mesh.verts
+    if obj_axes:
+        verts = np.stack((verts[:, 0], -verts[:, 2], verts[:, 1]), axis=1)
+
+    me = bpy.data.meshes.new(name)
+    me.vertices.add(mesh.n_verts)
+    me.vertices.foreach_set("co", np.ascontiguousarray(verts).ravel())
+    me.loops.add(len(mesh.face_verts))
+    me.loops.foreach_set("vertex_index", mesh.face_verts)
+    me.polygons.add(mesh.n_faces)
+    me.polygons.foreach_set(
+        "loop_start", mesh.face_offsets[:-1].astype(np.int32))
+    if bpy.app.version < (4, 0, 0):
+        # Read-only since 4.0, sizes follow from loop_start
+        me.polygons.foreach_set(
+            "loop_total", np.diff(mesh.face_offsets).astype(np.int32))
+    me.polygons.foreach_set("material_index", mesh.labels)
+
+    for name in mesh.materials:
+        mat = bpy.data.materials.get(name) or bpy.data.materials.new(name)
+        me.materials.append(mat)
+
+    me.update(calc_edges=True)
+    return me
+
+
+def add_vertex_groups(obj, mesh):
+    """One vertex group per face group of the mesh, holding its vertices"""
+    for name, faces in mesh.groups.items():
+        verts = unique(mesh.face_verts[csr_ranges(mesh.face_offsets, faces)])
+        obj.vertex_groups.new(name=name).add(verts.tolist(), 1.0, 'REPLACE')
+
+
+def add_mesh_object(context, name, mesh, collection=None):
+    """Link a new object of a LabeledMesh (OBJ axes), selected and active"""
+    obj = bpy.data.objects.new(name, arrays_to_mesh(name, mesh, obj_axes=True))
+    add_vertex_groups(obj, mesh)
+    (collection or context.collection).objects.link(obj)
+
+    for o in context.selected_objects:
+        o.select_set(False)
+    obj.select_set(True)
+    context.view_layer.objects.active = obj
+    return obj
+
+
+def read_mesh(obj):
+    """LabeledMesh of a mesh object, in Object or Edit mode
+
+    In Edit mode the edit mesh is written to the Mesh first, the one sync
+    of a run; the Mesh arrays (selection included) are current after it.
+    """
+    if obj.mode == 'EDIT':
+        with phase("edit mesh sync"):
+            obj.update_from_editmode()
+    return mesh_to_arrays(obj.data)
+
+
+def read_selection(me):
+    """Vertex selection mask of the Mesh arrays, see read_mesh()"""
+    selected = np.empty(len(me.vertices), dtype=bool)
+    me.vertices.foreach_get("select", selected)
+    return selected
+
+
+def select_vertices(obj, mask, selected=None):
+    """Select the vertices of a mask and nothing else, in any mode
+
+    Object mode writes the select arrays with foreach_set. In Edit mode the
+    selection is cleared and only the masked vertices of the edit BMesh are
+    selected; `selected` is the mask of an earlier write of the same run,
+    whose vertices are still selected and are skipped.
+    """
+    me = obj.data
+    mask = np.asarray(mask, dtype=bool)
+    with phase("write selection"):
+        if obj.mode != 'EDIT':
+            me.polygons.foreach_set(
+                "select", np.zeros(len(me.polygons), dtype=bool))
+            me.edges.foreach_set(
+                "select", np.zeros(len(me.edges), dtype=bool))
+            me.vertices.foreach_set("select", mask)
+            me.update()
+            return
+
+        bm = bmesh.from_edit_mesh(me)
+        bm.verts.ensure_lookup_table()
+        if selected is None or (selected & ~mask).any():
+            bpy.ops.mesh.select_all(action='DESELECT')
+            selected = np.zeros(len(mask), dtype=bool)
+        for i in np.flatnonzero(mask & ~selected).tolist():
+            bm.verts[i].select = True
+        bm.select_flush_mode()
+        bmesh.update_edit_mesh(me, loop_triangles=False, destructive=False)
+
+
+def select_region(obj, mask, roi, selected):
+    """Select the vertices of a mask inside a region, the rest untouched
+
+    `selected` is the current vertex selection. Edges and faces follow
+    their vertices, as in vertex select mode.
+    """
+    me = obj.data
+    changed = np.flatnonzero(roi & (mask != selected))
+    with phase("write selection"):
+        if obj.mode != 'EDIT':
+            selection = selected.copy()
+            selection[changed] = mask[changed]
+            me.vertices.foreach_set("select", selection)
+
+            edge_verts = np.empty(len(me.edges) * 2, dtype=np.int32)
+            me.edges.foreach_get("vertices", edge_verts)
+            me.edges.foreach_set(
+                "select", selection[edge_verts].reshape(-1, 2).all(axis=1))
+
+            loop_verts = np.empty(len(me.loops), dtype=np.int32)
+            loop_start = np.empty(len(me.polygons), dtype=np.int32)
+            me.loops.foreach_get("vertex_index", loop_verts)
+            me.polygons.foreach_get("loop_start", loop_start)
+            if len(loop_start):
+                order = np.argsort(loop_start)
+                faces = np.empty(len(loop_start), dtype=bool)
+                faces[order] = np.logical_and.reduceat(
+                    selection[loop_verts], loop_start[order])
+                me.polygons.foreach_set("select", faces)
+            me.update()
+        else:
+            bm = bmesh.from_edit_mesh(me)
+            bm.verts.ensure_lookup_table()
+            for i, value in zip(changed.tolist(), mask[changed].tolist()):
+                bm.verts[i].select = value
+            bm.select_flush_mode()
+            bmesh.update_edit_mesh(me, loop_triangles=False, destructive=False)
+    count("selection_changed", len(changed))
+
+
+def write_labels(obj, labels, previous=None):
+    """Write face labels (material indices), in any mode
+
+    Object mode writes them all with foreach_set. In Edit mode only the
+    faces whose label differs from `previous` are set in the edit BMesh.
+    """
+    me = obj.data
+    with phase("write labels"):
+        if obj.mode != 'EDIT':
+            me.polygons.foreach_set("material_index", labels)
+            me.update()
+            return
+
+        bm = bmesh.from_edit_mesh(me)
+        bm.faces.ensure_lookup_table()
+        changed = (np.arange(len(labels)) if previous is None
+                   else np.flatnonzero(labels != previous))
+        for i, label in zip(changed.tolist(), labels[changed].tolist()):
+            bm.faces[i].material_index = label
+        bmesh.update_edit_mesh(me, loop_triangles=False, destructive=False)
+        count("faces_written", len(changed))
+
+
+def write_geometry(obj, mesh, selected):
+    """Replace the geometry of a mesh object by a LabeledMesh, in any mode
+
+    The vertices of the `selected` mask are selected, material slots stay.
+    Other layers (UVs, creases, ...) are not carried over.
+    """
+    me = obj.data
+    with phase("write mesh"):
+        new = arrays_to_mesh(me.name, mesh)
+        new.vertices.foreach_set("select", selected)
+        if obj.mode == 'EDIT':
+            bm = bmesh.from_edit_mesh(me)
+            bm.clear()
+            bm.from_mesh(new)
+            bm.select_flush_mode()
+            bmesh.update_edit_mesh(me)
+        else:
+            bm = bmesh.new()
+            bm.from_mesh(new)
+            bm.select_flush_mode()
+            bm.to_mesh(me)
+            bm.free()
+            me.update()
+        bpy.data.meshes.remove(new)
+
+
+def vertex_select_mode(context):
+    """Vertex select mode, set directly instead of through an operator"""
+    context.tool_settings.mesh_select_mode = (True, False, False)
+
+
+def mesh_objects(context):
+    """Mesh objects an operator runs on, active first
+
+    The objects in Edit mode, or the selected mesh objects in Object mode;
+    objects sharing a mesh are taken once.
+    """
+    if context.mode == 'EDIT_MESH':
+        objects = list(context.objects_in_mode_unique_data)
+    else:
+        objects = [o for o in context.selected_objects if o.type == 'MESH']
+
+    active = context.active_object
+    if active is not None and active.type == 'MESH' and active not in objects:
+        objects.append(active)
+    objects.sort(key=lambda o: o != active)
+
+    unique_data = {}
+    for obj in objects:
+        unique_data.setdefault(obj.data.as_pointer(), obj)
+    return list(unique_data.values())
+
+
+def set_objects_labels(context, scheme, world=False, **params):
+    """Label the faces of every mesh object from a SCHEMES scheme
+
+    The meshes are read once each, labeled together in a pool and written
+    back one batch per object. world applies each obj.matrix_world to the
+    face centers first. Returns the number of objects.
+    """
+    objects = mesh_objects(context)
+    meshes = [read_mesh(obj) for obj in objects]
+    args = [(scheme, np.array(obj.matrix_world) if world else None)
+            for obj in objects]
+
+    with phase("labeling"):
+        results = iter_map_meshes("label", meshes, args, params,
+                                  context.scene.thesis_props.workers)
+        for i, labels in results:
+            write_labels(objects[i], labels, meshes[i].labels)
+    return len(objects)
+
+
+# Vertices re-detected per step after a cut
+# Detection state (topology, adjacency, components) of recent mesh datablocks
+topology_cache = TopologyCache(capacity=4)
+
+
+def detection_state(me, mesh, workers=1):
+    """Persistent detection state of a mesh, refreshed from label edits
+
+    Only the vertices of faces whose label changed since the last run are
+    re-evaluated. The topology is rebuilt only when the faces changed.
+    """
+    return topology_cache.get(me.as_pointer(), mesh, workers)
+
+
+# KD-trees of the vertices of recent meshes, for box and sphere regions
+spatial_indices = OrderedDict()
+SPATIAL_INDEX_CAPACITY = 4
+
+
+def spatial_index(me, verts):
+    """KD-tree of the mesh vertices (object space), rebuilt when they moved"""
+    key = me.as_pointer()
+    digest = hashlib.blake2b(np.ascontiguousarray(verts).data,
+                             digest_size=16).hexdigest()
+    entry = spatial_indices.get(key)
+    if entry is None or entry[0] != digest:
+        with phase("kdtree"):
+            tree = KDTree(len(verts))
+            for i, co in enumerate(verts.tolist()):
+                tree.insert(co, i)
+            tree.balance()
+        entry = spatial_indices[key] = (digest, tree)
+        while len(spatial_indices) > SPATIAL_INDEX_CAPACITY:
+            spatial_indices.popitem(last=False)
+    spatial_indices.move_to_end(key)
+    return entry[1]
+
+
+def region_mask(context, obj, mesh, selected):
+    """Vertex mask of the region of interest set in the panel
+
+    The selection grown by rings, a box or sphere around the 3D cursor
+    (world space, found through the cached KD-tree) or the part of the mesh
+    inside the view frustum.
+    """
+    props = context.scene.thesis_props
+    if props.roi == 'SELECTION':
+        return ring_mask(mesh, selected, props.roi_rings)
+
+    matrix = np.array(obj.matrix_world)
+    if props.roi == 'VIEW':
+        view = np.array(context.space_data.region_3d.perspective_matrix)
+        return frustum_mask(mesh.verts, view @ matrix)
+
+    # Candidates from the KD-tree in object space, within a sphere holding
+    # the region whatever the object scale, then the exact world space test
+    center = np.array(context.scene.cursor.location)
+    size = props.roi_size
+    radius = size * 3 ** 0.5 if props.roi == 'BOX' else size
+    scale = max(np.linalg.norm(matrix[:3, :3], axis=0).min(), 1e-12)
+    local = np.linalg.solve(matrix, np.append(center, 1.0))[:3]
+    tree = spatial_index(obj.data, mesh.verts)
+    with phase("kdtree query"):
+        candidates = np.array(
+            [i for _, i, _ in tree.find_range(local.tolist(), radius / scale)],
+            dtype=np.int64)
+
+    roi = np.zeros(mesh.n_verts, dtype=bool)
+    if len(candidates):
+        world = mesh.verts[candidates] @ matrix[:3, :3].T + matrix[:3, 3]
+        if props.roi == 'BOX':
+            inside = box_mask(world, center - size, center + size)
+        else:
+            inside = sphere_mask(world, center, size)
+        roi[candidates[inside]] = True
+    return roi
+
+
+@persistent
+def invalidate_topology(scene, depsgraph):
+    """Flag the cached meshes whose geometry was updated"""
+    for update in depsgraph.updates:
+        if not update.is_updated_geometry:
+            continue
+        data = update.id.original
+        if isinstance(data, bpy.types.Object) and data.type == 'MESH':
+            data = data.data
+        if isinstance(data, bpy.types.Mesh):
+            topology_cache.invalidate(data.as_pointer())
+
+
+@persistent
+def clear_topology(*args):
+    topology_cache.clear()
+    spatial_indices.clear()
+    live_overlay.reset()
+    if bpy.context.scene.thesis_props.live_overlay:
+        live_overlay.start()
+
+
+def warm_up_kernels():
+    """Compile the kernels in the background, off the first click
+
+    They are cached on disk once compiled, later warm-ups only load them.
+    """
+    if kernels.enabled():
+        threading.Thread(target=kernels.warm_up, daemon=True).start()
+
+
+@persistent
+def apply_kernels(*args):
+    """Use the kernel backend of the scene"""
+    kernels.set_backend(bpy.context.scene.thesis_props.kernels)
+    warm_up_kernels()
+
+
+# Live overlay of the non manifold vertices of the active mesh
+LIVE_INTERVAL = 0.1         # seconds between reads of an edited mesh
+LIVE_FRAME_BUDGET = 0.008   # seconds of re-evaluation per timer tick
+LIVE_TICK = 0.02            # seconds between ticks while vertices are dirty
+LIVE_CHUNK_VERTS = 1024
+LIVE_VERIFY_DELAY = 1.0     # idle seconds before the topology is checked
+LIVE_POINT_SIZE = 6.0
+LIVE_COLOR = (1.0, 0.1, 0.6, 1.0)
+
+
+class LiveOverlay:
+    """Non manifold vertices of the active mesh drawn as viewport points
+
+    Depsgraph updates only flag the mesh. A timer reads its material
+    indices back at most every LIVE_INTERVAL seconds, marks the vertices of
+    the faces whose label changed and re-evaluates them in chunks of at most
+    LIVE_FRAME_BUDGET seconds per tick, so painting labels stays responsive
+    whatever the size of the edit. The detection state is the one of
+    topology_cache, shared with the operators. An edit keeping the element
+    counts is taken as a label edit; the topology is checked once the mesh
+    has been idle for LIVE_VERIFY_DELAY seconds.
+    """
+
+    def __init__(self):
+        self.handle = None
+        self.shader = None
+        self.reset()
+
+    def reset(self):
+        self.key = None
+        self.state = None
+        self.batch = None
+        self.matrix = None
+        self.moved = True
+        self.updated = False
+        self.verified = True
+        self.read_time = 0.0
+        self.update_time = 0.0
+
+    @property
+    def running(self):
+        return self.handle is not None
+
+    def start(self):
+        if self.running:
+            return
+        name = 'POINT_UNIFORM_COLOR' if bpy.app.version >= (4, 0, 0) else '3D_UNIFORM_COLOR'
+        self.shader = gpu.shader.from_builtin(name)
+        self.handle = bpy.types.SpaceView3D.draw_handler_add(
+            self.draw, (), 'WINDOW', 'POST_VIEW')
+        bpy.app.timers.register(self.step, first_interval=0.0, persistent=True)
+
+    def stop(self, timer=True):
+        if self.running:
+            bpy.types.SpaceView3D.draw_handler_remove(self.handle, 'WINDOW')
+            self.handle = None
+        if timer and bpy.app.timers.is_registered(self.step):
+            bpy.app.timers.unregister(self.step)
+        self.reset()
+        redraw_views()
+
+    def flag(self, key):
+        """A depsgraph update of mesh `key`"""
+        if key == self.key:
+            self.updated = True
+            self.update_time = time.time()
+
+    def load(self, obj):
+        """Detection state of the object's mesh, rebuilt only if stale"""
+        me = obj.data
+        mesh = read_mesh(obj)
+        key = me.as_pointer()
+        state = topology_cache.lookup(key, mesh, refresh=False)
+        if state is None:
+            workers = bpy.context.scene.thesis_props.workers
+            state = topology_cache.store(
+                key, mesh, DetectionState(mesh, workers=workers))
+        self.key = key
+        self.state = state
+        self.updated = False
+        self.verified = True
+        self.read_time = time.time()
+
+    def read(self, obj):
+        """Labels and positions of an edited mesh, into the state"""
+        me = obj.data
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()
+
+        mesh = self.state.mesh
+        if (len(me.vertices), len(me.polygons), len(me.loops)) != (
+                mesh.n_verts, mesh.n_faces, len(mesh.face_verts)):
+            self.load(obj)
+            return
+
+        labels = np.empty(len(me.polygons), dtype=np.int32)
+        me.polygons.foreach_get("material_index", labels)
+        verts = np.empty(len(me.vertices) * 3, dtype=np.float32)
+        me.vertices.foreach_get("co", verts)
+
+        mesh.verts = verts.reshape(-1, 3)
+        self.moved = True
+        self.state.sync_labels(labels)
+        self.updated = False
+        self.verified = False
+        self.read_time = time.time()
+
+    def step(self):
+        """Timer: read the edits and re-evaluate within the frame budget"""
+        context = bpy.context
+        if not context.scene.thesis_props.live_overlay:
+            # Returning None ends the timer
+            self.stop(timer=False)
+            return None
+
+        obj = context.view_layer.objects.active
+        if obj is None or obj.type != 'MESH':
+            if self.batch is not None:
+                self.reset()
+                redraw_views()
+            return LIVE_INTERVAL
+
+        now = time.time()
+        key = obj.data.as_pointer()
+        state = self.state
+        if key != self.key or topology_cache.states.get(key) is not state:
+            self.load(obj)
+        elif self.updated and now - self.read_time >= LIVE_INTERVAL:
+            self.read(obj)
+        elif (not self.verified and not self.state.dirty
+              and now - self.update_time >= LIVE_VERIFY_DELAY):
+            self.load(obj)
+
+        deadline = time.perf_counter() + LIVE_FRAME_BUDGET
+        changed = False
+        while self.state.dirty and time.perf_counter() < deadline:
+            changed |= len(self.state.refresh(LIVE_CHUNK_VERTS)) > 0
+
+        matrix = np.array(obj.matrix_world)
+        if (changed or self.moved or self.state is not state
+                or not np.array_equal(matrix, self.matrix)):
+            self.build(obj)
+
+        return LIVE_TICK if self.state.dirty or self.updated else LIVE_INTERVAL
+
+    def build(self, obj):
+        """Point batch of the non manifold vertices, in world space"""
+        mask = self.state.mask
+        self.matrix = np.array(obj.matrix_world)
+        coords = self.state.mesh.verts[mask] @ self.matrix[:3, :3].T + self.matrix[:3, 3]
+        self.batch = batch_for_shader(self.shader, 'POINTS', {"pos": coords})
+        self.moved = False
+        count("overlay_points", len(coords))
+        redraw_views()
+
+    def draw(self):
+        if self.batch is None:
+            return
+        gpu.state.point_size_set(LIVE_POINT_SIZE)
+        gpu.state.depth_test_set('LESS_EQUAL')
+        self.shader.bind()
+        self.shader.uniform_float("color", LIVE_COLOR)
+        self.batch.draw(self.shader)
+        gpu.state.depth_test_set('NONE')
+        gpu.state.point_size_set(1.0)
+
+
+live_overlay = LiveOverlay()
+
+
+def redraw_views():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+@persistent
+def update_live_overlay(scene, depsgraph):
+    """Flag the overlay mesh when its data was updated"""
+    if not live_overlay.running:
+        return
+    for update in depsgraph.updates:
+        if not update.is_updated_geometry:
+            continue
+        data = update.id.original
+        if isinstance(data, bpy.types.Object) and data.type == 'MESH':
+            data = data.data
+        if isinstance(data, bpy.types.Mesh):
+            live_overlay.flag(data.as_pointer())
+
+
+def toggle_live_overlay(self, context):
+    if self.live_overlay:
+        live_overlay.start()
+    else:
+        live_overlay.stop()
 
 
 class MESH_OT_Thesis_Props(bpy.types.PropertyGroup):
@@ -34,10 +655,216 @@ class MESH_OT_Thesis_Props(bpy.types.PropertyGroup):
 
     )
 
+    live_overlay: bpy.props.BoolProperty(
+        name="Live Overlay",
+        description="Draw the non manifold vertices of the active mesh, updated as face labels change",
+        default=False,
+        update=lambda self, context: toggle_live_overlay(self, context)
+    )
+
+    roi: bpy.props.EnumProperty(
+        name="Region",
+        description="Vertices detection looks at, the selection elsewhere is left alone",
+        items=(
+            ('NONE', "Whole Mesh", "Every vertex, the whole selection is replaced"),
+            ('SELECTION', "Selection", "Selected vertices and faces grown by some rings"),
+            ('BOX', "Box", "Axis aligned box around the 3D cursor"),
+            ('SPHERE', "Sphere", "Sphere around the 3D cursor"),
+            ('VIEW', "View", "Vertices inside the viewport frustum"),
+        ),
+        default='NONE'
+    )
+
+    roi_rings: bpy.props.IntProperty(
+        name="Rings",
+        description="Vertex rings added around the selection",
+        default=1,
+        min=0
+    )
+
+    roi_size: bpy.props.FloatProperty(
+        name="Size",
+        description="Half size of the box, radius of the sphere",
+        default=0.1,
+        min=0.0,
+        subtype='DISTANCE'
+    )
+
+    incremental: bpy.props.BoolProperty(
+        name="Incremental Detection",
+        description="Re-check only the vertices of faces whose label changed since the last detection",
+        default=True
+    )
+
+    kernels: bpy.props.EnumProperty(
+        name="Kernels",
+        description="Backend of the fan component and bridging path loops",
+        items=(
+            ('auto', "Auto", "Numba when it is installed, NumPy otherwise"),
+            ('numpy', "NumPy", "Vectorized NumPy and plain Python"),
+            ('numba', "Numba", "Compiled Numba kernels, needs Numba installed"),
+        ),
+        default='auto',
+        update=lambda self, context: apply_kernels()
+    )
+
+    workers: bpy.props.IntProperty(
+        name="Workers",
+        description="Processes used for full detection passes, 0 uses every core, 1 runs serially",
+        default=0,
+        min=0
+    )
+
+    converge: bpy.props.BoolProperty(
+        name="Fix Until Converged",
+        description="Keep fixing the vertices around every relabel, cheapest path first, until none is non manifold",
+        default=False
+    )
+
+    fix_budget: bpy.props.IntProperty(
+        name="Budget",
+        description="Maximum number of vertex fixes when fixing until converged, 0 for automatic",
+        default=0,
+        min=0
+    )
+
+    use_cprofile: bpy.props.BoolProperty(
+        name="cProfile",
+        description="Record Python function stats of every run (slows the run down)",
+        default=False
+    )
+
+    use_tracemalloc: bpy.props.BoolProperty(
+        name="Peak Memory",
+        description="Trace Python allocations of every run to report the peak (slows the run down)",
+        default=False
+    )
+
 # Progress Bar
 # https://github.com/zachEastin/BlenderStuff/blob/main/progress_bar_example.py
 
 
+# Profile of the last run of each operator, newest last
+profiles = {}
+
+
+def new_profile(context, name):
+    props = context.scene.thesis_props
+    return Profile(name, cprofile=props.use_cprofile,
+                   memory=props.use_tracemalloc)
+
+
+def record_profile(idname, profile):
+    profiles.pop(idname, None)
+    profiles[idname] = profile.finish()
+
+
+@contextmanager
+def profiled(context, operator):
+    """Profile an operator run, kept in `profiles` once done"""
+    profile = new_profile(context, operator.bl_label)
+    with profile:
+        yield profile
+    record_profile(operator.bl_idname, profile)
+
+
+class ChunkedOperator:
+    """Operator doing its work in time-boxed steps
+
+    steps() is a generator doing the work and yielding the done fraction,
+    show() writes the partial result and finish() the final one. Invoked
+    from the UI the steps run from a timer: progress goes to the cursor and
+    the header, the partial result is shown every `stream_interval`
+    seconds and Esc stops early, keeping what is done. Only view navigation
+    reaches the viewport meanwhile. execute() runs every step in one go.
+    """
+
+    step_budget = 0.1
+    stream_interval = 1.0
+    navigation = {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE',
+                  'TRACKPADPAN', 'TRACKPADZOOM', 'MOUSEMOVE'}
+
+    def steps(self, context):
+        raise NotImplementedError
+
+    def show(self, context):
+        pass
+
+    def finish(self, context, cancelled=False):
+        self.show(context)
+
+    def begin(self, context):
+        self.profile = new_profile(context, self.bl_label)
+        self.start_time = time.time()
+        self.shown_time = self.start_time
+        self.progress = 0.0
+        self.work = self.steps(context)
+
+    def execute(self, context):
+        self.begin(context)
+        with self.profile:
+            for _ in self.work:
+                pass
+            self.finish(context)
+        record_profile(self.bl_idname, self.profile)
+
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.begin(context)
+        self.area = context.area
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            return self.stop(context, cancelled=True)
+        if event.type in self.navigation:
+            return {'PASS_THROUGH'}
+        if event.type != 'TIMER':
+            return {'RUNNING_MODAL'}
+
+        deadline = time.perf_counter() + self.step_budget
+        with self.profile:
+            try:
+                while time.perf_counter() < deadline:
+                    self.progress = next(self.work)
+            except StopIteration:
+                self.work = None
+            else:
+                if time.time() - self.shown_time > self.stream_interval:
+                    self.show(context)
+                    self.shown_time = time.time()
+
+        if self.work is None:
+            return self.stop(context)
+
+        context.window_manager.progress_update(int(self.progress * 100))
+        self.area.header_text_set(
+            f"{self.bl_label}: {self.progress:.0%} (Esc to stop)")
+
+        return {'RUNNING_MODAL'}
+
+    def stop(self, context, cancelled=False):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        self.area.header_text_set(None)
+
+        if self.work is not None:
+            self.work.close()
+        with self.profile:
+            self.finish(context, cancelled)
+        record_profile(self.bl_idname, self.profile)
+
+        return {'FINISHED'}
+
+
 class MESH_OT_add_test_mesh(bpy.types.Operator):
     """Add Test Mesh"""
     bl_idname = "mesh.add_test_mesh"
@@ -67,20 +894,12 @@ class MESH_OT_add_test_mesh(bpy.types.Operator):
         if not scene.user_of_id(coll):
             context.collection.children.link(coll)
 
-        # Load mesh
-        path = str(Path(__file__).parent / "mesh" / "bunny.obj")
+        # Load mesh, through its binary cache when it is up to date
+        path = Path(__file__).parent / "mesh" / "bunny.obj"
+        mesh = load_cached(path)
 
-        # Import obj
-        bpy.ops.wm.obj_import(filepath=str(Path(path)),
-                              import_vertex_groups=True)
-
-        # Assign obj to collection
-        objects = [
-            obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
-
-        for obj in objects:
-            coll.objects.link(obj)
-            bpy.context.scene.collection.objects.unlink(obj)
+        # Build the object straight into the collection
+        add_mesh_object(context, path.stem, mesh, coll)
 
         # Add colors materials
         colors = {
@@ -112,6 +931,41 @@ class MESH_OT_add_test_mesh(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class MESH_OT_import_labeled_obj(bpy.types.Operator, ImportHelper):
+    """Import a labeled OBJ (or .lmesh), usemtl runs as material indices"""
+    bl_idname = "mesh.import_labeled_obj"
+    bl_label = "Import Labeled OBJ"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filename_ext = ".obj"
+
+    filter_glob: bpy.props.StringProperty(
+        default="*.obj;*.lmesh",
+        options={'HIDDEN'}
+    )
+
+    def execute(self, context):
+
+        start_time = time.time()
+
+        path = Path(self.filepath)
+        with profiled(context, self):
+            with phase("read file"):
+                # An OBJ through its binary cache when it is up to date
+                mesh = load_mesh(path) if path.suffix == ".lmesh" else load_cached(path)
+            with phase("build mesh"):
+                add_mesh_object(context, path.stem, mesh)
+
+        self.report({'INFO'}, f"Imported {mesh.n_faces} faces: {time.time() - start_time} seconds")
+
+        return {'FINISHED'}
+
+
+def menu_import(self, context):
+    self.layout.operator(MESH_OT_import_labeled_obj.bl_idname,
+                         text="Labeled OBJ (.obj, .lmesh)")
+
+
 class MESH_OT_set_random_labels(bpy.types.Operator):
     """Set Random Material Index to each face of the mesh"""
     bl_idname = "mesh.set_random_labels"
@@ -128,24 +982,10 @@ class MESH_OT_set_random_labels(bpy.types.Operator):
 
         start_time = time.time()
 
-        bpy.ops.object.mode_set(mode="EDIT")
-        bpy.ops.mesh.select_mode(type="FACE")
-        me = context.edit_object.data
-
-        bm = bmesh.from_edit_mesh(me)
-
-        i = 1
-        for f in bm.faces:
-            f.calc_center_median()
-            f.material_index = i % 2
-            f.material_index = random.randrange(8)
-            i += 1
-
-        me.update()
+        with profiled(context, self):
+            n_objects = set_objects_labels(context, "random")
 
-        bpy.ops.object.mode_set(mode="OBJECT")
-
-        self.report({'INFO'}, f"Set: {time.time() - start_time} seconds")
+        self.report({'INFO'}, f"Set: {n_objects} objects, {time.time() - start_time} seconds")
         return {'FINISHED'}
 
 
@@ -165,48 +1005,55 @@ class MESH_OT_set_labels_origin(bpy.types.Operator):
 
         start_time = time.time()
 
-        obj = bpy.context.active_object
-
-        bpy.ops.object.mode_set(mode="EDIT")
-        bpy.ops.mesh.select_mode(type="FACE")
-        me = context.edit_object.data
-
-        bm = bmesh.from_edit_mesh(me)
+        # Octant of the world space face centers
+        with profiled(context, self):
+            n_objects = set_objects_labels(context, "octant", world=True)
 
-        for f in bm.faces:
-            x, y, z = obj.matrix_world @ f.calc_center_median()
+        self.report({'INFO'}, f"Set: {n_objects} objects, {time.time() - start_time} seconds")
 
-            label_x = 0
-            label_y = 0
-            label_z = 0
+        return {'FINISHED'}
 
-            if x > 0:
-                label_x += 1
-            if y > 0:
-                label_y += 10
-            if z > 0:
-                label_z += 100
-            s = label_x + label_y + label_z
-            s = str(s)
-            label = int(s, 2)
-            f.material_index = label
 
-        me.update()
-        bpy.ops.object.mode_set(mode="OBJECT")
+class MESH_OT_set_labels(bpy.types.Operator):
+    """Set Material Index of each face from a labeling scheme"""
+    bl_idname = "mesh.set_labels"
+    bl_label = "Set Labels (Scheme)"
+    bl_options = {'REGISTER', 'UNDO'}
 
-        self.report({'INFO'}, f"Set: {time.time() - start_time} seconds")
+    scheme: bpy.props.EnumProperty(
+        name="Scheme",
+        items=(
+            ('random', "Random", "Uniform random label per face"),
+            ('octant', "Octant", "Octant of the world space face center"),
+            ('slabs', "Slabs", "Equal width slabs along an axis"),
+            ('kmeans', "K-Means", "K-means clusters of the face centers"),
+            ('voronoi', "Voronoi", "Nearest of random seed faces"),
+        ),
+        default='kmeans'
+    )
 
-        return {'FINISHED'}
+    n_labels: bpy.props.IntProperty(
+        name="Labels",
+        description="Number of labels",
+        default=8,
+        min=1
+    )
 
+    seed: bpy.props.IntProperty(
+        name="Seed",
+        description="Random seed",
+        default=0,
+        min=0
+    )
 
-class MESH_OT_detect_non_manifold(bpy.types.Operator):
-    """Detect non manifold vertices"""
-    bl_idname = "mesh.detect_non_manifold"
-    bl_label = "Detect non manifold vertices"
-    bl_options = {'REGISTER', 'UNDO'}
+    axis: bpy.props.EnumProperty(
+        name="Axis",
+        description="Slab axis",
+        items=(('0', "X", ""), ('1', "Y", ""), ('2', "Z", "")),
+        default='2'
+    )
 
     # Allow program to select only when a vertex, edge ora face is selected in edit mode, otherwise deactivate panels buttons
-
     @classmethod
     def poll(cls, context):
         active_object = context.active_object
@@ -216,87 +1063,35 @@ class MESH_OT_detect_non_manifold(bpy.types.Operator):
 
         start_time = time.time()
 
-        view_layer_update = _BPyOpsSubModOp._view_layer_update
+        params = {}
+        if self.scheme != 'octant':
+            params["n_labels"] = self.n_labels
+        if self.scheme in {'random', 'kmeans', 'voronoi'}:
+            params["seed"] = self.seed
+        if self.scheme == 'slabs':
+            params["axis"] = int(self.axis)
 
-        try:
-            _BPyOpsSubModOp._view_layer_update = dummy_view_layer_update
-
-            # Get the active mesh
-            me = context.object.data
-
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bpy.ops.object.mode_set(mode="OBJECT")
+        with profiled(context, self):
+            n_objects = set_objects_labels(context, self.scheme, world=True,
+                                           **params)
 
-            # Get a BMesh representation
-            bm = bmesh.new()   # create an empty BMesh
-            bm.from_mesh(me)   # fill it in from a Mesh
-
-            # Modify the BMesh, can do anything here...
-            bm.verts.ensure_lookup_table()
-
-            # Do breadth first search around each vertex
-            for v in bm.verts:
-                comps = []
-
-                poly_fan = bm.verts[v.index].link_faces
-                labels = {}
-                for poly in poly_fan:
-                    if poly.material_index not in labels:
-                        labels[poly.material_index] = 1
-                    else:
-                        labels[poly.material_index] += 1
-
-                if len(labels) > 1:  # vertex has only 1 label polys -> MANIFOLD 100%
-                    for p in poly_fan:
-                        flag = False
-                        for c in comps:
-                            if p in c:
-                                flag = True
-                        if not flag:
-                            visited = []
-                            queue = [p]
-
-                            while queue:  # select adj faces
-                                node = queue.pop(0)
-                                label = node.material_index
-                                if node not in visited:
-                                    visited.append(node)
-                                    neighbours = []
-                                    for e in node.edges:
-                                        for f in e.link_faces:
-                                            if f in poly_fan and f.material_index == label and f not in neighbours and f not in visited:
-                                                neighbours.append(f)
-                                        for neighbour in neighbours:
-                                            queue.append(neighbour)
-
-                            comps.append(visited)
-
-                    if len(labels) < len(comps):
-                        bm.verts[v.index].select = True
-
-            # Update mesh
-            me.update()
-            bm.to_mesh(me)
-            bm.free()
-
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_mode(type="VERT")
-
-        finally:
-            _BPyOpsSubModOp._view_layer_update = view_layer_update
-
-        self.report({'INFO'}, f"Detect: {time.time() - start_time} seconds")
+        self.report({'INFO'}, f"Set: {n_objects} objects, {time.time() - start_time} seconds")
 
         return {'FINISHED'}
 
 
-class MESH_OT_cut_edge_star(bpy.types.Operator):
-    """Cut edges around selected vertices"""
-    bl_idname = "mesh.cut_edge_star"
-    bl_label = "Cut Edge-Star around vertex"
+class MESH_OT_detect_non_manifold(ChunkedOperator, bpy.types.Operator):
+    """Detect non manifold vertices"""
+    bl_idname = "mesh.detect_non_manifold"
+    bl_label = "Detect non manifold vertices"
     bl_options = {'REGISTER', 'UNDO'}
 
+    mask = None
+    selected = None
+    n_objects = 0
+    found = 0
+    region = None
+
     # Allow program to select only when a vertex, edge ora face is selected in edit mode, otherwise deactivate panels buttons
 
     @classmethod
@@ -304,234 +1099,299 @@ class MESH_OT_cut_edge_star(bpy.types.Operator):
         active_object = context.active_object
         return active_object is not None and active_object.type == 'MESH' and (context.mode == 'EDIT_MESH' or active_object.select_get()) and context.area.type == "VIEW_3D"
 
-    def execute(self, context):
-
-        view_layer_update = _BPyOpsSubModOp._view_layer_update
-
-        try:
-            _BPyOpsSubModOp._view_layer_update = dummy_view_layer_update
-            # Get bool from panel
-            cut_and_triangulate = bpy.context.scene.thesis_props.triangulate
-
-            start_time = time.time()
-
-            # Get the active mesh
-            me = context.object.data
-
-            bpy.ops.object.mode_set(mode="EDIT")  # Activating Edit mode
-            bpy.ops.object.mode_set(mode="OBJECT")  # Going back to Object mode
-
-            # Get a BMesh representation
-            bm = bmesh.new()   # create an empty BMesh
-            bm.from_mesh(me)   # fill it in from a Mesh
-
-            # Modify the BMesh, can do anything here...
-            bm.verts.ensure_lookup_table()
-            bm.edges.ensure_lookup_table()
-            bm.faces.ensure_lookup_table()
-
-            # Get Selected Vertices
-            selected_vertices = [v for v in bm.verts if v.select == True]
-
-            # Retrieve the edges index from the selected vertices
-            edge_indices = {
-                e for v in selected_vertices for e in bm.verts[v.index].link_edges}
-
-            # Cut each edge aound the selected vertices
-            bmesh.ops.subdivide_edges(
-                bm,
-                edges=list(edge_indices),
-                cuts=1,
-                use_grid_fill=True,
-            )
-
-            # Tirangulate the mesh
-            if cut_and_triangulate:
-                bmesh.ops.triangulate(bm, faces=bm.faces[:])
-
-            # selected_vertices = [v for v in bm.verts if v.select == True]
-
-            bm.to_mesh(me)
-            me.update()
-            bm.free()
-
-            bpy.ops.object.mode_set(mode="EDIT")
+    def steps(self, context):
+
+        props = context.scene.thesis_props
+        objects = mesh_objects(context)
+        self.n_objects = len(objects)
+        self.found = 0
+        if props.roi != 'NONE':
+            yield from self.detect_regions(context, objects)
+            return
+        if len(objects) > 1:
+            yield from self.detect_objects(context, objects)
+            return
+
+        # Get the active mesh
+        self.obj = obj = objects[0]
+        me = obj.data
+
+        # Run the vectorized detection on the mesh arrays
+        mesh = read_mesh(obj)
+        self.mask = np.zeros(mesh.n_verts, dtype=bool)
+
+        state = None
+        if props.incremental:
+            with phase("topology cache"):
+                state = topology_cache.lookup(me.as_pointer(), mesh)
+        if state is not None:
+            self.mask = state.mask
+            return
+
+        if worker_count(props.workers) > 1 and mesh.n_verts >= MIN_PARALLEL_VERTS:
+            # One step, the process pool does not report progress
+            components = label_components(mesh, props.workers)
+            self.mask = components.non_manifold()
+        else:
+            for components, self.mask, done in iter_non_manifold(mesh):
+                yield done / max(mesh.n_verts, 1)
+
+        if props.incremental:
+            topology_cache.store(me.as_pointer(), mesh,
+                                 DetectionState(mesh, components=components))
+
+    def detect_regions(self, context, objects):
+        """Detect inside the region of interest of every object
+
+        The fan components are built on the faces around the region only
+        and only the selection inside the region is written. The mesh is
+        still read whole and the region found with passes over all of it
+        (the ring growing, the frustum test, the vertex digest of the
+        KD-tree cache), so the saving is in the component search.
+        """
+        self.region = 0
+        for done, obj in enumerate(objects, 1):
+            mesh = read_mesh(obj)
+            selected = read_selection(obj.data)
+            with phase("region"):
+                roi = region_mask(context, obj, mesh, selected)
+            mask = detect_non_manifold_roi(mesh, roi)
+            select_region(obj, mask, roi, selected)
+
+            self.region += int(np.count_nonzero(roi))
+            self.found += int(np.count_nonzero(mask))
+            yield done / len(objects)
+
+    def detect_objects(self, context, objects):
+        """Detect on every mesh at once, selections written as they finish"""
+        meshes = [read_mesh(obj) for obj in objects]
+        if context.mode == 'EDIT_MESH':
+            # One deselect for every object in Edit mode
             bpy.ops.mesh.select_all(action='DESELECT')
-            bpy.ops.object.mode_set(mode="OBJECT")
-
-            # Get a BMesh representation
-            bm = bmesh.new()   # create an empty BMesh
-            bm.from_mesh(me)   # fill it in from a Mesh
 
-            # Modify the BMesh, can do anything here...
-            bm.verts.ensure_lookup_table()
+        results = iter_map_meshes("detect", meshes,
+                                  workers=context.scene.thesis_props.workers)
+        for done, (i, mask) in enumerate(results, 1):
+            select_vertices(objects[i], mask, np.zeros(len(mask), dtype=bool))
+            self.found += int(np.count_nonzero(mask))
+            yield done / len(objects)
 
-            for v in bm.verts:
-                comps = []
-
-                poly_fan = bm.verts[v.index].link_faces
-                labels = {}
-                for poly in poly_fan:
-                    if poly.material_index not in labels:
-                        labels[poly.material_index] = 1
-                    else:
-                        labels[poly.material_index] += 1
-
-                if len(labels) > 1:  # vertex has only 1 label polys -> MANIFOLD 100%
-                    for p in poly_fan:
-                        flag = False
-                        for c in comps:
-                            if p in c:
-                                flag = True
-                        if not flag:
-                            visited = []
-                            queue = [p]
-
-                            while queue:  # select adj faces
-                                node = queue.pop(0)
-                                label = node.material_index
-                                if node not in visited:
-                                    visited.append(node)
-                                    neighbours = []
-                                    for e in node.edges:
-                                        for f in e.link_faces:
-                                            if f in poly_fan and f.material_index == label and f not in neighbours and f not in visited:
-                                                neighbours.append(f)
-                                        for neighbour in neighbours:
-                                            queue.append(neighbour)
-
-                            comps.append(visited)
-
-                    if len(labels) < len(comps):
-                        bm.verts[v.index].select = True
+    def show(self, context):
+        if self.mask is None:
+            return
 
-            me.update()
-            bm.to_mesh(me)
-            bm.free()
+        # Write the selection back, the mask only grows during a run
+        select_vertices(self.obj, self.mask, self.selected)
+        self.selected = self.mask.copy()
 
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_mode(type="VERT")
+    def finish(self, context, cancelled=False):
+        self.show(context)
+        if self.mask is not None:
+            self.found = int(np.count_nonzero(self.mask))
+        vertex_select_mode(context)
+        region = "" if self.region is None else f" in {self.region} region vertices"
+        self.report({'INFO'}, f"Detect: {self.found} non manifold vertices{region} on {self.n_objects} objects, {time.time() - self.start_time} seconds"
+                    + (" (stopped)" if cancelled else ""))
 
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_mode(type="VERT")
 
-        finally:
-            _BPyOpsSubModOp._view_layer_update = view_layer_update
+class MESH_OT_cut_edge_star(ChunkedOperator, bpy.types.Operator):
+    """Cut edges around selected vertices"""
+    bl_idname = "mesh.cut_edge_star"
+    bl_label = "Cut Edge-Star around vertex"
+    bl_options = {'REGISTER', 'UNDO'}
 
-        self.report({'INFO'}, f"Cut: {time.time() - start_time }seconds")
+    n_objects = 0
 
-        return {'FINISHED'}
+    # Allow program to select only when a vertex, edge ora face is selected in edit mode, otherwise deactivate panels buttons
 
+    @classmethod
+    def poll(cls, context):
+        active_object = context.active_object
+        return active_object is not None and active_object.type == 'MESH' and (context.mode == 'EDIT_MESH' or active_object.select_get()) and context.area.type == "VIEW_3D"
 
-class MESH_OT_fix_non_manifold(bpy.types.Operator):
+    def steps(self, context):
+
+        # Get bool from panel
+        cut_and_triangulate = bpy.context.scene.thesis_props.triangulate
+
+        # One object after the other, each written back once cut
+        objects = mesh_objects(context)
+        self.n_objects = len(objects)
+        for n, obj in enumerate(objects):
+            for done in self.cut_object(obj, cut_and_triangulate):
+                yield (n + done) / len(objects)
+
+    def cut_object(self, obj, cut_and_triangulate):
+        """Cut around the selected vertices of one object, yields progress
+
+        The core cut (the one of the batch tool) runs on the mesh arrays and
+        its result replaces the geometry of the object.
+        """
+        me = obj.data
+        mesh = read_mesh(obj)
+        selected = read_selection(me)
+        yield 0.1
+
+        with phase("cut"):
+            result, faces = cut_edge_star(mesh, selected, cut_and_triangulate,
+                                          return_faces=True)
+        yield 0.5
+
+        # Re-detect on the modified edge-stars, the vertices of the cut faces
+        region = np.zeros(result.n_verts, dtype=bool)
+        region[result.face_verts[csr_ranges(result.face_offsets, faces)]] = True
+        with phase("re-detect"):
+            mask = detect_non_manifold_roi(result, region)
+        selection = np.zeros(result.n_verts, dtype=bool)
+        selection[:mesh.n_verts] = selected
+        selection[region] = mask[region]
+        yield 0.75
+
+        # Cut faces keep their index and new ones are appended, the
+        # cached topology is carried over from these
+        topology_cache.edit(me.as_pointer(), faces)
+        write_geometry(obj, result, selection)
+        yield 1.0
+
+    def finish(self, context, cancelled=False):
+        vertex_select_mode(context)
+
+        self.report({'INFO'}, f"Cut: {self.n_objects} objects, {time.time() - self.start_time} seconds"
+                    + (" (stopped)" if cancelled else ""))
+
+
+class MESH_OT_fix_non_manifold(ChunkedOperator, bpy.types.Operator):
     """Fix non manifold vertices"""
     bl_idname = "mesh.fix_non_manifold"
     bl_label = "Fix non manifold vertices"
     bl_options = {'REGISTER', 'UNDO'}
 
+    labels = None
+    n_objects = 0
+    relabeled = 0
+    convergence = None
+
     # Allow program to select only when a vertex, edge ora face is selected in edit mode, otherwise deactivate panels buttons
+
     @classmethod
     def poll(cls, context):
         active_object = context.active_object
         return active_object is not None and active_object.type == 'MESH' and (context.mode == 'EDIT_MESH' or active_object.select_get()) and context.area.type == "VIEW_3D"
 
-    def execute(self, context):
-
-        # start time counter
-        start_time = time.time()
-
-        view_layer_update = _BPyOpsSubModOp._view_layer_update
-
-        try:
-            _BPyOpsSubModOp._view_layer_update = dummy_view_layer_update
-
-            # Set mesh in edit vertex mode
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_mode(type="VERT")
-
-            # get edit object data
-            me = context.edit_object.data
-
-            # create BMesh data for editing
-            bm = bmesh.from_edit_mesh(me)
-
-            # Ensure vertices and faces lists exists
-            bm.verts.ensure_lookup_table()
-            bm.faces.ensure_lookup_table()
-
-            selected_vertices = [v for v in bm.verts if v.select == True]
-
-            bpy.ops.mesh.select_mode(type="FACE")
-
-            for v in selected_vertices:
-                comps = []
-                bpy.ops.mesh.select_all(action='DESELECT')
-
-                poly_fan = bm.verts[v.index].link_faces
-
-                for p in poly_fan:
-                    already_checked = False
-                    for c in comps:
-                        if p in c:
-                            already_checked = True
-                    if not already_checked:
-                        visited = []
-                        queue = [p]
-
-                        while queue:
-                            node = queue.pop(0)
-                            label = node.material_index
-                            if node not in visited:
-                                visited.append(node)
-                                neighbours = []
-                                for e in node.edges:
-                                    for f in e.link_faces:
-                                        if f in poly_fan and f.material_index == label and f not in neighbours and f not in visited:
-                                            neighbours.append(f)
-                                    for neighbour in neighbours:
-                                        queue.append(neighbour)
-                        comps.append(visited)
-
-                labels = {}
-                for c in comps:
-                    if bm.faces[c[0].index].material_index not in labels:
-                        labels[bm.faces[c[0].index].material_index] = 1
-                    else:
-                        labels[bm.faces[c[0].index].material_index] += 1
-
-                if len(labels) < len(comps):
-
-                    bm.verts[v.index].select = True
-                    most_labels = max(
-                        labels.items(), key=operator.itemgetter(1))[0]
-
-                    for c in comps:
-                        if bm.faces[c[0].index].material_index == most_labels:
-                            bm.faces[c[0].index].select = True
-
-                    # before_selection = {f for f in bm.faces if f.select}
-
-                    bpy.ops.mesh.shortest_path_select(
-                        use_topology_distance=True)
-
-                    after_selection = {f for f in bm.faces if f.select}
-
-                    # shortest_path_faces = after_selection.difference(before_selection)
-
-                    for f in after_selection:
-                        bm.faces[f.index].material_index = most_labels
+    def steps(self, context):
+
+        props = context.scene.thesis_props
+        objects = mesh_objects(context)
+        self.n_objects = len(objects)
+        self.relabeled = 0
+        self.convergence = None
+        if len(objects) > 1:
+            yield from self.fix_objects(context, objects)
+            return
+
+        # get object data
+        self.obj = obj = objects[0]
+        me = obj.data
+
+        mesh = read_mesh(obj)
+        vertices = np.flatnonzero(read_selection(me))
+
+        # Cached topology and components, kept in sync with the fix
+        with phase("topology cache"):
+            self.state = state = detection_state(me, mesh, props.workers)
+        self.before = state.mesh.labels.copy()
+        self.written = self.before.copy()
+
+        if props.converge:
+            # Worklist of the selected vertices and those around each
+            # relabel, cheapest path first
+            for self.labels, self.convergence in iter_converge_non_manifold(
+                    state.mesh, vertices, state.components,
+                    budget=props.fix_budget or None):
+                yield self.convergence.iterations / max(self.convergence.budget, 1)
+            return
+
+        # Relabel the shortest face paths around the selected vertices,
+        # searched inside each fan, then write all labels in one batch
+        for self.labels, done in iter_fix_non_manifold(
+                state.mesh, vertices, state.components):
+            yield done / max(len(vertices), 1)
+
+    def fix_objects(self, context, objects):
+        """Fix every mesh at once, labels written as they finish"""
+        props = context.scene.thesis_props
+        meshes = [read_mesh(obj) for obj in objects]
+        vertices = [np.flatnonzero(read_selection(obj.data)) for obj in objects]
+        todo = [i for i, v in enumerate(vertices) if len(v)]
+        if props.converge:
+            self.convergence = Convergence(0)
+
+        results = iter_map_meshes(
+            "fix", [meshes[i] for i in todo],
+            [(vertices[i],) for i in todo],
+            {"converge": props.converge, "budget": props.fix_budget or None},
+            props.workers)
+        for done, (k, (labels, convergence)) in enumerate(results, 1):
+            i = todo[k]
+            write_labels(objects[i], labels, meshes[i].labels)
+            self.relabeled += int(np.count_nonzero(labels != meshes[i].labels))
+            if convergence is not None:
+                self.convergence.add(convergence)
+            yield done / len(todo)
+
+    def show(self, context):
+        if self.labels is None:
+            return
+
+        write_labels(self.obj, self.labels, self.written)
+        self.written[:] = self.labels
+
+    def finish(self, context, cancelled=False):
+        if self.labels is not None:
+            changed = np.flatnonzero(self.labels != self.before)
+            self.relabeled = len(changed)
+            self.state.mark_faces(changed)
+            self.state.refresh()
+
+            self.show(context)
+
+        converged = ""
+        if self.convergence is not None:
+            c = self.convergence
+            converged = (f", {c.iterations} iterations, {c.relabeled} relabels, "
+                         f"{c.pending} pending, {c.dropped} dropped")
+
+        self.report(
+            {'INFO'}, f"Fix: {self.relabeled} faces relabeled on {self.n_objects} objects{converged}, {time.time() - self.start_time} seconds"
+            + (" (stopped)" if cancelled else ""))
+
+
+class MESH_OT_export_profile(bpy.types.Operator, ExportHelper):
+    """Export the profiles of the last operator runs as JSON"""
+    bl_idname = "mesh.export_thesis_profile"
+    bl_label = "Export Profile"
+
+    filename_ext = ".json"
+
+    filter_glob: bpy.props.StringProperty(
+        default="*.json",
+        options={'HIDDEN'}
+    )
 
-            me.update()
-            bm.free()
+    @classmethod
+    def poll(cls, context):
+        return bool(profiles)
 
-            bpy.ops.object.mode_set(mode="OBJECT")
-            me.update()
-            bpy.ops.object.mode_set(mode="EDIT")
+    def execute(self, context):
 
-        finally:
-            _BPyOpsSubModOp._view_layer_update = view_layer_update
+        report = {
+            "blender": bpy.app.version_string,
+            "profiles": [profile.as_dict() for profile in profiles.values()],
+        }
+        with open(self.filepath, "w") as f:
+            json.dump(report, f, indent=2)
 
-        self.report({'INFO'}, f"Fix: {time.time() - start_time} seconds")
+        self.report({'INFO'}, f"Profile exported to {self.filepath}")
 
         return {'FINISHED'}
 
@@ -554,6 +1414,11 @@ class VIEW3D_PT_thesis(bpy.types.Panel):
             text="Test Bunny",
             icon="PROP_OFF",
         )
+        box.operator(
+            'mesh.import_labeled_obj',
+            text="Import Labeled OBJ",
+            icon="IMPORT",
+        )
 
         box = layout.box()
         box.label(text="Set Colors")
@@ -569,6 +1434,10 @@ class VIEW3D_PT_thesis(bpy.types.Panel):
             icon="PROP_OFF",
         )
 
+        row = box.row(align=True)
+        for scheme, text in (('slabs', "Slabs"), ('kmeans', "K-Means"), ('voronoi', "Voronoi")):
+            row.operator('mesh.set_labels', text=text).scheme = scheme
+
         box = layout.box()
         box.label(text="Fix")
         box.operator(
@@ -576,6 +1445,17 @@ class VIEW3D_PT_thesis(bpy.types.Panel):
             text="Detect non manifold vertices",
             icon="PROP_OFF",
         )
+        box.prop(scene.thesis_props, "roi")
+        if scene.thesis_props.roi == 'SELECTION':
+            box.prop(scene.thesis_props, "roi_rings")
+        elif scene.thesis_props.roi in {'BOX', 'SPHERE'}:
+            box.prop(scene.thesis_props, "roi_size")
+        box.prop(scene.thesis_props, "live_overlay")
+        box.prop(scene.thesis_props, "incremental")
+        box.prop(scene.thesis_props, "workers")
+        box.prop(scene.thesis_props, "kernels")
+        if scene.thesis_props.kernels == 'numba' and not kernels.available():
+            box.label(text="Numba is not installed, using NumPy", icon='ERROR')
 
         box.operator(
             'mesh.cut_edge_star',
@@ -589,6 +1469,26 @@ class VIEW3D_PT_thesis(bpy.types.Panel):
             text="Fix non manifold vertices",
             icon="PROP_OFF",
         )
+        row = box.row(align=True)
+        row.prop(scene.thesis_props, "converge")
+        sub = row.row(align=True)
+        sub.active = scene.thesis_props.converge
+        sub.prop(scene.thesis_props, "fix_budget")
+
+        box = layout.box()
+        box.label(text="Profile")
+        row = box.row(align=True)
+        row.prop(scene.thesis_props, "use_cprofile")
+        row.prop(scene.thesis_props, "use_tracemalloc")
+        if profiles:
+            col = box.column(align=True)
+            for line in next(reversed(profiles.values())).lines()[:12]:
+                col.label(text=line)
+        box.operator(
+            'mesh.export_thesis_profile',
+            text="Export Profile",
+            icon="EXPORT",
+        )
 
         """ self.layout.operator(
             'mesh.select_star_fan',
@@ -605,11 +1505,14 @@ class VIEW3D_PT_thesis(bpy.types.Panel):
 bl_classes = (
     MESH_OT_Thesis_Props,
     MESH_OT_add_test_mesh,
+    MESH_OT_import_labeled_obj,
     MESH_OT_set_random_labels,
     MESH_OT_set_labels_origin,
+    MESH_OT_set_labels,
     MESH_OT_detect_non_manifold,
     MESH_OT_cut_edge_star,
     MESH_OT_fix_non_manifold,
+    MESH_OT_export_profile,
     VIEW3D_PT_thesis,
 )
 
@@ -619,9 +1522,24 @@ def register():
         bpy.utils.register_class(bl_class)
     bpy.types.Scene.thesis_props = bpy.props.PointerProperty(
         type=MESH_OT_Thesis_Props)
+    bpy.types.TOPBAR_MT_file_import.append(menu_import)
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_topology)
+    bpy.app.handlers.depsgraph_update_post.append(update_live_overlay)
+    bpy.app.handlers.load_post.append(clear_topology)
+    bpy.app.handlers.load_post.append(apply_kernels)
+    warm_up_kernels()
 
 
 def unregister():
+    bpy.types.TOPBAR_MT_file_import.remove(menu_import)
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_topology)
+    bpy.app.handlers.depsgraph_update_post.remove(update_live_overlay)
+    bpy.app.handlers.load_post.remove(clear_topology)
+    bpy.app.handlers.load_post.remove(apply_kernels)
+    live_overlay.stop()
+    topology_cache.clear()
+    spatial_indices.clear()
+    profiles.clear()
     for bl_class in bl_classes:
         bpy.utils.unregister_class(bl_class)
     del bpy.types.Scene.thesis_props
@@ -0,0 +1,18 @@
+"""Batch entry point for Blender's bundled Python
+
+    blender -b --python thesis_batch.py -- meshes/ --op fix --output-dir fixed
+
+Takes the arguments of ``python -m thesis_core.batch`` after ``--``.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from thesis_core.batch import main  # noqa: E402
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    sys.exit(main(argv))
@@ -0,0 +1,42 @@
+"""Thesis algorithm core on plain arrays, usable without Blender
+
+Import it as ``thesis_core`` with the addon directory on ``sys.path``:
+
+    from thesis_core import load_obj, detect_non_manifold
+
+    mesh = load_obj("mesh/bunny.obj")
+    mask = detect_non_manifold(mesh)
+"""
+
+from .mesh import LabeledMesh, load_obj, save_obj
+from .cache import load_cached, load_mesh, save_mesh
+from .topology import (
+    Topology,
+    connected_components,
+    face_adjacency,
+    face_face_csr,
+    vertex_face_csr,
+)
+from .components import LabelComponents
+from .detect import detect_non_manifold, iter_non_manifold
+from .cut import cut_edge_star, triangulate_faces
+from .fix import (
+    Convergence,
+    converge_non_manifold,
+    fix_non_manifold,
+    iter_converge_non_manifold,
+    iter_fix_non_manifold,
+)
+from .instrument import Profile
+from .incremental import DetectionState, TopologyCache
+from .labels import SCHEMES, face_centroids, label_faces
+from .parallel import detect_non_manifold_parallel, label_components
+from .regions import (
+    Submesh,
+    boundary_bands,
+    boundary_mask,
+    detect_non_manifold_bands,
+    label_submeshes,
+)
+from .roi import detect_non_manifold_roi
+from .volume import TetMesh, detect_non_manifold_volume, load_tet_mesh
@@ -0,0 +1,312 @@
+"""Detect, cut or fix non manifold vertices over many labeled meshes
+
+Run from the addon directory, or through Blender's Python:
+
+    python -m thesis_core.batch meshes/ --op fix --output-dir fixed
+    blender -b --python thesis_batch.py -- meshes/ --op fix --output-dir fixed
+
+Inputs are OBJ files, .lmesh caches or directories holding them. Every mesh
+is one task of a process pool (--workers). The operations run in the order
+given, each one followed by a fresh detection; cut, fix and converge (fix
+until no non manifold vertex is left, or the budget is spent) write the
+repaired mesh to --output-dir. The JSON report (--report) holds the counts
+and phase timings of every file and the totals.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from .cache import SUFFIX, load_mesh, save_mesh
+from .cut import cut_edge_star
+from .detect import detect_non_manifold
+from .fix import converge_non_manifold, fix_non_manifold
+from .instrument import Profile
+from .kernels import BACKENDS, backend, set_backend
+from .mesh import load_obj, save_obj
+from .parallel import worker_count, worker_module
+
+
+OPS = ("detect", "cut", "fix", "converge")
+FORMATS = ("obj", "lmesh")
+
+
+def find_meshes(inputs):
+    """(path, name) of the OBJ and .lmesh files of the given files and
+    directories
+
+    `name` is the path relative to the directory it was found in (the file
+    name for files given directly), under which the result is written. A
+    .lmesh cache next to one of the OBJ files is the same mesh and skipped.
+    """
+    found = []
+    for item in map(Path, inputs):
+        if item.is_dir():
+            found.extend((p, p.relative_to(item))
+                         for p in sorted(item.rglob("*"))
+                         if p.suffix in (".obj", SUFFIX))
+        else:
+            found.append((item, Path(item.name)))
+
+    sources = {p.resolve() for p, _ in found if p.suffix == ".obj"}
+    seen = set()
+    meshes = []
+    for path, name in found:
+        key = path.resolve()
+        if key in seen or (path.suffix == SUFFIX
+                           and key.with_suffix(".obj") in sources):
+            continue
+        seen.add(key)
+        meshes.append((path, name))
+    return meshes
+
+
+def load(path):
+    path = Path(path)
+    return load_mesh(path) if path.suffix == SUFFIX else load_obj(path)
+
+
+def output_path(name, output_dir, fmt):
+    """Where the result of a mesh found as `name` is written"""
+    suffix = SUFFIX if fmt == "lmesh" else ".obj"
+    return Path(output_dir) / Path(name).with_suffix(suffix)
+
+
+def process_file(path, ops, output_dir=None, fmt="obj", triangulate=False,
+                 rings=2, profile=False, name=None):
+    """Worker: run the operations on one mesh, returns its report entry
+
+    The result is written to `name` (the file name by default) under
+    output_dir. With `profile`, the core phase timings and counters are
+    added too.
+    """
+    name = name if name is not None else Path(path).name
+    if not profile:
+        return _process_file(path, ops, output_dir, fmt, triangulate, rings,
+                             name)
+
+    with Profile(str(path)) as prof:
+        record = _process_file(path, ops, output_dir, fmt, triangulate, rings,
+                               name)
+    record["profile"] = {"phases": prof.phases, "counts": prof.counts}
+    return record
+
+
+def _process_file(path, ops, output_dir, fmt, triangulate, rings, name):
+    record = {"file": str(path), "ops": list(ops)}
+    timings = record["seconds"] = {}
+    start = time.perf_counter()
+
+    try:
+        tick = time.perf_counter()
+        mesh = load(path)
+        timings["load"] = time.perf_counter() - tick
+        record["verts"] = mesh.n_verts
+        record["faces"] = mesh.n_faces
+
+        tick = time.perf_counter()
+        mask = detect_non_manifold(mesh)
+        timings["detect"] = time.perf_counter() - tick
+        record["non_manifold"] = int(mask.sum())
+
+        for op in ops:
+            tick = time.perf_counter()
+            if op == "cut":
+                mesh = cut_edge_star(mesh, np.flatnonzero(mask), triangulate)
+            elif op == "fix":
+                labels = fix_non_manifold(mesh, np.flatnonzero(mask),
+                                          rings=rings)
+                record["relabeled"] = (record.get("relabeled", 0)
+                                       + int(np.count_nonzero(
+                                           labels != mesh.labels)))
+                mesh.labels = labels
+            elif op == "converge":
+                labels, state = converge_non_manifold(
+                    mesh, np.flatnonzero(mask), rings=rings)
+                record["relabeled"] = (record.get("relabeled", 0)
+                                       + int(np.count_nonzero(
+                                           labels != mesh.labels)))
+                record["iterations"] = (record.get("iterations", 0)
+                                        + state.iterations)
+                mesh.labels = labels
+            elif op != "detect":
+                raise ValueError(f"Unknown operation {op!r}")
+            if op != "detect":
+                mask = detect_non_manifold(mesh)
+            timings[op] = timings.get(op, 0.0) + time.perf_counter() - tick
+
+        record["remaining"] = int(mask.sum())
+        record["verts_out"] = mesh.n_verts
+        record["faces_out"] = mesh.n_faces
+
+        if output_dir is not None and set(ops) - {"detect"}:
+            tick = time.perf_counter()
+            target = output_path(name, output_dir, fmt)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if fmt == "lmesh":
+                save_mesh(mesh, target)
+            else:
+                save_obj(mesh, target)
+            timings["save"] = time.perf_counter() - tick
+            record["output"] = str(target)
+
+    except Exception as error:
+        record["error"] = f"{type(error).__name__}: {error}"
+
+    record["total"] = time.perf_counter() - start
+    return record
+
+
+def run_batch(paths, ops, output_dir=None, workers=None, fmt="obj",
+              triangulate=False, rings=2, profile=False, log=None,
+              names=None):
+    """Report entries of every mesh, in input order
+
+    `names` are the output names of the meshes under output_dir (see
+    find_meshes), their file names by default; two meshes written to the
+    same output raise ValueError before anything runs. Meshes go through a
+    process pool of `workers` processes, one mesh per task; one worker, one
+    mesh or no usable pool runs them serially.
+    """
+    paths = [str(p) for p in paths]
+    names = [Path(n) for n in names] if names is not None else [
+        Path(p).name for p in paths]
+    if output_dir is not None and set(ops) - {"detect"}:
+        targets = {}
+        for path, name in zip(paths, names):
+            target = output_path(name, output_dir, fmt)
+            if target in targets:
+                raise ValueError(f"{targets[target]} and {path} would both "
+                                 f"be written to {target}")
+            targets[target] = path
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    args = (ops, output_dir, fmt, triangulate, rings, profile)
+    workers = min(worker_count(workers), max(len(paths), 1))
+
+    records = {}
+
+    def done(record):
+        records[record["file"]] = record
+        if log:
+            log(summary(record))
+
+    if workers > 1:
+        task = worker_module("batch").process_file
+        try:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=get_context("spawn")) as pool:
+                futures = [pool.submit(task, path, *args, name)
+                           for path, name in zip(paths, names)]
+                for future in as_completed(futures):
+                    done(future.result())
+        except (OSError, BrokenProcessPool):
+            pass
+
+    for path, name in zip(paths, names):
+        if path not in records:
+            done(process_file(path, *args, name))
+
+    return [records[path] for path in paths]
+
+
+def summary(record):
+    if "error" in record:
+        return f"{record['file']}: {record['error']}"
+    text = (f"{record['file']}: {record['faces']} faces, "
+            f"{record['non_manifold']} non manifold")
+    if record["ops"] != ["detect"]:
+        text += f" -> {record['remaining']}"
+    return text + f", {record['total']:.2f}s"
+
+
+def totals(records):
+    ok = [r for r in records if "error" not in r]
+    return {
+        "files": len(records),
+        "failed": len(records) - len(ok),
+        "faces": sum(r["faces"] for r in ok),
+        "non_manifold": sum(r["non_manifold"] for r in ok),
+        "remaining": sum(r["remaining"] for r in ok),
+        "relabeled": sum(r.get("relabeled", 0) for r in ok),
+        "seconds": sum(r["total"] for r in records),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m thesis_core.batch",
+        description="Batch non manifold vertex detection, cut and fix")
+    parser.add_argument("inputs", nargs="+",
+                        help="OBJ / .lmesh files or directories")
+    parser.add_argument("--op", action="append", choices=OPS,
+                        help="operation, repeatable and run in order "
+                             "(default detect)")
+    parser.add_argument("--output-dir", help="where repaired meshes go")
+    parser.add_argument("--format", choices=FORMATS, default="obj",
+                        help="format of the repaired meshes")
+    parser.add_argument("--report", help="write the JSON report here")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="meshes processed at once, 0 for every core")
+    parser.add_argument("--triangulate", action="store_true",
+                        help="triangulate the faces made by cut")
+    parser.add_argument("--rings", type=int, default=2,
+                        help="fan rings searched by fix")
+    parser.add_argument("--kernels", choices=BACKENDS, default="auto",
+                        help="fan component and path search loops: Numba "
+                             "when installed (auto), NumPy or Numba")
+    parser.add_argument("--profile", action="store_true",
+                        help="add core phase timings and counters per file")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    ops = args.op or ["detect"]
+    set_backend(args.kernels)
+    meshes = find_meshes(args.inputs)
+    start = time.perf_counter()
+
+    try:
+        records = run_batch([p for p, _ in meshes], ops, args.output_dir,
+                            args.workers, args.format, args.triangulate,
+                            args.rings, args.profile,
+                            None if args.quiet else print,
+                            [n for _, n in meshes])
+    except ValueError as error:
+        parser.error(str(error))
+
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "ops": ops,
+            "kernels": backend(),
+            "workers": worker_count(args.workers),
+            "wall_seconds": time.perf_counter() - start,
+        },
+        "totals": totals(records),
+        "files": records,
+    }
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    t = report["totals"]
+    print(f"{t['files']} meshes ({t['failed']} failed), "
+          f"{t['non_manifold']} non manifold -> {t['remaining']}, "
+          f"{report['meta']['wall_seconds']:.2f} seconds")
+    return 1 if t["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""Benchmark detection, cut and fix on labeled test meshes
+
+Run from the addon directory:
+
+    python -m thesis_core.bench --suite small --output bench.json
+    python -m thesis_core.bench --suite small --baseline bench.json
+
+Every (mesh, labeling, phase) is timed separately, best of --repeat runs,
+and its peak traced memory is recorded in a separate run. With --baseline
+the results are compared against a stored run and the exit status is 1 when
+a phase got slower (or hungrier) than the allowed --threshold. A slowdown
+must also exceed --min-seconds, so millisecond phases do not fail on noise.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from .cut import cut_edge_star
+from .detect import detect_non_manifold
+from .fix import fix_non_manifold
+from .generate import grid, subdivide, uv_sphere
+from .labels import label_faces, octant, uniform
+from .mesh import load_obj
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Smallest slowdown reported as a regression, whatever the ratio
+MIN_SECONDS = 0.01
+
+BUNNY = Path(__file__).resolve().parent.parent / "mesh" / "bunny.obj"
+
+
+def bunny(levels=0):
+    mesh = load_obj(BUNNY)
+    for _ in range(levels):
+        mesh = subdivide(mesh)
+    return mesh
+
+
+# name -> mesh factory, roughly ordered by face count
+MESHES = {
+    "bunny": lambda: bunny(),
+    "bunny_sub1": lambda: bunny(1),
+    "bunny_sub2": lambda: bunny(2),
+    "bunny_sub3": lambda: bunny(3),
+    "grid_256": lambda: grid(256),
+    "grid_1024": lambda: grid(1024),
+    "grid_4096": lambda: grid(4096),
+    "grid_6144": lambda: grid(6144),
+    "sphere_256": lambda: uv_sphere(256, 128),
+    "sphere_1024": lambda: uv_sphere(1024, 512),
+    "sphere_4096": lambda: uv_sphere(4096, 2048),
+}
+
+SUITES = {
+    "small": ["bunny", "bunny_sub1", "grid_256", "sphere_256"],
+    "medium": ["bunny_sub2", "bunny_sub3", "grid_1024", "sphere_1024"],
+    "large": ["grid_4096", "sphere_4096", "grid_6144"],
+}
+
+LABELINGS = {
+    "random": lambda mesh: label_faces(mesh, uniform, n_labels=8, seed=0),
+    "origin": lambda mesh: label_faces(mesh, octant),
+}
+
+PHASES = ("detect", "cut", "fix")
+
+
+def run_phase(phase, mesh, mask):
+    if phase == "detect":
+        return detect_non_manifold(mesh)
+    if phase == "cut":
+        return cut_edge_star(mesh, mask)
+    if phase == "fix":
+        return fix_non_manifold(mesh, np.flatnonzero(mask))
+    raise ValueError(f"Unknown phase {phase!r}")
+
+
+def measure(phase, mesh, mask, repeat, memory):
+    """Best wall time over repeat runs, and peak traced memory in MB"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_phase(phase, mesh, mask)
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        run_phase(phase, mesh, mask)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def run(names, phases, repeat=3, memory=True, log=print):
+    results = []
+
+    for name in names:
+        start = time.perf_counter()
+        base = MESHES[name]()
+        log(f"{name}: {base.n_verts} verts, {base.n_faces} faces "
+            f"({time.perf_counter() - start:.2f}s to build)")
+
+        for labeling, assign in LABELINGS.items():
+            mesh = base.copy()
+            mesh.labels = assign(mesh)
+            mask = detect_non_manifold(mesh)
+
+            for phase in phases:
+                seconds, peak = measure(phase, mesh, mask, repeat, memory)
+                results.append({
+                    "mesh": name,
+                    "labeling": labeling,
+                    "phase": phase,
+                    "verts": mesh.n_verts,
+                    "faces": mesh.n_faces,
+                    "non_manifold": int(mask.sum()),
+                    "seconds": seconds,
+                    "peak_mb": peak,
+                })
+                log(f"  {labeling:>6} {phase:>6}: {seconds:9.4f}s"
+                    + (f" {peak:9.1f}MB" if peak is not None else ""))
+
+    return results
+
+
+def result_key(r):
+    return (r["mesh"], r["labeling"], r["phase"])
+
+
+def compare(results, baseline, threshold, min_seconds=MIN_SECONDS):
+    """Results slower (or using more memory) than baseline * (1 + threshold)
+
+    A slowdown must also be more than `min_seconds` long.
+    """
+    previous = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+
+    for r in results:
+        old = previous.get(result_key(r))
+        if old is None:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if r.get(metric) is None or old.get(metric) is None:
+                continue
+            if metric == "seconds" and r[metric] - old[metric] <= min_seconds:
+                continue
+            if r[metric] > old[metric] * (1 + threshold):
+                regressions.append({
+                    "mesh": r["mesh"],
+                    "labeling": r["labeling"],
+                    "phase": r["phase"],
+                    "metric": metric,
+                    "baseline": old[metric],
+                    "current": r[metric],
+                    "ratio": r[metric] / old[metric] if old[metric] else None,
+                })
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m thesis_core.bench", description=__doc__.split("\n")[0])
+    parser.add_argument("--suite", choices=sorted(SUITES), default="small")
+    parser.add_argument("--mesh", action="append", choices=sorted(MESHES),
+                        help="mesh to run, overrides --suite (repeatable)")
+    parser.add_argument("--phase", action="append", choices=PHASES,
+                        help="phase to time (repeatable), default all")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the tracemalloc peak memory run")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative slowdown (default 0.25)")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS,
+                        help="smallest slowdown reported, in seconds "
+                             f"(default {MIN_SECONDS})")
+    args = parser.parse_args(argv)
+
+    names = args.mesh or SUITES[args.suite]
+    phases = args.phase or list(PHASES)
+
+    results = run(names, phases, args.repeat, not args.no_memory)
+
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "max_rss_mb": (resource.getrusage(resource.RUSAGE_SELF)
+                           .ru_maxrss / 1024 if resource else None),
+        },
+        "results": results,
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold,
+                              args.min_seconds)
+        report["regressions"] = regressions
+        for r in regressions:
+            print(f"REGRESSION {r['mesh']} {r['labeling']} {r['phase']} "
+                  f"{r['metric']}: {r['baseline']:.4f} -> {r['current']:.4f}")
+        status = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
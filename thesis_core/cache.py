@@ -0,0 +1,161 @@
+"""Compact binary labeled-mesh format, loaded with memory mapping
+
+Layout: an 8 byte magic, a little endian uint64 header size, a JSON header
+and the raw arrays, each aligned on 64 bytes. The header lists every array
+with its dtype, shape and offset, plus the material and face group names.
+
+Arrays: float32 positions, int64 face offsets, int32 face vertices, labels
+as uint8 or uint16 when they fit, the faces of every group, and optionally
+the precomputed topology (vertex -> face CSR and face adjacency pairs). Loading maps the file
+copy-on-write, so positions and topology are zero-copy views.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .mesh import LabeledMesh, load_obj
+from .topology import Topology
+
+
+MAGIC = b"THMESH01"
+ALIGN = 64
+SUFFIX = ".lmesh"
+
+
+def label_dtype(labels):
+    top = int(labels.max()) if len(labels) else 0
+    low = int(labels.min()) if len(labels) else 0
+    if low >= 0 and top <= np.iinfo(np.uint8).max:
+        return np.uint8
+    if low >= 0 and top <= np.iinfo(np.uint16).max:
+        return np.uint16
+    return np.int32
+
+
+def save_mesh(mesh, path, topology=None):
+    """Write a LabeledMesh, with its topology when given"""
+    arrays = {
+        "verts": mesh.verts.astype(np.float32, copy=False),
+        "face_offsets": mesh.face_offsets.astype(np.int64, copy=False),
+        "face_verts": mesh.face_verts.astype(np.int32, copy=False),
+        "labels": mesh.labels.astype(label_dtype(mesh.labels), copy=False),
+    }
+    if mesh.groups:
+        arrays["group_faces"] = np.concatenate(
+            list(mesh.groups.values())).astype(np.int32, copy=False)
+    if topology is not None:
+        arrays["vf_offsets"] = topology.vf_offsets.astype(np.int64, copy=False)
+        arrays["vf_faces"] = topology.vf_faces.astype(np.int32, copy=False)
+        arrays["face_pairs"] = topology.face_pairs.astype(np.int32, copy=False)
+
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        entries[name] = {"dtype": array.dtype.str, "shape": list(array.shape),
+                         "offset": offset}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+
+    groups = [[name, len(faces)] for name, faces in mesh.groups.items()]
+    header = json.dumps({"arrays": entries,
+                         "materials": list(mesh.materials),
+                         "groups": groups}).encode()
+    # Data starts aligned after magic, size and header
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+    header += b" " * (start - len(MAGIC) - 8 - len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(start + entries[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(start + offset)
+
+
+def read_header(path):
+    """(header dict, data start) of a cache file"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a labeled mesh cache")
+        size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(size))
+    return header, len(MAGIC) + 8 + size
+
+
+def load_arrays(path):
+    """(header dict, name -> array) of a cache file, all memory-mapped
+
+    The arrays keep their stored dtypes (labels as uint8 or uint16) and
+    nothing is copied, for callers reading them block by block.
+    """
+    header, start = read_header(path)
+    data = np.memmap(path, dtype=np.uint8, mode="c")
+
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        first = start + entry["offset"]
+        arrays[name] = (data[first:first + count * dtype.itemsize]
+                        .view(dtype).reshape(entry["shape"]))
+    return header, arrays
+
+
+def load_mesh(path, with_topology=False):
+    """Memory-map a cache file as a LabeledMesh
+
+    With with_topology, returns (mesh, topology); the topology is None when
+    the file does not store it.
+    """
+    header, arrays = load_arrays(path)
+
+    groups = {}
+    first = 0
+    for name, n in header.get("groups", []):
+        groups[name] = arrays["group_faces"][first:first + n]
+        first += n
+
+    mesh = LabeledMesh(arrays["verts"], arrays["face_offsets"],
+                       arrays["face_verts"], arrays["labels"],
+                       header["materials"], groups)
+    if not with_topology:
+        return mesh
+
+    topology = None
+    if "vf_offsets" in arrays:
+        topology = Topology.from_arrays(
+            mesh.n_verts, mesh.n_faces,
+            arrays["vf_offsets"], arrays["vf_faces"],
+            face_pairs=arrays["face_pairs"])
+    return mesh, topology
+
+
+def cache_path(source):
+    return Path(source).with_suffix(SUFFIX)
+
+
+def load_cached(source, cache=None, topology=False):
+    """Load an OBJ through its binary cache
+
+    The cache is used when it is newer than the OBJ, otherwise the OBJ is
+    parsed and the cache (re)written next to it, or at `cache`.
+    """
+    source = Path(source)
+    cache = Path(cache) if cache is not None else cache_path(source)
+
+    if cache.exists() and cache.stat().st_mtime >= source.stat().st_mtime:
+        try:
+            return load_mesh(cache, with_topology=topology)
+        except (ValueError, KeyError, OSError):
+            pass
+
+    mesh = load_obj(source)
+    topo = Topology(mesh) if topology else None
+    try:
+        save_mesh(mesh, cache, topo)
+    except OSError:
+        pass
+    return (mesh, topo) if topology else mesh
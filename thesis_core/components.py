@@ -0,0 +1,114 @@
+"""Same-label face components shared by detection, cut and fix
+
+Every (vertex, face) incidence is a node of one disjoint-set forest, stored
+in vertex -> face CSR order. Same-label faces sharing an edge are joined
+inside every fan they share, so the root of a node names its fan-local
+component and "how many components of each label touch vertex v" is a
+lookup in precomputed arrays.
+"""
+
+import numpy as np
+
+from .instrument import count, phase
+from .topology import (
+    Topology,
+    csr_ranges,
+    fan_components,
+    local_fan_components,
+    unique,
+)
+
+
+def is_non_manifold(n_comps, n_labels):
+    return (n_labels > 1) & (n_comps > n_labels)
+
+
+class LabelComponents:
+    """Fan-local same-label components of a labeled mesh
+
+    The structure reads `mesh.labels` in place; relabel() keeps it in sync.
+    """
+
+    def __init__(self, mesh, topology=None, node_root=None):
+        self.mesh = mesh
+        if topology is None:
+            with phase("topology"):
+                topology = Topology(mesh)
+        self.topology = topology
+
+        if node_root is None:
+            with phase("fan components"):
+                node_root = fan_components(mesh, mesh.labels, topology)
+        self.node_root = node_root
+
+    @property
+    def labels(self):
+        return self.mesh.labels
+
+    def counts(self, vertices=None):
+        """Fan component and distinct label counts per vertex"""
+        with phase("classify"):
+            n_comps, n_labels = self._counts(vertices)
+        count("vertices_scanned", len(n_comps))
+        count("multi_label_fans", np.count_nonzero(n_labels > 1))
+        return n_comps, n_labels
+
+    def _counts(self, vertices):
+        topo = self.topology
+        if vertices is None:
+            nodes = np.arange(len(self.node_root), dtype=np.int64)
+            node_slot = topo.node_verts
+            n = topo.n_verts
+        else:
+            vertices = np.asarray(vertices, dtype=np.int64)
+            nodes = csr_ranges(topo.vf_offsets, vertices)
+            n = len(vertices)
+            node_slot = np.repeat(
+                np.arange(n, dtype=np.int64),
+                topo.vf_offsets[vertices + 1] - topo.vf_offsets[vertices])
+
+        # Each fan component has exactly one root node
+        is_root = self.node_root[nodes] == nodes
+        n_comps = np.bincount(node_slot[is_root], minlength=n)
+
+        # Only the labels of these fans, so the cost follows the vertex count
+        node_label = self.labels[topo.vf_faces[nodes]].astype(np.int64)
+        n_values = int(node_label.max()) + 1 if len(node_label) else 1
+        slot_label = unique(node_slot * n_values + node_label)
+        n_labels = np.bincount(slot_label // n_values, minlength=n)
+
+        return n_comps, n_labels
+
+    def non_manifold(self, vertices=None):
+        """Boolean mask of non manifold vertices (all or the given ones)"""
+        return is_non_manifold(*self.counts(vertices))
+
+    def fan(self, v):
+        """Face lists of the components around v, in fan order"""
+        start, stop = self.topology.vf_offsets[v], self.topology.vf_offsets[v + 1]
+        groups = {}
+        for f, root in zip(self.topology.vf_faces[start:stop].tolist(),
+                           self.node_root[start:stop].tolist()):
+            groups.setdefault(root, []).append(f)
+        return list(groups.values())
+
+    def update(self, vertices):
+        """Recompute the fan components of the given vertices"""
+        vertices = unique(np.asarray(vertices, dtype=np.int64))
+        if len(vertices):
+            with phase("fan update"):
+                nodes = csr_ranges(self.topology.vf_offsets, vertices)
+                roots = local_fan_components(
+                    self.topology, vertices, self.labels)
+                self.node_root[nodes] = nodes[roots]
+            count("fans_updated", len(vertices))
+        return vertices
+
+    def relabel(self, faces, labels):
+        """Relabel faces and update every fan they belong to
+
+        Returns the vertices whose fans were updated.
+        """
+        faces = np.asarray(faces, dtype=np.int64)
+        self.labels[faces] = labels
+        return self.update(self.topology.face_vertices(self.mesh, faces))
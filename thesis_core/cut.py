@@ -0,0 +1,135 @@
+"""Edge-star cut: split the edges around selected vertices
+
+Every edge touching a selected vertex gets a midpoint. Each face corner at
+a selected vertex is clipped into a triangle (midpoint, vertex, midpoint),
+so the vertex ends up surrounded by a star of small faces that keep the
+labels of the faces they were cut from.
+"""
+
+import numpy as np
+
+from .instrument import count
+from .mesh import LabeledMesh
+from .topology import loop_faces, loop_next, unique
+
+
+def cut_edge_star(mesh, selected, triangulate=False, return_faces=False):
+    """Cut the edge-star of the selected vertices
+
+    selected: boolean vertex mask or vertex indices.
+    Returns the new mesh; original vertices and faces keep their indices,
+    midpoints and corner faces are appended. With return_faces, returns
+    (mesh, faces), faces the sorted indices of the faces rewritten or
+    appended by the cut (and the triangulation).
+    """
+    n_verts = mesh.n_verts
+    sel = np.zeros(n_verts, dtype=bool)
+    sel[np.asarray(selected)] = True
+
+    face_offsets = mesh.face_offsets
+    a = mesh.face_verts.astype(np.int64)
+    nxt = loop_next(face_offsets)
+    prv = np.empty_like(nxt)
+    prv[nxt] = np.arange(len(nxt))
+    b = a[nxt]
+    face = loop_faces(face_offsets)
+
+    # Cut edges and their midpoint vertices
+    cut = sel[a] | sel[b]
+    key = np.minimum(a, b) * n_verts + np.maximum(a, b)
+    cut_keys, inverse = unique(key[cut], return_inverse=True)
+    mid = np.full(len(a), -1, dtype=np.int64)
+    mid[cut] = n_verts + inverse
+    count("edges_cut", len(cut_keys))
+
+    lo = cut_keys // n_verts
+    hi = cut_keys % n_verts
+    verts = np.concatenate(
+        (mesh.verts, (mesh.verts[lo] + mesh.verts[hi]) * 0.5))
+
+    # Remaining polygon: unselected corners plus midpoints, in loop order
+    slots = np.stack((a, mid), axis=1)
+    valid = np.stack((~sel[a], cut), axis=1)
+    rest_verts = slots[valid]
+    rest_sizes = np.bincount(face, weights=valid.sum(axis=1),
+                             minlength=mesh.n_faces).astype(np.int64)
+
+    # Corner triangles clipped at selected corners
+    corner = np.flatnonzero(sel[a])
+    corner_verts = np.stack((mid[prv[corner]], a[corner], mid[corner]),
+                            axis=1).ravel()
+
+    sizes = np.concatenate(
+        (rest_sizes, np.full(len(corner), 3, dtype=np.int64)))
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+
+    result = LabeledMesh(
+        verts,
+        offsets,
+        np.concatenate((rest_verts, corner_verts)),
+        np.concatenate((mesh.labels, mesh.labels[face[corner]])),
+        mesh.materials)
+
+    # Faces rewritten by the cut: those with a selected corner and the
+    # corner triangles
+    faces = np.concatenate((unique(face[corner]),
+                            np.arange(mesh.n_faces, result.n_faces)))
+    if triangulate:
+        n_faces = result.n_faces
+        result = triangulate_faces(result, faces)
+        faces = np.concatenate((faces, np.arange(n_faces, result.n_faces)))
+
+    if return_faces:
+        return result, faces
+    return result
+
+
+def triangulate_faces(mesh, faces=None):
+    """Fan triangulate polygons, only the listed faces when given
+
+    Triangulated faces are replaced in place by their first triangle, the
+    other triangles are appended.
+    """
+    offsets = mesh.face_offsets
+    sizes = np.diff(offsets)
+
+    todo = np.zeros(mesh.n_faces, dtype=bool)
+    if faces is None:
+        todo[:] = True
+    else:
+        todo[np.asarray(faces)] = True
+    todo &= sizes > 3
+
+    # Triangle k of face f is (v0, v(k+1), v(k+2))
+    n_tris = np.where(todo, sizes - 2, 1)
+    tri_face = np.repeat(np.arange(mesh.n_faces, dtype=np.int64), n_tris)
+    k = (np.arange(len(tri_face), dtype=np.int64)
+         - np.repeat(np.cumsum(n_tris) - n_tris, n_tris))
+    split = todo[tri_face]
+
+    # Untouched faces first (with the first triangle of split ones)
+    first = k == 0
+    keep_sizes = np.where(todo, 3, sizes)
+    start = offsets[:-1]
+    keep_idx = (np.arange(keep_sizes.sum(), dtype=np.int64)
+                - np.repeat(np.cumsum(keep_sizes) - keep_sizes, keep_sizes)
+                + np.repeat(start, keep_sizes))
+
+    extra = split & ~first
+    ef = tri_face[extra]
+    ek = k[extra]
+    extra_idx = np.stack(
+        (start[ef], start[ef] + ek + 1, start[ef] + ek + 2), axis=1).ravel()
+
+    new_sizes = np.concatenate(
+        (keep_sizes, np.full(len(ef), 3, dtype=np.int64)))
+    new_offsets = np.zeros(len(new_sizes) + 1, dtype=np.int64)
+    np.cumsum(new_sizes, out=new_offsets[1:])
+
+    return LabeledMesh(
+        mesh.verts,
+        new_offsets,
+        mesh.face_verts[np.concatenate((keep_idx, extra_idx))],
+        np.concatenate((mesh.labels, mesh.labels[ef])),
+        mesh.materials)
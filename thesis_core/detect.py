@@ -0,0 +1,66 @@
+"""Non manifold vertex detection
+
+A vertex is non manifold when its polygon fan holds more than one label and
+the same-label faces of the fan, connected through shared edges, form more
+components than there are labels. Only vertices on a label boundary can be,
+so interior vertices are skipped in bulk.
+"""
+
+import numpy as np
+
+from .components import LabelComponents, is_non_manifold
+from .instrument import phase
+from .regions import boundary_mask, boundary_non_manifold
+from .topology import Topology
+
+
+CHUNK_VERTS = 1 << 15
+# Below this share of boundary vertices, only the faces around them are read
+BOUNDARY_SHARE = 0.25
+
+
+def detect_non_manifold(mesh, topology=None):
+    """Boolean mask of non manifold vertices
+
+    Without a topology, a mesh whose label boundary is a small share of its
+    vertices is checked on the faces around the boundary only.
+    """
+    if topology is None:
+        boundary = boundary_mask(mesh)
+        if np.count_nonzero(boundary) < BOUNDARY_SHARE * mesh.n_verts:
+            return boundary_non_manifold(mesh, boundary)
+    return LabelComponents(mesh, topology).non_manifold()
+
+
+def iter_non_manifold(mesh, topology=None, chunk_verts=CHUNK_VERTS):
+    """Detection in vertex chunks, for callers that report progress
+
+    Yields (components, mask, done) once the topology is built and after
+    each chunk of boundary vertices. Vertices below `done` are final in the
+    mask, the rest are still False. After the last chunk the components are
+    complete for every fan holding more than one label; single label fans
+    keep one component per face, they cannot be non manifold and relabel()
+    recomputes those it reaches.
+    """
+    topo = topology
+    if topo is None:
+        with phase("topology"):
+            topo = Topology(mesh)
+    components = LabelComponents(
+        mesh, topo, np.arange(len(topo.vf_faces), dtype=np.int64))
+    mask = np.zeros(topo.n_verts, dtype=bool)
+    yield components, mask, 0
+
+    boundary = np.flatnonzero(boundary_mask(mesh))
+    for start in range(0, len(boundary), chunk_verts):
+        vertices = boundary[start:start + chunk_verts]
+        components.update(vertices)
+        mask[vertices] = components.non_manifold(vertices)
+        last = start + chunk_verts >= len(boundary)
+        yield components, mask, topo.n_verts if last else vertices[-1] + 1
+
+    if not len(boundary):
+        yield components, mask, topo.n_verts
+
+
+__all__ = ["detect_non_manifold", "is_non_manifold", "iter_non_manifold"]
@@ -0,0 +1,371 @@
+"""Fix non manifold vertices by relabeling faces
+
+For each non manifold vertex the label with the most fan components wins,
+and the faces on the shortest face path joining its components are
+relabeled with it, which merges them into a single component.
+
+Paths are searched in the face-dual graph (faces sharing an edge) limited to
+the fan of the vertex, widened ring by ring only when the fan alone does
+not connect the components. Relabels are applied to one label array, so a
+caller writes them back in a single batch. Given the LabelComponents of the
+mesh, the fan components are read from it (and it is kept up to date)
+instead of searched around every vertex.
+
+A relabel can make new non manifold vertices or clear others. The
+convergence mode (iter_converge_non_manifold) keeps a worklist ordered by
+path cost, the number of faces a fix relabels: the cheapest fix runs first
+and only the vertices of the faces it changed are checked again, until the
+worklist is empty or the budget is spent.
+"""
+
+import heapq
+import operator
+from collections import deque
+
+import numpy as np
+
+from . import kernels
+from .instrument import count, phase
+from .topology import Topology
+
+
+def fan_label_components(fan, labels, ff_offsets, ff_faces):
+    """Same-label components of one fan, in fan order (no LabelComponents)"""
+    in_fan = set(fan)
+    seen = set()
+    comps = []
+
+    for p in fan:
+        if p in seen:
+            continue
+        label = labels[p]
+        comp = [p]
+        seen.add(p)
+        queue = deque(comp)
+        while queue:
+            node = queue.popleft()
+            for f in ff_faces[ff_offsets[node]:ff_offsets[node + 1]].tolist():
+                if f in in_fan and f not in seen and labels[f] == label:
+                    seen.add(f)
+                    comp.append(f)
+                    queue.append(f)
+        comps.append(comp)
+
+    count("fan_faces", len(fan))
+    return comps
+
+
+def shortest_face_path(source, targets, region, ff_offsets, ff_faces):
+    """Faces on the shortest (topology distance) paths from source to targets
+
+    Only faces in `region` are walked. Returns the path faces and the
+    targets that could not be reached.
+    """
+    targets = set(targets)
+    targets.discard(source)
+    prev = {source: source}
+    queue = deque([source])
+    found = []
+
+    while queue and len(found) < len(targets):
+        node = queue.popleft()
+        for f in ff_faces[ff_offsets[node]:ff_offsets[node + 1]].tolist():
+            if f in region and f not in prev:
+                prev[f] = node
+                queue.append(f)
+                if f in targets:
+                    found.append(f)
+
+    count("paths")
+    count("bfs_faces", len(prev))
+
+    path = {source}
+    for f in found:
+        while f not in path:
+            path.add(f)
+            f = prev[f]
+
+    return path, targets.difference(found)
+
+
+def grow_region(region, ff_offsets, ff_faces):
+    """Region plus every face sharing an edge with it"""
+    faces = np.fromiter(region, dtype=np.int64, count=len(region))
+    starts = ff_offsets[faces]
+    stops = ff_offsets[faces + 1]
+    grown = set(region)
+    for a, b in zip(starts.tolist(), stops.tolist()):
+        grown.update(ff_faces[a:b].tolist())
+    return grown
+
+
+def plan_vertex(v, labels, topo, rings=2, components=None):
+    """Label and faces a fix of one vertex would relabel, labels untouched
+
+    Returns None when v is manifold, the faces list may be empty when the
+    components cannot be joined within the rings. `components`, when
+    given, must be up to date for v and hold `labels`.
+    """
+    ff_offsets, ff_faces = topo.ff_offsets, topo.ff_faces
+    fan = topo.vertex_faces(v).tolist()
+    if components is not None:
+        comps = components.fan(v)
+    elif kernels.enabled():
+        return kernels.plan_vertex(v, labels, topo, rings)
+    else:
+        comps = fan_label_components(fan, labels, ff_offsets, ff_faces)
+
+    counts = {}
+    for c in comps:
+        counts[labels[c[0]]] = counts.get(labels[c[0]], 0) + 1
+
+    if len(counts) >= len(comps):
+        return None
+
+    most_labels = max(counts.items(), key=operator.itemgetter(1))[0]
+    seeds = [c[0] for c in comps if labels[c[0]] == most_labels]
+
+    region = set(fan)
+    path, missing = shortest_face_path(seeds[0], seeds[1:], region,
+                                       ff_offsets, ff_faces)
+    for _ in range(rings):
+        if not missing:
+            break
+        count("rings_grown")
+        region = grow_region(region, ff_offsets, ff_faces)
+        path, missing = shortest_face_path(seeds[0], seeds[1:], region,
+                                           ff_offsets, ff_faces)
+
+    return most_labels, [f for f in path if labels[f] != most_labels]
+
+
+def fix_vertex(v, labels, topo, rings=2, components=None):
+    """Relabel the bridging path around one vertex
+
+    Returns the faces whose label changed (empty when v is manifold).
+    `components` is only read, the caller updates the fans of those faces.
+    """
+    plan = plan_vertex(v, labels, topo, rings, components)
+    if plan is None:
+        return []
+
+    label, changed = plan
+    labels[changed] = label
+    count("vertices_fixed")
+    return changed
+
+
+def fix_non_manifold(mesh, vertices, components=None, rings=2):
+    """Relabel faces around the given vertices, returns the new labels
+
+    Vertices are handled in order and each sees the relabels of the ones
+    before it. The mesh labels are left untouched unless `components`
+    built on this mesh is passed, which is then updated in place.
+    """
+    labels = None
+    for labels, _ in iter_fix_non_manifold(mesh, vertices, components, rings):
+        pass
+    return labels.copy()
+
+
+def iter_fix_non_manifold(mesh, vertices, components=None, rings=2,
+                          chunk_verts=64):
+    """fix_non_manifold() in steps, for callers that report progress
+
+    Yields (labels, done) after every chunk of vertices, `labels` being the
+    array relabeled in place and `done` the number of vertices handled.
+    `components` is brought up to date at each step; within a step the fans
+    a fix changed are updated together, before a vertex of them is planned.
+    """
+    if components is not None:
+        topo = components.topology
+        labels = components.labels
+        # Single label fans may not be split into components yet
+        components.update(vertices)
+    else:
+        with phase("topology"):
+            topo = Topology(mesh)
+        labels = mesh.labels.copy()
+
+    vertices = np.asarray(vertices).tolist()
+    yield labels, 0
+
+    face_offsets, face_verts = mesh.face_offsets, mesh.face_verts
+    stale = set()
+    for start in range(0, len(vertices), chunk_verts):
+        changed = []
+        with phase("fix paths"):
+            for v in vertices[start:start + chunk_verts]:
+                if v in stale:
+                    components.update(list(stale))
+                    stale.clear()
+                faces = fix_vertex(v, labels, topo, rings, components)
+                if components is not None:
+                    for f in faces:
+                        stale.update(face_verts[
+                            face_offsets[f]:face_offsets[f + 1]].tolist())
+                changed.extend(faces)
+        count("faces_relabeled", len(changed))
+
+        if stale:
+            components.update(list(stale))
+            stale.clear()
+
+        yield labels, min(start + chunk_verts, len(vertices))
+
+
+# Default budget of the convergence mode, in fixes per initial vertex
+ITERATIONS_PER_VERTEX = 8
+# Fixes of one vertex before it is dropped, two fixes undoing each other
+# would otherwise spend the whole budget
+FIXES_PER_VERTEX = 3
+
+
+class Convergence:
+    """Progress of a convergence run
+
+    iterations: fixes applied
+    relabeled: faces relabeled, a face counted once per fix changing it
+    pending: vertices left in the worklist
+    dropped: vertices given up, not joinable within the rings or fixed
+        FIXES_PER_VERTEX times already
+    budget: maximum number of fixes
+    """
+
+    def __init__(self, budget):
+        self.iterations = 0
+        self.relabeled = 0
+        self.pending = 0
+        self.dropped = 0
+        self.budget = budget
+
+    @property
+    def converged(self):
+        return not self.pending
+
+    def add(self, other):
+        """Sum in the progress of another run (e.g. of another mesh)"""
+        self.iterations += other.iterations
+        self.relabeled += other.relabeled
+        self.pending += other.pending
+        self.dropped += other.dropped
+        self.budget += other.budget
+
+    def __repr__(self):
+        return (f"Convergence(iterations={self.iterations}, "
+                f"relabeled={self.relabeled}, pending={self.pending}, "
+                f"dropped={self.dropped})")
+
+
+def converge_non_manifold(mesh, vertices, components=None, rings=2,
+                          budget=None):
+    """Fix to convergence, returns the new labels and the Convergence"""
+    labels, state = None, None
+    for labels, state in iter_converge_non_manifold(mesh, vertices,
+                                                    components, rings, budget):
+        pass
+    return labels.copy(), state
+
+
+def iter_converge_non_manifold(mesh, vertices, components=None, rings=2,
+                               budget=None, chunk_iterations=64):
+    """Fix from a cost ordered worklist until no non manifold vertex is left
+
+    The worklist starts from the given vertices and holds each one with the
+    number of faces its fix relabels; the cheapest is fixed first. The
+    vertices of the faces a fix changed are checked again and queued when
+    non manifold. Entries are planned again when popped, as relabels since
+    they were queued can change their cost. Stops when the worklist is empty
+    or after `budget` fixes (ITERATIONS_PER_VERTEX per initial vertex by
+    default). A vertex whose components cannot be joined within `rings`, or
+    already fixed FIXES_PER_VERTEX times, is dropped.
+
+    Yields (labels, Convergence) every `chunk_iterations` fixes, `labels`
+    being the array relabeled in place. `components` is brought up to date
+    at each fix and narrows the checks to non manifold vertices.
+    """
+    if components is not None:
+        topo = components.topology
+        labels = components.labels
+        # Single label fans may not be split into components yet
+        components.update(vertices)
+    else:
+        with phase("topology"):
+            topo = Topology(mesh)
+        labels = mesh.labels.copy()
+
+    vertices = np.asarray(vertices, dtype=np.int64)
+    if budget is None:
+        budget = ITERATIONS_PER_VERTEX * len(vertices)
+    state = Convergence(budget)
+
+    heap = []
+    queued = {}
+    fixes = {}
+    dropped = set()
+
+    def push(candidates):
+        for v in candidates.tolist():
+            if v in dropped:
+                continue
+            plan = plan_vertex(v, labels, topo, rings, components)
+            if plan is None:
+                continue
+            if not plan[1] or fixes.get(v, 0) >= FIXES_PER_VERTEX:
+                dropped.add(v)
+                continue
+            cost = len(plan[1])
+            if cost < queued.get(v, cost + 1):
+                queued[v] = cost
+                heapq.heappush(heap, (cost, v))
+
+    with phase("worklist"):
+        push(vertices)
+    state.pending = len(queued)
+    state.dropped = len(dropped)
+    yield labels, state
+
+    while heap and state.iterations < budget:
+        with phase("fix paths"):
+            for _ in range(chunk_iterations):
+                if not heap or state.iterations >= budget:
+                    break
+                cost, v = heapq.heappop(heap)
+                if queued.get(v) != cost:
+                    continue
+                del queued[v]
+
+                plan = plan_vertex(v, labels, topo, rings, components)
+                if plan is None:
+                    continue
+                if not plan[1]:
+                    dropped.add(v)
+                    continue
+                label, changed = plan
+                if len(changed) > cost:
+                    # Dearer than when queued, let cheaper fixes go first
+                    queued[v] = len(changed)
+                    heapq.heappush(heap, (len(changed), v))
+                    continue
+
+                if components is not None:
+                    touched = components.relabel(changed, label)
+                else:
+                    labels[changed] = label
+                    touched = topo.face_vertices(mesh, changed)
+                fixes[v] = fixes.get(v, 0) + 1
+                state.iterations += 1
+                state.relabeled += len(changed)
+                count("vertices_fixed")
+                count("faces_relabeled", len(changed))
+
+                if components is not None:
+                    touched = touched[components.non_manifold(touched)]
+                push(touched)
+
+        state.pending = len(queued)
+        state.dropped = len(dropped)
+        yield labels, state
+
+    count("worklist_left", len(queued))
+    count("vertices_dropped", len(dropped))
@@ -0,0 +1,494 @@
+"""Differential fuzzing of the detect and fix engines against the reference
+
+Random labeled meshes (grids and UV spheres with holes and split quads,
+open and closed triangle fans, polygon soups with non manifold edges),
+labeled at random, by octant in a random frame as Set Labels (Origin) does,
+by slabs or by Voronoi cells, are run through every engine and compared
+with thesis_core.oracle. A mismatch is shrunk to a small failing mesh: faces
+are removed by halves down to one at a time, unused vertices dropped and
+labels merged while the engine still disagrees.
+
+    python -m thesis_core.fuzz --cases 500 --seed 0
+    python -m thesis_core.fuzz --engine kernels --engine fix --output failing
+
+The exit status is 1 when an engine disagreed with the reference.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from . import kernels, oracle
+from .cache import SUFFIX, save_mesh
+from .components import LabelComponents
+from .detect import detect_non_manifold, iter_non_manifold
+from .fix import fix_non_manifold
+from .generate import grid, uv_sphere
+from .incremental import DetectionState, TopologyCache
+from .labels import SCHEMES, label_faces
+from .mesh import LabeledMesh, save_obj
+from .parallel import detect_non_manifold_parallel
+from .regions import (
+    boundary_non_manifold,
+    detect_non_manifold_bands,
+    extract,
+)
+from .roi import detect_non_manifold_roi
+from .stream import detect_non_manifold_streaming
+from .topology import Topology, csr_ranges
+
+
+# Detection engines: (mesh, rng) -> boolean vertex mask
+
+
+def detect_vectorized(mesh, rng):
+    with kernels.using("numpy"):
+        return LabelComponents(mesh).non_manifold()
+
+
+def detect_kernels(mesh, rng):
+    """Fan components of the kernel, compiled or run as Python"""
+    topo = Topology(mesh)
+    roots = kernels.fan_roots(topo, np.arange(topo.n_verts), mesh.labels)
+    return LabelComponents(mesh, topo, roots).non_manifold()
+
+
+def detect_default(mesh, rng):
+    return detect_non_manifold(mesh)
+
+
+def detect_boundary(mesh, rng):
+    with kernels.using("numpy"):
+        return boundary_non_manifold(mesh)
+
+
+def detect_chunked(mesh, rng):
+    with kernels.using("numpy"):
+        for _, mask, _ in iter_non_manifold(
+                mesh, chunk_verts=int(rng.integers(1, 8))):
+            pass
+    return mask
+
+
+def detect_parallel(mesh, rng):
+    return detect_non_manifold_parallel(mesh, workers=2, min_verts=0)
+
+
+def detect_bands(mesh, rng):
+    return detect_non_manifold_bands(mesh, workers=2, min_verts=0)
+
+
+def detect_incremental(mesh, rng):
+    """State built on other labels, synced and refreshed a few at a time"""
+    start = mesh.copy()
+    edited = rng.random(mesh.n_faces) < 0.5
+    start.labels[edited] = rng.integers(0, 4, np.count_nonzero(edited))
+    state = DetectionState(start)
+    state.sync_labels(mesh.labels)
+    while state.dirty:
+        state.refresh(int(rng.integers(1, 8)))
+    return state.mask
+
+
+def detect_topology_edit(mesh, rng):
+    """Cached state of the mesh without its last faces, then edited
+
+    Only some of the appended faces are reported, the others must be
+    picked up all the same.
+    """
+    n = int(rng.integers(1, mesh.n_faces + 1))
+    old = LabeledMesh(mesh.verts, mesh.face_offsets[:n + 1],
+                      mesh.face_verts[:mesh.face_offsets[n]],
+                      mesh.labels[:n])
+    cache = TopologyCache()
+    cache.get(0, old)
+    appended = np.arange(n, mesh.n_faces)
+    cache.edit(0, appended[rng.random(len(appended)) < 0.5])
+    state = cache.lookup(0, mesh.copy())
+    return state.mask
+
+
+def detect_roi(mesh, rng):
+    """Union of the detections in a random split of the vertices"""
+    region = rng.integers(0, 3, mesh.n_verts)
+    mask = np.zeros(mesh.n_verts, dtype=bool)
+    for r in range(3):
+        mask |= detect_non_manifold_roi(mesh, region == r)
+    return mask
+
+
+def detect_streaming(mesh, rng):
+    """Out-of-core detection of the mesh saved as OBJ or cache, small chunks"""
+    shape = tuple(rng.integers(1, 4, 3).tolist())
+    with tempfile.TemporaryDirectory() as tmp:
+        if rng.random() < 0.5:
+            path = Path(tmp) / "mesh.obj"
+            save_obj(mesh, path)
+        else:
+            path = Path(tmp) / ("mesh" + SUFFIX)
+            save_mesh(mesh, path)
+        output = Path(tmp) / "non_manifold.txt"
+        detect_non_manifold_streaming(
+            path, output, shape, workdir=tmp,
+            block_lines=int(rng.integers(1, 16)))
+        ids = np.array(output.read_text().split(), dtype=np.int64)
+    mask = np.zeros(mesh.n_verts, dtype=bool)
+    mask[ids] = True
+    return mask
+
+
+DETECT_ENGINES = {
+    "vectorized": detect_vectorized,
+    "kernels": detect_kernels,
+    "detect": detect_default,
+    "boundary": detect_boundary,
+    "chunked": detect_chunked,
+    "parallel": detect_parallel,
+    "bands": detect_bands,
+    "incremental": detect_incremental,
+    "topology-edit": detect_topology_edit,
+    "roi": detect_roi,
+    "streaming": detect_streaming,
+}
+
+
+# Fix engines: (mesh, vertices, rings) -> new labels
+
+
+def fix_numpy(mesh, vertices, rings):
+    with kernels.using("numpy"):
+        return fix_non_manifold(mesh, vertices, rings=rings)
+
+
+def fix_kernels(mesh, vertices, rings):
+    """Bridging paths of the kernel, compiled or run as Python"""
+    topo = Topology(mesh)
+    labels = mesh.labels.copy()
+    for v in vertices:
+        plan = kernels.plan_vertex(v, labels, topo, rings)
+        if plan is not None:
+            labels[plan[1]] = plan[0]
+    return labels
+
+
+def fix_components(mesh, vertices, rings):
+    """Fix keeping LabelComponents up to date, which must match a rebuild"""
+    mesh = mesh.copy()
+    with kernels.using("numpy"):
+        components = LabelComponents(mesh)
+        labels = fix_non_manifold(mesh, vertices, components, rings)
+        if not np.array_equal(components.non_manifold(),
+                              LabelComponents(mesh.copy()).non_manifold()):
+            raise AssertionError("components out of date after the fix")
+    return labels
+
+
+FIX_ENGINES = {
+    "fix": fix_numpy,
+    "fix-kernels": fix_kernels,
+    "fix-components": fix_components,
+}
+
+ENGINES = {**DETECT_ENGINES, **FIX_ENGINES}
+
+# Engines starting a process pool per call, only run on some cases
+POOL_ENGINES = {"parallel", "bands"}
+POOL_EVERY = 10
+
+
+# Random cases
+
+
+def _drop_faces(faces, rng, share):
+    keep = [f for f in faces if rng.random() >= share]
+    return keep or faces[:1]
+
+
+def _split_quads(faces, rng, share):
+    split = []
+    for f in faces:
+        if len(f) == 4 and rng.random() < share:
+            a, b, c, d = f if rng.random() < 0.5 else f[1:] + f[:1]
+            split += [[a, b, c], [a, c, d]]
+        else:
+            split.append(f)
+    return split
+
+
+def random_grid(rng):
+    mesh = grid(int(rng.integers(2, 7)))
+    faces = _split_quads(mesh.faces(), rng, rng.random())
+    return mesh.verts, _drop_faces(faces, rng, 0.3 * rng.random())
+
+
+def random_sphere(rng):
+    mesh = uv_sphere(int(rng.integers(3, 9)), int(rng.integers(2, 6)))
+    faces = _split_quads(mesh.faces(), rng, rng.random())
+    return mesh.verts, _drop_faces(faces, rng, 0.3 * rng.random())
+
+
+def random_fan(rng):
+    """Triangles around vertex 0, open or closed"""
+    k = int(rng.integers(3, 9))
+    angle = np.linspace(0, 2 * np.pi, k, endpoint=False)
+    verts = np.concatenate(([[0, 0, 0]], np.stack(
+        (np.cos(angle), np.sin(angle), rng.normal(0, 0.2, k)), axis=1)))
+    faces = [[0, 1 + i, 1 + (i + 1) % k] for i in range(k)]
+    return verts, _drop_faces(faces, rng, 0.3 * rng.random())
+
+
+def random_soup(rng):
+    """Random polygons over a few vertices, non manifold edges included"""
+    n_verts = int(rng.integers(4, 11))
+    faces = []
+    seen = set()
+    for _ in range(int(rng.integers(2, 15))):
+        face = rng.choice(n_verts, int(rng.integers(3, 5)),
+                          replace=False).tolist()
+        if frozenset(face) not in seen:
+            seen.add(frozenset(face))
+            faces.append(face)
+    return rng.normal(0, 1, (n_verts, 3)), faces
+
+
+SHAPES = {
+    "grid": random_grid,
+    "sphere": random_sphere,
+    "fan": random_fan,
+    "soup": random_soup,
+}
+
+
+def random_frame(rng):
+    """Random rotation, scale and offset, as an object's matrix_world"""
+    q, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    matrix = np.eye(4)
+    matrix[:3, :3] = q * rng.uniform(0.5, 2.0)
+    matrix[:3, 3] = rng.normal(0, 0.3, 3)
+    return matrix
+
+
+def random_labels(mesh, rng):
+    scheme = rng.choice(["random", "octant", "slabs", "voronoi"])
+    n_labels = int(rng.integers(1, 6))
+    if scheme == "random":
+        return rng.integers(0, n_labels, mesh.n_faces).astype(np.int32)
+    if scheme == "octant":
+        return label_faces(mesh, SCHEMES["octant"], random_frame(rng))
+    if scheme == "slabs":
+        return label_faces(mesh, SCHEMES["slabs"], n_labels=n_labels,
+                           axis=rng.normal(size=3))
+    return label_faces(mesh, SCHEMES["voronoi"], n_labels=n_labels,
+                       seed=int(rng.integers(1 << 31)))
+
+
+def random_mesh(rng):
+    """Random labeled mesh of a random SHAPES shape"""
+    verts, faces = SHAPES[rng.choice(sorted(SHAPES))](rng)
+    mesh = LabeledMesh.from_faces(verts, faces)
+    mesh.labels = random_labels(mesh, rng)
+    return mesh
+
+
+# Checks
+
+
+def expected_mask(mesh):
+    return np.array(oracle.detect(oracle.ReferenceMesh.from_mesh(mesh)),
+                    dtype=bool)
+
+
+def expected_fix(mesh, rings):
+    """Vertices fixed (the reference non manifold ones) and new labels"""
+    ref = oracle.ReferenceMesh.from_mesh(mesh)
+    vertices = [v for v, flag in enumerate(oracle.detect(ref)) if flag]
+    return vertices, np.array(oracle.fix(ref, vertices, rings),
+                              dtype=mesh.labels.dtype)
+
+
+def check(engine, mesh, seed, rings=2):
+    """None when the engine agrees with the reference, else (expected, got)
+
+    An exception raised by the engine counts as a disagreement.
+    """
+    rng = np.random.default_rng(seed)
+    if engine in FIX_ENGINES:
+        vertices, expected = expected_fix(mesh, rings)
+        run = lambda: FIX_ENGINES[engine](mesh, vertices, rings)
+    else:
+        expected = expected_mask(mesh)
+        run = lambda: DETECT_ENGINES[engine](mesh, rng)
+    try:
+        got = np.asarray(run())
+    except Exception as e:
+        return expected, f"{type(e).__name__}: {e}"
+    if np.array_equal(got, expected):
+        return None
+    return expected, got
+
+
+def face_subset(mesh, faces):
+    """Mesh of some faces, vertices kept with their ids"""
+    faces = np.asarray(faces, dtype=np.int64)
+    sizes = np.diff(mesh.face_offsets)[faces]
+    offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    return LabeledMesh(mesh.verts, offsets,
+                       mesh.face_verts[csr_ranges(mesh.face_offsets, faces)],
+                       mesh.labels[faces])
+
+
+def shrink(mesh, fails):
+    """Smallest mesh found for which fails(mesh) still holds"""
+    faces = list(range(mesh.n_faces))
+    chunk = max(len(faces) // 2, 1)
+    while True:
+        i = 0
+        while i < len(faces) and len(faces) > 1:
+            trial = faces[:i] + faces[i + chunk:]
+            if trial and fails(face_subset(mesh, trial)):
+                faces = trial
+            else:
+                i += chunk
+        if chunk == 1:
+            break
+        chunk //= 2
+    mesh = face_subset(mesh, faces)
+
+    # Unused vertices dropped, when the failure does not depend on them
+    compact = extract(mesh, np.arange(mesh.n_faces)).mesh
+    if fails(compact):
+        mesh = compact
+
+    # Merge labels two by two, then number them from 0
+    merged = True
+    while merged:
+        merged = False
+        values = np.unique(mesh.labels).tolist()
+        for a in values:
+            for b in values:
+                if b >= a:
+                    break
+                trial = mesh.copy()
+                trial.labels[trial.labels == a] = b
+                if fails(trial):
+                    mesh, merged = trial, True
+                    break
+            if merged:
+                break
+    trial = mesh.copy()
+    trial.labels = np.unique(mesh.labels, return_inverse=True)[1].astype(
+        np.int32).reshape(-1)
+    return trial if fails(trial) else mesh
+
+
+class Mismatch:
+    """An engine disagreeing with the reference on a (shrunk) mesh"""
+
+    def __init__(self, engine, case, mesh, rings, expected, got):
+        self.engine = engine
+        self.case = case
+        self.mesh = mesh
+        self.rings = rings
+        self.expected = expected
+        self.got = got
+
+    def describe(self):
+        lines = [f"{self.engine}: case {self.case}, {self.mesh.n_verts} "
+                 f"vertices, rings {self.rings}"]
+        for face, label in zip(self.mesh.faces(), self.mesh.labels.tolist()):
+            lines.append(f"  face {face} label {label}")
+        if self.engine in FIX_ENGINES:
+            lines.append(f"  expected labels {self.expected.tolist()}")
+        else:
+            lines.append(f"  expected vertices "
+                         f"{np.flatnonzero(self.expected).tolist()}")
+        if isinstance(self.got, str):
+            lines.append(f"  got {self.got}")
+        elif self.engine in FIX_ENGINES:
+            lines.append(f"  got labels {self.got.tolist()}")
+        else:
+            lines.append(f"  got vertices {np.flatnonzero(self.got).tolist()}")
+        return "\n".join(lines)
+
+
+def fuzz(cases=200, seed=0, engines=None, minimize=True,
+         pool_every=POOL_EVERY, log=print):
+    """Mismatches of the engines over random cases, one per engine at most
+
+    An engine is no longer run once it disagreed; its mismatch is shrunk
+    unless `minimize` is False. POOL_ENGINES run on every `pool_every`-th
+    case only.
+    """
+    engines = list(engines or ENGINES)
+    mismatches = []
+    for case in range(cases):
+        rng = np.random.default_rng([seed, case])
+        mesh = random_mesh(rng)
+        rings = int(rng.integers(0, 3))
+        engine_seed = int(rng.integers(1 << 31))
+
+        for engine in list(engines):
+            if engine in POOL_ENGINES and case % pool_every:
+                continue
+            result = check(engine, mesh, engine_seed, rings)
+            if result is None:
+                continue
+            engines.remove(engine)
+            failing = mesh
+            if minimize:
+                failing = shrink(mesh, lambda m: check(
+                    engine, m, engine_seed, rings) is not None)
+                result = check(engine, failing, engine_seed, rings)
+            mismatch = Mismatch(engine, case, failing, rings, *result)
+            mismatches.append(mismatch)
+            log(mismatch.describe())
+        if not engines:
+            break
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m thesis_core.fuzz", description=__doc__.split("\n")[0])
+    parser.add_argument("--cases", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", action="append", choices=list(ENGINES),
+                        help="engine to check (repeatable), default all")
+    parser.add_argument("--pool-every", type=int, default=POOL_EVERY,
+                        help="run the process pool engines on every n-th "
+                             f"case (default {POOL_EVERY})")
+    parser.add_argument("--no-shrink", action="store_true",
+                        help="report mismatches on the generated meshes")
+    parser.add_argument("--kernels", choices=kernels.BACKENDS, default="auto",
+                        help="kernel backend of the engines that do not pick "
+                             "one (default auto)")
+    parser.add_argument("--output",
+                        help="directory to write the failing meshes to, as "
+                             "<engine>.obj")
+    args = parser.parse_args(argv)
+
+    kernels.set_backend(args.kernels)
+    engines = args.engine or list(ENGINES)
+    start = time.perf_counter()
+    mismatches = fuzz(args.cases, args.seed, engines, not args.no_shrink,
+                      args.pool_every)
+    print(f"{args.cases} cases, {len(engines)} engines "
+          f"(kernels: {kernels.backend()}), {len(mismatches)} mismatches, "
+          f"{time.perf_counter() - start:.1f} seconds")
+
+    if args.output and mismatches:
+        output = Path(args.output)
+        output.mkdir(parents=True, exist_ok=True)
+        for mismatch in mismatches:
+            save_obj(mismatch.mesh, output / f"{mismatch.engine}.obj")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Procedural test meshes: grids, UV spheres and subdivision"""
+
+import numpy as np
+
+from .labels import face_centroids
+from .mesh import LabeledMesh
+from .topology import loop_faces, loop_next, unique
+
+
+def grid(n, size=2.0):
+    """Square grid of n x n quads centered on the origin"""
+    coords = np.linspace(-size / 2, size / 2, n + 1, dtype=np.float32)
+    x, y = np.meshgrid(coords, coords)
+    verts = np.stack((x.ravel(), y.ravel(), np.zeros(x.size, np.float32)),
+                     axis=1)
+
+    i = np.arange(n, dtype=np.int64)
+    corner = (i[:, None] * (n + 1) + i[None, :]).ravel()
+    face_verts = np.stack(
+        (corner, corner + 1, corner + n + 2, corner + n + 1), axis=1).ravel()
+    face_offsets = np.arange(0, 4 * n * n + 1, 4, dtype=np.int64)
+
+    return LabeledMesh(verts, face_offsets, face_verts)
+
+
+def uv_sphere(segments, rings, radius=1.0):
+    """UV sphere of quads with triangle fans at the poles"""
+    theta = np.linspace(0, np.pi, rings + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing="ij")
+    body = np.stack((np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)),
+                    axis=-1).reshape(-1, 3)
+    verts = np.concatenate(([[0, 0, 1]], body, [[0, 0, -1]])) * radius
+
+    top = 0
+    bottom = len(verts) - 1
+    s = np.arange(segments, dtype=np.int64)
+    s_next = (s + 1) % segments
+
+    # Quads between consecutive rings
+    r = np.arange(rings - 2, dtype=np.int64)[:, None]
+    a = 1 + r * segments + s
+    b = 1 + r * segments + s_next
+    quads = np.stack((a, a + segments, b + segments, b), axis=-1).reshape(-1)
+
+    # Triangle fans at the poles
+    first = 1 + s
+    last = 1 + (rings - 2) * segments
+    top_tris = np.stack((np.full(segments, top), first, 1 + s_next),
+                        axis=1).ravel()
+    bottom_tris = np.stack(
+        (np.full(segments, bottom), last + s_next, last + s), axis=1).ravel()
+
+    face_verts = np.concatenate((top_tris, quads, bottom_tris))
+    sizes = np.concatenate((np.full(segments, 3),
+                            np.full((rings - 2) * segments, 4),
+                            np.full(segments, 3)))
+    face_offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=face_offsets[1:])
+
+    return LabeledMesh(verts, face_offsets, face_verts)
+
+
+def subdivide(mesh):
+    """Split every n-gon into n quads through its center and edge midpoints
+
+    Labels are inherited, the shape is not smoothed.
+    """
+    n_verts = mesh.n_verts
+    face_offsets = mesh.face_offsets
+    a = mesh.face_verts.astype(np.int64)
+    nxt = loop_next(face_offsets)
+    prv = np.empty_like(nxt)
+    prv[nxt] = np.arange(len(nxt))
+    face = loop_faces(face_offsets)
+    b = a[nxt]
+
+    key = np.minimum(a, b) * n_verts + np.maximum(a, b)
+    edges, edge_of_loop = unique(key, return_inverse=True)
+    mid = n_verts + edge_of_loop
+    center = n_verts + len(edges) + face
+
+    centers = face_centroids(mesh)
+
+    verts = np.concatenate((
+        mesh.verts,
+        (mesh.verts[edges // n_verts] + mesh.verts[edges % n_verts]) * 0.5,
+        centers.astype(np.float32)))
+
+    face_verts = np.stack((a, mid, center, mid[prv]), axis=1).ravel()
+    face_offsets = np.arange(0, len(face_verts) + 1, 4, dtype=np.int64)
+
+    return LabeledMesh(verts, face_offsets, face_verts, mesh.labels[face],
+                       mesh.materials)
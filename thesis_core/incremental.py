@@ -0,0 +1,262 @@
+"""Incremental detection: re-check only the vertices touched by an edit
+
+DetectionState keeps the LabelComponents of a mesh together with the
+per-vertex fan component and label counts and the non manifold mask. Label
+edits mark the vertices of the edited faces dirty and refresh() re-evaluates
+only those, so the cost follows the size of the edit rather than the size
+of the mesh.
+
+TopologyCache keeps the states of several meshes between runs, so the
+adjacency and the components are only rebuilt when the faces change.
+"""
+
+from collections import OrderedDict
+from itertools import islice
+
+import numpy as np
+
+from .components import LabelComponents, is_non_manifold
+from .parallel import label_components
+from .topology import Topology, csr_ranges, unique
+
+
+class DetectionState:
+    """Persistent detection results of one mesh"""
+
+    def __init__(self, mesh, topology=None, workers=1, components=None):
+        if components is None:
+            components = label_components(mesh, workers, topology)
+        self.components = components
+        self.dirty = set()
+
+        self.n_comps, self.n_labels = components.counts()
+        self.mask = is_non_manifold(self.n_comps, self.n_labels)
+
+    @property
+    def mesh(self):
+        return self.components.mesh
+
+    @property
+    def topology(self):
+        return self.components.topology
+
+    def evaluate(self, vertices):
+        """Recompute the given vertices, returns those whose mask changed"""
+        vertices = self.components.update(vertices)
+        if len(vertices) == 0:
+            return vertices
+
+        n_comps, n_labels = self.components.counts(vertices)
+        mask = is_non_manifold(n_comps, n_labels)
+
+        changed = vertices[self.mask[vertices] != mask]
+        self.n_comps[vertices] = n_comps
+        self.n_labels[vertices] = n_labels
+        self.mask[vertices] = mask
+
+        return changed
+
+    def mark_faces(self, faces, mesh=None):
+        """Flag the vertices of the given faces for re-evaluation"""
+        mesh = mesh if mesh is not None else self.mesh
+        faces = np.asarray(faces, dtype=np.int64)
+        if len(faces):
+            self.dirty.update(unique(
+                mesh.face_verts[csr_ranges(mesh.face_offsets, faces)]).tolist())
+
+    def set_labels(self, faces, labels):
+        """Relabel faces and flag their vertices"""
+        faces = np.asarray(faces, dtype=np.int64)
+        self.mesh.labels[faces] = labels
+        self.mark_faces(faces)
+
+    def sync_labels(self, labels):
+        """Adopt a full label array, flagging only the faces that differ"""
+        labels = np.asarray(labels)
+        changed = np.flatnonzero(self.mesh.labels != labels)
+        self.mesh.labels[changed] = labels[changed]
+        self.mark_faces(changed)
+        return changed
+
+    def update_topology(self, mesh, faces):
+        """Switch to an edited mesh, `faces` being the new or changed faces
+
+        Vertices and untouched faces keep their indices, new ones are
+        appended. The adjacency is rebuilt and the fan components of clean
+        vertices are carried over; only the vertices of the given faces, of
+        the appended faces (listed or not) and new vertices are re-evaluated.
+        """
+        old = self.components
+        old_topo = old.topology
+        topo = Topology(mesh)
+
+        # Vertices of the changed faces, before and after the edit
+        faces = np.asarray(faces, dtype=np.int64)
+        faces = np.union1d(faces, np.arange(old.mesh.n_faces, mesh.n_faces))
+        self.mark_faces(faces, mesh)
+        self.mark_faces(faces[faces < old.mesh.n_faces], old.mesh)
+
+        n_old = min(old_topo.n_verts, mesh.n_verts)
+        self.dirty.update(range(n_old, mesh.n_verts))
+        self.dirty = {v for v in self.dirty if v < mesh.n_verts}
+
+        # Carry over the roots of clean vertices, shifting their node ranges
+        clean = np.ones(n_old, dtype=bool)
+        clean[[v for v in self.dirty if v < n_old]] = False
+        clean = np.flatnonzero(clean)
+
+        node_root = np.arange(len(topo.vf_faces), dtype=np.int64)
+        shift = topo.vf_offsets[clean] - old_topo.vf_offsets[clean]
+        counts = old_topo.vf_offsets[clean + 1] - old_topo.vf_offsets[clean]
+        old_nodes = csr_ranges(old_topo.vf_offsets, clean)
+        node_root[old_nodes + np.repeat(shift, counts)] = (
+            old.node_root[old_nodes] + np.repeat(shift, counts))
+
+        self.components = LabelComponents(mesh, topo, node_root)
+        self.n_comps = _resize(self.n_comps, mesh.n_verts)
+        self.n_labels = _resize(self.n_labels, mesh.n_verts)
+        self.mask = _resize(self.mask, mesh.n_verts)
+
+    def refresh(self, max_verts=None):
+        """Re-evaluate the dirty vertices, returns those whose mask changed
+
+        With `max_verts` at most that many are re-evaluated, the others stay
+        dirty for the next call (callers working to a time budget).
+        """
+        if max_verts is None or max_verts >= len(self.dirty):
+            dirty = np.fromiter(self.dirty, dtype=np.int64,
+                                count=len(self.dirty))
+            self.dirty.clear()
+        else:
+            dirty = np.fromiter(islice(self.dirty, max_verts),
+                                dtype=np.int64, count=max_verts)
+            self.dirty.difference_update(dirty.tolist())
+        return self.evaluate(dirty)
+
+
+class TopologyCache:
+    """Detection states of several meshes, least recently used evicted
+
+    Entries are keyed by the caller (e.g. a mesh datablock pointer) and
+    checked against a topology hash once invalidate() flagged them, so a
+    label or vertex position change keeps the cached topology. Faces
+    reported through edit() carry the state over to the edited mesh.
+    """
+
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self.states = OrderedDict()
+        self.hashes = {}
+        self.stale = set()
+        self.edits = {}
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, key):
+        return key in self.states
+
+    def get(self, key, mesh, workers=1):
+        """Up to date detection state of `mesh`, rebuilt only if needed"""
+        state = self.lookup(key, mesh)
+        if state is None:
+            state = self.store(key, mesh, DetectionState(mesh, workers=workers))
+        return state
+
+    def lookup(self, key, mesh, refresh=True):
+        """Cached state brought up to date with `mesh`, None if stale
+
+        With `refresh` False the label changes are only marked dirty, for
+        the caller to re-evaluate (see DetectionState.refresh).
+        """
+        state = self.states.get(key)
+        edit = self.edits.pop(key, None)
+        if state is None:
+            return None
+        if edit is not None:
+            edit = np.array(sorted(edit), dtype=np.int64)
+
+        old = state.mesh
+        if edit is not None and _carries_over(old, mesh, edit):
+            state.sync_labels(mesh.labels[:old.n_faces])
+            state.update_topology(mesh, edit)
+            self.hashes[key] = mesh.topology_hash()
+        elif (key in self.stale or old.n_verts != mesh.n_verts
+              or old.n_faces != mesh.n_faces
+              or len(old.face_verts) != len(mesh.face_verts)):
+            if mesh.topology_hash() != self.hashes[key]:
+                self.discard(key)
+                return None
+
+        state.mesh.verts = mesh.verts
+        state.sync_labels(mesh.labels)
+        if refresh:
+            state.refresh()
+
+        self.stale.discard(key)
+        self.states.move_to_end(key)
+        return state
+
+    def store(self, key, mesh, state):
+        """Cache a state built on `mesh`, evicting the oldest entries"""
+        self.discard(key)
+        self.states[key] = state
+        self.hashes[key] = mesh.topology_hash()
+        while len(self.states) > self.capacity:
+            self.discard(next(iter(self.states)))
+        return state
+
+    def invalidate(self, key):
+        """Flag an entry whose geometry may have changed"""
+        if key in self.states:
+            self.stale.add(key)
+
+    def edit(self, key, faces):
+        """Record faces changed by a topology edit of a cached mesh
+
+        Vertices and untouched faces must keep their indices, new ones
+        appended (see DetectionState.update_topology).
+        """
+        if key in self.states:
+            self.edits.setdefault(key, set()).update(
+                np.asarray(faces, dtype=np.int64).tolist())
+
+    def discard(self, key):
+        self.states.pop(key, None)
+        self.hashes.pop(key, None)
+        self.stale.discard(key)
+        self.edits.pop(key, None)
+
+    def clear(self):
+        self.states.clear()
+        self.hashes.clear()
+        self.stale.clear()
+        self.edits.clear()
+
+
+def _carries_over(old, mesh, faces):
+    """True when `mesh` only differs from `old` by the given faces
+
+    Faces are never removed; the appended ones need not be listed, they all
+    count as changed (see DetectionState.update_topology).
+    """
+    if mesh.n_verts < old.n_verts or mesh.n_faces < old.n_faces:
+        return False
+
+    keep = np.ones(old.n_faces, dtype=bool)
+    keep[faces[faces < old.n_faces]] = False
+    rows = np.flatnonzero(keep)
+
+    old_sizes = np.diff(old.face_offsets)[rows]
+    new_sizes = np.diff(mesh.face_offsets[:old.n_faces + 1])[rows]
+    if not np.array_equal(old_sizes, new_sizes):
+        return False
+    return np.array_equal(
+        old.face_verts[csr_ranges(old.face_offsets, rows)],
+        mesh.face_verts[csr_ranges(mesh.face_offsets, rows)])
+
+
+def _resize(array, n):
+    if len(array) >= n:
+        return array[:n].copy()
+    return np.concatenate((array, np.zeros(n - len(array), dtype=array.dtype)))
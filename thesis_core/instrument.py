@@ -0,0 +1,148 @@
+"""Named phase timers and counters, with optional cProfile and tracemalloc
+
+Core code reports into the active Profile through phase() and count();
+both are no-ops when no profile is active, so the hooks stay in the hot
+paths for free.
+
+    profile = Profile("detect", cprofile=True, memory=True)
+    with profile:
+        detect_non_manifold(mesh)
+    profile.finish()
+    profile.save("detect.json")
+
+A profile can be entered several times (e.g. once per modal step); its
+phases, counts and profiler stats add up until finish(). Threads working for
+the run (e.g. the thread pool of thesis_core.multi) report into the same
+profile, its updates are made under a lock.
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Profiles entered and not exited yet, innermost last, and the lock of
+# both the stack and the profiles' phases and counts
+_active = []
+_lock = threading.Lock()
+
+
+def _current():
+    with _lock:
+        return _active[-1] if _active else None
+
+
+def count(name, n=1):
+    """Add n to a counter of the active profile"""
+    profile = _current()
+    if profile is not None:
+        profile.count(name, n)
+
+
+@contextmanager
+def phase(name):
+    """Time a block as a phase of the active profile"""
+    profile = _current()
+    if profile is None:
+        yield
+        return
+    with profile.phase(name):
+        yield
+
+
+class Profile:
+    """Phase timings and counters of one run"""
+
+    def __init__(self, name, cprofile=False, memory=False, top=25):
+        self.name = name
+        self.phases = {}
+        self.counts = {}
+        self.seconds = 0.0
+        self.peak_mb = None
+        self.stats = None
+        self.top = top
+
+        self.profiler = cProfile.Profile() if cprofile else None
+        self.memory = memory
+        self._tracing = False
+        self._start = None
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        with _lock:
+            _active.append(self)
+        self._start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.seconds += time.perf_counter() - self._start
+        with _lock:
+            _active.remove(self)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with _lock:
+                entry = self.phases.setdefault(
+                    name, {"seconds": 0.0, "calls": 0})
+                entry["seconds"] += seconds
+                entry["calls"] += 1
+
+    def count(self, name, n=1):
+        with _lock:
+            self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def finish(self):
+        """Stop memory tracing and collect the profiler stats"""
+        if self._tracing:
+            self.peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            self._tracing = False
+
+        if self.profiler is not None:
+            out = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=out)
+            stats.sort_stats("cumulative").print_stats(self.top)
+            self.stats = out.getvalue()
+        return self
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "phases": self.phases,
+            "counts": self.counts,
+            "peak_mb": self.peak_mb,
+            "cprofile": self.stats,
+        }
+
+    def lines(self):
+        """Short text lines, slowest phases first"""
+        lines = [f"{self.name}: {self.seconds:.3f}s"]
+        for name, entry in sorted(self.phases.items(),
+                                  key=lambda item: -item[1]["seconds"]):
+            lines.append(f"{name}: {entry['seconds']:.3f}s"
+                         + (f" x{entry['calls']}" if entry["calls"] > 1 else ""))
+        lines.extend(f"{name}: {n}" for name, n in self.counts.items())
+        if self.peak_mb is not None:
+            lines.append(f"peak memory: {self.peak_mb:.1f} MB")
+        return lines
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
@@ -0,0 +1,331 @@
+"""Optional Numba kernels for the loops that do not vectorize cleanly
+
+The fan component labelling of detection and the bridging path search of
+fix walk small irregular neighbourhoods one face at a time. With Numba
+installed these loops are compiled (nopython, cached on disk) and work
+directly on the CSR incidence arrays; without it the core keeps its NumPy
+and plain Python paths, which give the same results.
+
+The backend is process wide: "auto" (Numba when installed), "numpy" or
+"numba". set_backend() also exports it to THESIS_KERNELS so spawned pool
+workers follow it. warm_up() compiles (or loads from the cache) every
+kernel ahead of the first real call.
+"""
+
+import os
+import time
+import weakref
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+BACKENDS = ("auto", "numpy", "numba")
+ENV = "THESIS_KERNELS"
+
+_backend = os.environ.get(ENV, "auto")
+
+
+def _jit(func):
+    """Compile a kernel when Numba is installed, keep it as Python otherwise"""
+    if numba is None:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+
+def available():
+    return numba is not None
+
+
+def set_backend(name):
+    """Select the kernel backend of this process and its future workers"""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend {name!r}, "
+                         f"expected one of {BACKENDS}")
+    _backend = name
+    os.environ[ENV] = name
+
+
+@contextmanager
+def using(name):
+    """set_backend() for the duration of a block"""
+    previous = _backend
+    set_backend(name)
+    try:
+        yield
+    finally:
+        set_backend(previous)
+
+
+def backend():
+    """Backend in use, "numba" only when Numba is installed"""
+    return "numba" if _backend != "numpy" and available() else "numpy"
+
+
+def enabled():
+    return backend() == "numba"
+
+
+@_jit
+def _find(parent, x):
+    while parent[x] != x:
+        x = parent[x]
+    return x
+
+
+@_jit
+def fan_roots_kernel(vf_offsets, vf_faces, ff_offsets, ff_faces, labels,
+                     vertices):
+    """Fan-local component roots of the incidence nodes of some vertices
+
+    Same contract as topology.local_fan_components: nodes in the vertex ->
+    face CSR order of `vertices`, a root is the smallest local node index of
+    its component.
+    """
+    total = 0
+    for k in range(len(vertices)):
+        v = vertices[k]
+        total += vf_offsets[v + 1] - vf_offsets[v]
+    roots = np.empty(total, dtype=np.int64)
+
+    base = 0
+    for k in range(len(vertices)):
+        v = vertices[k]
+        start = vf_offsets[v]
+        n = vf_offsets[v + 1] - start
+        for i in range(n):
+            roots[base + i] = base + i
+
+        for i in range(n):
+            f = vf_faces[start + i]
+            for e in range(ff_offsets[f], ff_offsets[f + 1]):
+                g = ff_faces[e]
+                if labels[g] != labels[f]:
+                    continue
+                for j in range(n):
+                    if vf_faces[start + j] == g:
+                        # Hook the higher root below the lower one
+                        a = _find(roots, base + i)
+                        b = _find(roots, base + j)
+                        if a < b:
+                            roots[b] = a
+                        elif b < a:
+                            roots[a] = b
+                        break
+
+        for i in range(n):
+            roots[base + i] = _find(roots, base + i)
+        base += n
+
+    return roots
+
+
+@_jit
+def _path_search(source, seeds, region_mark, region, seen_mark, seen, prev,
+                 ff_offsets, ff_faces):
+    """BFS from source inside the marked region, returns the seeds found"""
+    seen_mark[source] = seen
+    prev[source] = source
+    queue = [source]
+    # Typed empty lists: Numba infers the item type from the first append
+    found = [source]
+    found.pop()
+    head = 0
+    while head < len(queue) and len(found) < len(seeds):
+        node = queue[head]
+        head += 1
+        for e in range(ff_offsets[node], ff_offsets[node + 1]):
+            f = ff_faces[e]
+            if region_mark[f] != region or seen_mark[f] == seen:
+                continue
+            seen_mark[f] = seen
+            prev[f] = node
+            queue.append(f)
+            for t in range(len(seeds)):
+                if seeds[t] == f:
+                    found.append(f)
+                    break
+    return found
+
+
+@_jit
+def plan_kernel(vf_offsets, vf_faces, ff_offsets, ff_faces, labels, v, rings,
+                marks, prev, stamp):
+    """Bridging path of one vertex, see fix.plan_vertex
+
+    Returns (fixable, label, faces to relabel). `marks` holds three face
+    stamp arrays (region, seen, path) and `stamp` their running counter,
+    so nothing of mesh size is allocated per call.
+    """
+    start = vf_offsets[v]
+    n = vf_offsets[v + 1] - start
+    fan = vf_faces[start:start + n]
+    empty = np.empty(0, dtype=np.int64)
+
+    # Same-label components of the fan, in fan order
+    comp = np.full(n, -1, dtype=np.int64)
+    first = np.empty(n, dtype=np.int64)
+    queue = np.empty(n, dtype=np.int64)
+    n_comps = 0
+    for i in range(n):
+        if comp[i] >= 0:
+            continue
+        comp[i] = n_comps
+        first[n_comps] = fan[i]
+        head = 0
+        tail = 1
+        queue[0] = i
+        while head < tail:
+            f = fan[queue[head]]
+            head += 1
+            for e in range(ff_offsets[f], ff_offsets[f + 1]):
+                g = ff_faces[e]
+                if labels[g] != labels[f]:
+                    continue
+                for j in range(n):
+                    if fan[j] == g:
+                        if comp[j] < 0:
+                            comp[j] = n_comps
+                            queue[tail] = j
+                            tail += 1
+                        break
+        n_comps += 1
+
+    # Components per label, labels in order of first appearance
+    uniq = np.empty(n_comps, dtype=np.int64)
+    counts = np.zeros(n_comps, dtype=np.int64)
+    n_labels = 0
+    for c in range(n_comps):
+        label = np.int64(labels[first[c]])
+        k = 0
+        while k < n_labels and uniq[k] != label:
+            k += 1
+        if k == n_labels:
+            uniq[k] = label
+            n_labels += 1
+        counts[k] += 1
+    if n_labels >= n_comps:
+        return False, np.int64(0), empty
+
+    best = 0
+    for k in range(1, n_labels):
+        if counts[k] > counts[best]:
+            best = k
+    most = uniq[best]
+
+    seeds = np.empty(counts[best], dtype=np.int64)
+    n_seeds = 0
+    for c in range(n_comps):
+        if labels[first[c]] == most:
+            seeds[n_seeds] = first[c]
+            n_seeds += 1
+    source = seeds[0]
+    targets = seeds[1:]
+
+    # Search the fan, then the fan grown ring by ring
+    region_mark, seen_mark, path_mark = marks[0], marks[1], marks[2]
+    stamp[0] += 1
+    region = stamp[0]
+    members = [source]
+    members.pop()
+    for i in range(n):
+        region_mark[fan[i]] = region
+        members.append(fan[i])
+
+    stamp[0] += 1
+    found = _path_search(source, targets, region_mark, region, seen_mark,
+                         stamp[0], prev, ff_offsets, ff_faces)
+    for _ in range(rings):
+        if len(found) == len(targets):
+            break
+        grown = members.copy()
+        for f in members:
+            for e in range(ff_offsets[f], ff_offsets[f + 1]):
+                g = ff_faces[e]
+                if region_mark[g] != region:
+                    region_mark[g] = region
+                    grown.append(g)
+        members = grown
+        stamp[0] += 1
+        found = _path_search(source, targets, region_mark, region, seen_mark,
+                             stamp[0], prev, ff_offsets, ff_faces)
+
+    # Faces on the way back from every seed found, not labeled `most` yet
+    stamp[0] += 1
+    path = stamp[0]
+    path_mark[source] = path
+    changed = [source]
+    changed.pop()
+    if labels[source] != most:
+        changed.append(source)
+    for f in found:
+        while path_mark[f] != path:
+            path_mark[f] = path
+            if labels[f] != most:
+                changed.append(f)
+            f = prev[f]
+
+    out = np.empty(len(changed), dtype=np.int64)
+    for i in range(len(changed)):
+        out[i] = changed[i]
+    return True, most, out
+
+
+# Face stamp arrays of the topologies planned on, freed with them
+_scratch = weakref.WeakKeyDictionary()
+
+
+def fan_roots(topo, vertices, labels):
+    """local_fan_components() through the compiled kernel"""
+    return fan_roots_kernel(topo.vf_offsets, topo.vf_faces, topo.ff_offsets,
+                            topo.ff_faces, labels,
+                            np.asarray(vertices, dtype=np.int64))
+
+
+def plan_vertex(v, labels, topo, rings=2):
+    """fix.plan_vertex() through the compiled kernel"""
+    scratch = _scratch.get(topo)
+    if scratch is None:
+        scratch = _scratch[topo] = (
+            np.zeros((3, max(topo.n_faces, 1)), dtype=np.int64),
+            np.zeros(max(topo.n_faces, 1), dtype=np.int64),
+            np.zeros(1, dtype=np.int64))
+    marks, prev, stamp = scratch
+
+    fixable, label, changed = plan_kernel(
+        topo.vf_offsets, topo.vf_faces, topo.ff_offsets, topo.ff_faces,
+        labels, int(v), int(rings), marks, prev, stamp)
+    if not fixable:
+        return None
+    return labels.dtype.type(label), changed.tolist()
+
+
+def warm_up():
+    """Compile or load every kernel on a tiny mesh, returns the seconds
+
+    Kernels are compiled per argument types, the common index and label
+    dtypes are covered. A no-op without Numba.
+    """
+    if not available():
+        return 0.0
+
+    from .mesh import LabeledMesh
+    from .topology import Topology
+
+    start = time.perf_counter()
+    # Four triangles around a vertex, alternating labels: non manifold
+    verts = np.zeros((5, 3), dtype=np.float32)
+    faces = [[0, 1, 2], [0, 2, 3], [0, 3, 4], [0, 4, 1]]
+    for dtype in (np.int32, np.int64, np.uint8, np.uint16):
+        mesh = LabeledMesh.from_faces(verts, faces, [0, 1, 0, 1])
+        mesh.labels = mesh.labels.astype(dtype)
+        topo = Topology(mesh)
+        fan_roots(topo, np.arange(mesh.n_verts), mesh.labels)
+        plan_vertex(0, mesh.labels, topo)
+    return time.perf_counter() - start
@@ -0,0 +1,154 @@
+"""Face labeling schemes
+
+A labeling is a vectorized function of the (n, 3) face centers returning
+one integer label per face. label_faces() computes the centers once and
+applies any labeling to them; SCHEMES names the built-in ones.
+
+    labels = label_faces(mesh, kmeans, n_labels=8, seed=0)
+    labels = label_faces(mesh, lambda c: (c[:, 2] > 0).astype(int))
+"""
+
+import numpy as np
+
+
+NEAREST_BLOCK = 1 << 16
+KMEANS_SAMPLE = 1 << 16
+
+
+def face_centroids(mesh):
+    """Median center of every face"""
+    sizes = np.diff(mesh.face_offsets)
+    if not len(sizes) or sizes.min() == 0:
+        face = np.repeat(np.arange(mesh.n_faces), sizes)
+        corners = mesh.verts[mesh.face_verts]
+        sums = np.stack([np.bincount(face, weights=corners[:, k],
+                                     minlength=mesh.n_faces)
+                         for k in range(3)], axis=1)
+    else:
+        # Summed in the vertex precision, faces only have a few corners
+        sums = np.add.reduceat(mesh.verts[mesh.face_verts],
+                               mesh.face_offsets[:-1], axis=0)
+    return sums / np.maximum(sizes, 1)[:, None]
+
+
+def transform(points, matrix):
+    """Points through a 4x4 affine matrix (e.g. an object's matrix_world)"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def label_faces(mesh, labeling, matrix=None, **params):
+    """Labels of a vectorized labeling function applied to the face centers
+
+    matrix, when given, moves the centers to world space first.
+    """
+    centers = face_centroids(mesh)
+    if matrix is not None:
+        centers = transform(centers, matrix)
+    labels = np.asarray(labeling(centers, **params))
+    if labels.shape != (mesh.n_faces,):
+        raise ValueError(f"labeling returned shape {labels.shape}, "
+                         f"expected ({mesh.n_faces},)")
+    return labels.astype(np.int32)
+
+
+def nearest_site(points, sites, block=NEAREST_BLOCK):
+    """Index of the nearest site of every point, in blocks of points"""
+    sites = np.asarray(sites, dtype=np.float64)
+    site_norms = (sites * sites).sum(axis=1)
+    nearest = np.empty(len(points), dtype=np.int32)
+    for start in range(0, len(points), block):
+        chunk = points[start:start + block]
+        # |p - s|^2 without the |p|^2 term, constant along each row
+        dist = site_norms - 2.0 * (chunk @ sites.T)
+        nearest[start:start + block] = dist.argmin(axis=1)
+    return nearest
+
+
+def pick_sites(centers, n_sites, seed=None):
+    """n_sites distinct face centers drawn at random"""
+    rng = np.random.default_rng(seed)
+    n_sites = min(n_sites, len(centers))
+    return centers[rng.choice(len(centers), n_sites, replace=False)]
+
+
+# Built-in labelings
+
+
+def octant(centers):
+    """Octant holding each center: bit 0 is x > 0, 1 is y > 0, 2 is z > 0"""
+    bits = (centers > 0).astype(np.int32)
+    return bits[:, 0] + 2 * bits[:, 1] + 4 * bits[:, 2]
+
+
+def uniform(centers, n_labels=8, seed=None):
+    """Uniform random label per face"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, n_labels, len(centers))
+
+
+def slabs(centers, n_labels=8, axis=2):
+    """Equal width slabs along an axis index or a direction vector"""
+    if np.ndim(axis) == 0:
+        height = centers[:, axis]
+    else:
+        direction = np.asarray(axis, dtype=np.float64)
+        height = centers @ (direction / np.linalg.norm(direction))
+    if not len(height):
+        return np.zeros(0, dtype=np.int32)
+
+    lo, hi = height.min(), height.max()
+    width = (hi - lo) / n_labels if hi > lo else 1.0
+    return np.clip(((height - lo) / width).astype(np.int32), 0, n_labels - 1)
+
+
+def voronoi(centers, n_labels=8, seed=None, sites=None):
+    """Nearest of the given sites, or of n_labels random face centers"""
+    if not len(centers):
+        return np.zeros(0, dtype=np.int32)
+    if sites is None:
+        sites = pick_sites(centers, n_labels, seed)
+    return nearest_site(centers, sites)
+
+
+def kmeans(centers, n_labels=8, seed=None, iterations=20,
+           sample=KMEANS_SAMPLE):
+    """Lloyd's k-means clusters of the face centers
+
+    Sites are fitted on at most `sample` random centers, then every face
+    takes its nearest site.
+    """
+    if not len(centers):
+        return np.zeros(0, dtype=np.int32)
+
+    rng = np.random.default_rng(seed)
+    points = centers
+    if len(centers) > sample:
+        points = centers[rng.choice(len(centers), sample, replace=False)]
+
+    sites = pick_sites(points, n_labels, rng)
+    labels = nearest_site(points, sites)
+    for _ in range(iterations):
+        counts = np.bincount(labels, minlength=len(sites))
+        sums = np.stack([np.bincount(labels, weights=points[:, k],
+                                     minlength=len(sites)) for k in range(3)],
+                        axis=1)
+        # An emptied cluster keeps its site
+        filled = counts > 0
+        sites[filled] = sums[filled] / counts[filled, None]
+
+        new = nearest_site(points, sites)
+        if np.array_equal(new, labels):
+            break
+        labels = new
+
+    return labels if points is centers else nearest_site(centers, sites)
+
+
+SCHEMES = {
+    "octant": octant,
+    "random": uniform,
+    "slabs": slabs,
+    "kmeans": kmeans,
+    "voronoi": voronoi,
+}
@@ -0,0 +1,124 @@
+"""Labeled surface mesh stored as plain arrays, with an OBJ front end"""
+
+import hashlib
+
+import numpy as np
+
+from .obj import BLOCK_BYTES, read_obj
+
+
+class LabeledMesh:
+    """Polygon mesh with one label (material index) per face
+
+    verts: (n_verts, 3) float32 coordinates
+    face_offsets: (n_faces + 1,) int64 CSR offsets into face_verts
+    face_verts: (n_loops,) int32 vertex index of every face corner
+    labels: (n_faces,) int32 label of every face
+    materials: optional material names, labels index into it
+    groups: optional face groups, name -> sorted face indices
+    """
+
+    def __init__(self, verts, face_offsets, face_verts, labels=None,
+                 materials=None, groups=None):
+        self.verts = np.ascontiguousarray(
+            verts, dtype=np.float32).reshape(-1, 3)
+        self.face_offsets = np.ascontiguousarray(face_offsets, dtype=np.int64)
+        self.face_verts = np.ascontiguousarray(face_verts, dtype=np.int32)
+
+        if labels is None:
+            labels = np.zeros(len(self.face_offsets) - 1, dtype=np.int32)
+        self.labels = np.ascontiguousarray(labels, dtype=np.int32)
+        self.materials = list(materials) if materials is not None else []
+        self.groups = dict(groups) if groups is not None else {}
+
+    @classmethod
+    def from_faces(cls, verts, faces, labels=None, materials=None):
+        """Build from a list of per-face vertex index lists"""
+        sizes = np.fromiter((len(f) for f in faces), dtype=np.int64,
+                            count=len(faces))
+        face_offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=face_offsets[1:])
+        face_verts = np.fromiter((v for f in faces for v in f),
+                                 dtype=np.int32, count=int(face_offsets[-1]))
+
+        return cls(verts, face_offsets, face_verts, labels, materials)
+
+    @property
+    def n_verts(self):
+        return len(self.verts)
+
+    @property
+    def n_faces(self):
+        return len(self.face_offsets) - 1
+
+    def faces(self):
+        """Per-face vertex index lists"""
+        return [self.face_verts[self.face_offsets[i]:self.face_offsets[i + 1]]
+                .tolist() for i in range(self.n_faces)]
+
+    def same_topology(self, other):
+        """True when both meshes have the same vertices count and faces"""
+        return (self.n_verts == other.n_verts
+                and np.array_equal(self.face_offsets, other.face_offsets)
+                and np.array_equal(self.face_verts, other.face_verts))
+
+    def topology_hash(self):
+        """Digest of the vertex count and the faces, labels excluded"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.int64(self.n_verts).tobytes())
+        digest.update(np.ascontiguousarray(self.face_offsets).data)
+        digest.update(np.ascontiguousarray(self.face_verts).data)
+        return digest.hexdigest()
+
+    def copy(self):
+        return LabeledMesh(self.verts.copy(), self.face_offsets.copy(),
+                           self.face_verts.copy(), self.labels.copy(),
+                           self.materials,
+                           {name: faces.copy()
+                            for name, faces in self.groups.items()})
+
+    def __repr__(self):
+        return (f"LabeledMesh(verts={self.n_verts}, faces={self.n_faces}, "
+                f"labels={len(np.unique(self.labels))})")
+
+
+def load_obj(path, block_bytes=BLOCK_BYTES):
+    """Load an OBJ file, faces get the index of their usemtl material
+
+    Faces before the first usemtl get label 0. Materials are numbered in
+    order of first use, as Blender's importer fills the material slots;
+    g groups become `groups`. The file is parsed in vectorized blocks of
+    about block_bytes bytes.
+    """
+    (verts, face_offsets, face_verts, labels,
+     materials, groups) = read_obj(path, block_bytes)
+    return LabeledMesh(verts, face_offsets, face_verts, labels, materials,
+                       groups)
+
+
+def save_obj(mesh, path):
+    """Write a LabeledMesh as OBJ, faces grouped by usemtl in face order
+
+    Labels past the material names are written as label_<n>. Every name is
+    declared once up front in label order, so load_obj (and Blender's
+    importer) give the faces back the same labels.
+    """
+    n_labels = int(mesh.labels.max()) + 1 if mesh.n_faces else 0
+    names = list(mesh.materials[:n_labels])
+    names += [f"label_{i}" for i in range(len(names), n_labels)]
+
+    face_verts = (mesh.face_verts.astype(np.int64) + 1).astype(str).tolist()
+    offsets = mesh.face_offsets.tolist()
+    labels = mesh.labels.tolist()
+
+    with open(path, "w") as f:
+        np.savetxt(f, mesh.verts, fmt="v %.6f %.6f %.6f")
+        f.writelines(f"usemtl {name}\n" for name in names)
+
+        current = None
+        for i, label in enumerate(labels):
+            if label != current:
+                f.write(f"usemtl {names[label]}\n")
+                current = label
+            f.write("f " + " ".join(face_verts[offsets[i]:offsets[i + 1]])
+                    + "\n")
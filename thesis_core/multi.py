@@ -0,0 +1,127 @@
+"""Run the core on many meshes at once
+
+Scenes made of many separately labeled meshes are processed as one batch,
+one task per mesh. Meshes large enough to pay for the start-up go to a
+process pool, smaller ones to a thread pool (most of the array work runs
+in NumPy outside the GIL). Tasks are named so spawned workers resolve them
+from their own import of the core, and meshes are sent to them as plain
+arrays (a LabeledMesh pickles by its module path, inside Blender one of the
+addon, which workers cannot import without bpy):
+
+    for i, mask in iter_map_meshes("detect", meshes, workers=8):
+        ...
+"""
+
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from .detect import detect_non_manifold
+from .fix import converge_non_manifold, fix_non_manifold
+from .instrument import count
+from .labels import SCHEMES, label_faces
+from .mesh import LabeledMesh
+from .parallel import MIN_PARALLEL_VERTS, worker_count, worker_module
+
+
+def detect_task(mesh):
+    """Boolean mask of the non manifold vertices"""
+    return detect_non_manifold(mesh)
+
+
+def label_task(mesh, scheme, matrix=None, **params):
+    """Face labels of a SCHEMES scheme, by name"""
+    return label_faces(mesh, SCHEMES[scheme], matrix, **params)
+
+
+def fix_task(mesh, vertices, rings=2, converge=False, budget=None):
+    """New labels and, when fixing until converged, its Convergence"""
+    if converge:
+        return converge_non_manifold(mesh, vertices, rings=rings,
+                                     budget=budget)
+    return fix_non_manifold(mesh, vertices, rings=rings), None
+
+
+TASKS = {
+    "detect": detect_task,
+    "label": label_task,
+    "fix": fix_task,
+}
+
+
+def run_task(name, mesh, args=(), params=None):
+    """Worker: run a named task on one mesh"""
+    return TASKS[name](mesh, *args, **(params or {}))
+
+
+def mesh_arrays(mesh):
+    """(verts, face_offsets, face_verts, labels) of a mesh, for run_arrays"""
+    return mesh.verts, mesh.face_offsets, mesh.face_verts, mesh.labels
+
+
+def run_arrays(name, arrays, args=(), params=None):
+    """Worker: run a named task on a mesh sent as mesh_arrays()"""
+    return run_task(name, LabeledMesh(*arrays), args, params)
+
+
+def iter_map_meshes(name, meshes, args=None, params=None, workers=None):
+    """(index, result) of a named task run on every mesh, as they complete
+
+    `args` holds the extra positional arguments of every mesh, `params` the
+    keyword arguments shared by all. A process pool is used when the meshes
+    hold MIN_PARALLEL_VERTS vertices in total and can be started, a thread
+    pool otherwise; one worker or one mesh runs serially, in order.
+    """
+    args = args if args is not None else [()] * len(meshes)
+    workers = min(worker_count(workers), max(len(meshes), 1))
+    count("meshes", len(meshes))
+
+    done = set()
+    if workers > 1 and sum(m.n_verts for m in meshes) >= MIN_PARALLEL_VERTS:
+        task = worker_module("multi").run_arrays
+        try:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=get_context("spawn")) as pool:
+                yield from _completed(pool, task, name,
+                                      [mesh_arrays(m) for m in meshes],
+                                      args, params, done)
+            return
+        except (OSError, BrokenProcessPool):
+            pass
+
+    if workers > 1 and len(done) < len(meshes):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from _completed(pool, run_task, name, meshes, args, params,
+                                  done)
+        return
+
+    for i, mesh in enumerate(meshes):
+        if i not in done:
+            yield i, run_task(name, mesh, args[i], params)
+
+
+def _completed(pool, task, name, meshes, args, params, done):
+    futures = {pool.submit(task, name, mesh, args[i], params): i
+               for i, mesh in enumerate(meshes) if i not in done}
+    try:
+        for future in as_completed(futures):
+            i = futures[future]
+            result = future.result()
+            done.add(i)
+            yield i, result
+    finally:
+        # Stopped early: drop the tasks not started yet
+        for future in futures:
+            future.cancel()
+
+
+def map_meshes(name, meshes, args=None, params=None, workers=None):
+    """Results of a named task run on every mesh, in mesh order"""
+    results = [None] * len(meshes)
+    for i, result in iter_map_meshes(name, meshes, args, params, workers):
+        results[i] = result
+    return results
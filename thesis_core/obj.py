@@ -0,0 +1,242 @@
+"""Vectorized OBJ reader: v, f, usemtl and g lines parsed in bulk
+
+A block of lines is handled as one byte array: the lines are classified by
+their first bytes, the v and f lines are gathered with byte masks and
+parsed by NumPy's text parser, and faces get their usemtl material and g
+group from the position of those lines. Only the usemtl and g lines, a
+handful per file, are read one by one.
+
+Blocks are cut at line ends and keep the reading state (vertex count,
+current material and group), so any file size can be streamed block by
+block with iter_obj(), or read whole with read_obj().
+"""
+
+import numpy as np
+
+
+BLOCK_BYTES = 1 << 25
+
+NEWLINE = ord("\n")
+SLASH = ord("/")
+HASH = ord("#")
+
+
+class ObjState:
+    """Reading state carried from one block to the next"""
+
+    def __init__(self):
+        self.n_verts = 0
+        self.materials = {}
+        self.label = 0
+        self.groups = []
+        self.group = -1
+
+
+class ObjBlock:
+    """Vertices and faces of one block of lines
+
+    verts: (n, 3) float32 positions
+    sizes: (n_faces,) corners per face
+    face_verts: (n_loops,) int64 0-based vertex indices, negative (relative)
+        OBJ indices resolved
+    labels: (n_faces,) int32 usemtl material index, 0 before the first one
+    face_groups: (n_faces,) int32 index of the g line of every face, -1
+        before the first one
+    """
+
+    def __init__(self, verts, sizes, face_verts, labels, face_groups):
+        self.verts = verts
+        self.sizes = sizes
+        self.face_verts = face_verts
+        self.labels = labels
+        self.face_groups = face_groups
+
+
+def _gather_lines(buf, line_mask, line_sizes):
+    """Bytes of the masked lines, newlines included"""
+    return buf[np.repeat(line_mask, line_sizes)]
+
+
+def _space(buf):
+    """Whitespace (and control) bytes"""
+    return buf <= ord(" ")
+
+
+def _blank_corner_tails(buf):
+    """Blank the /texture/normal part of every face corner, in place"""
+    text = ~_space(buf)
+    tail = buf == SLASH
+    # Grow every tail up to the end of its corner, a few bytes long
+    while True:
+        grow = tail[:-1] & text[1:] & ~tail[1:]
+        if not grow.any():
+            break
+        tail[1:] |= grow
+    buf[tail] = ord(" ")
+
+
+def _blank_comments(buf, ends):
+    """Blank every # and the rest of its line, in place; True if any"""
+    hashes = np.flatnonzero(buf == HASH)
+    if not len(hashes):
+        return False
+    lines = np.searchsorted(ends, hashes)
+    first = np.ones(len(hashes), dtype=bool)
+    first[1:] = lines[1:] != lines[:-1]
+    hashes = hashes[first]
+    sizes = ends[lines[first]] - hashes
+    start = np.cumsum(sizes) - sizes
+    buf[np.arange(sizes.sum()) + np.repeat(hashes - start, sizes)] = ord(" ")
+    return True
+
+
+def _tokens_per_line(buf):
+    """Whitespace separated tokens of every newline terminated line"""
+    space = _space(buf)
+    start = ~space
+    start[1:] &= space[:-1]
+    before = np.searchsorted(np.flatnonzero(start),
+                             np.flatnonzero(buf == NEWLINE))
+    return np.diff(before, prepend=0)
+
+
+def _names(data, starts, ends, skip):
+    """Text after the keyword of some lines, stripped"""
+    return [data[s + skip:e].decode("utf-8", "replace").strip()
+            for s, e in zip(starts.tolist(), ends.tolist())]
+
+
+def parse_block(data, state, verts=True, faces=True):
+    """ObjBlock of some complete lines of an OBJ file, updating the state
+
+    verts / faces False skip parsing those, the block then holds none but
+    the state still counts them.
+    """
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    buf = np.frombuffer(data, dtype=np.uint8).copy()
+
+    ends = np.flatnonzero(buf == NEWLINE)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    line_sizes = ends - starts + 1
+    first = buf[starts]
+    second = buf[np.minimum(starts + 1, ends)]
+    keyword_end = _space(second)
+
+    is_v = (first == ord("v")) & keyword_end
+    is_f = (first == ord("f")) & keyword_end
+    is_g = (first == ord("g")) & keyword_end
+    is_usemtl = first == ord("u")
+    is_usemtl[is_usemtl] = [data.startswith(b"usemtl", s)
+                            for s in starts[is_usemtl].tolist()]
+
+    # Blank the comments and the keywords, the gathered lines then hold
+    # only numbers
+    if _blank_comments(buf, ends):
+        data = buf.tobytes()
+    buf[starts[is_v]] = ord(" ")
+    buf[starts[is_f]] = ord(" ")
+
+    v_lines = np.flatnonzero(is_v)
+    coords = np.empty((0, 3), dtype=np.float32)
+    if verts and len(v_lines):
+        text = _gather_lines(buf, is_v, line_sizes)
+        values = np.fromstring(text.tobytes(), dtype=np.float64, sep=" ")
+        if len(values) != 3 * len(v_lines):
+            # w or vertex colors: keep the first three numbers of each line
+            counts = _tokens_per_line(text)
+            line_start = np.cumsum(counts) - counts
+            values = values[(line_start[:, None] + np.arange(3)).ravel()]
+        coords = values.reshape(-1, 3).astype(np.float32)
+
+    f_lines = np.flatnonzero(is_f) if faces else np.empty(0, dtype=np.int64)
+    sizes = np.empty(0, dtype=np.int64)
+    face_verts = np.empty(0, dtype=np.int64)
+    if len(f_lines):
+        corners = _gather_lines(buf, is_f, line_sizes)
+        _blank_corner_tails(corners)
+        sizes = _tokens_per_line(corners)
+        index = np.fromstring(corners.tobytes(), dtype=np.int64, sep=" ")
+
+        # Negative indices count back from the vertices read so far
+        before = state.n_verts + np.searchsorted(v_lines, f_lines)
+        before = np.repeat(before, sizes)
+        face_verts = np.where(index > 0, index - 1, before + index)
+
+    # Material and group of every face, from the last usemtl / g line
+    materials = [state.materials.setdefault(name, len(state.materials))
+                 for name in _names(data, starts[is_usemtl],
+                                    ends[is_usemtl], 6)]
+    labels = _last_before(f_lines, np.flatnonzero(is_usemtl),
+                          [state.label] + materials)
+    state.label = (materials or [state.label])[-1]
+
+    names = _names(data, starts[is_g], ends[is_g], 1)
+    groups = list(range(len(state.groups), len(state.groups) + len(names)))
+    face_groups = _last_before(f_lines, np.flatnonzero(is_g),
+                               [state.group] + groups)
+    state.groups.extend(tuple(name.split()) for name in names)
+    state.group = (groups or [state.group])[-1]
+
+    state.n_verts += len(v_lines)
+    return ObjBlock(coords, sizes, face_verts, labels, face_groups)
+
+
+def _last_before(lines, key_lines, values):
+    """values[k + 1] for the lines after the k-th key line, values[0] before"""
+    values = np.asarray(values, dtype=np.int32)
+    return values[np.searchsorted(key_lines, lines)]
+
+
+def iter_obj(path, block_bytes=BLOCK_BYTES, state=None, verts=True,
+             faces=True):
+    """ObjBlocks of about block_bytes bytes of whole lines, in file order"""
+    state = state if state is not None else ObjState()
+    rest = b""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(block_bytes)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                rest = data
+                continue
+            rest = data[cut:]
+            yield parse_block(data[:cut], state, verts, faces)
+    if rest.strip():
+        yield parse_block(rest, state, verts, faces)
+
+
+def read_obj(path, block_bytes=BLOCK_BYTES):
+    """Whole OBJ file as (verts, face_offsets, face_verts, labels,
+    materials, groups)
+
+    Materials are numbered in order of first use. groups maps every g name
+    to the sorted faces under it.
+    """
+    state = ObjState()
+    blocks = list(iter_obj(path, block_bytes, state))
+
+    def join(name, dtype, empty_shape=(0,)):
+        parts = [getattr(b, name) for b in blocks]
+        return (np.concatenate(parts).astype(dtype, copy=False) if parts
+                else np.empty(empty_shape, dtype=dtype))
+
+    verts = join("verts", np.float32, (0, 3))
+    sizes = join("sizes", np.int64)
+    face_offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=face_offsets[1:])
+    face_groups = join("face_groups", np.int32)
+
+    groups = {}
+    for line, names in enumerate(state.groups):
+        for name in names:
+            groups.setdefault(name, []).append(line)
+    groups = {name: np.flatnonzero(np.isin(face_groups, lines))
+              for name, lines in groups.items()}
+
+    return (verts, face_offsets, join("face_verts", np.int32),
+            join("labels", np.int32), list(state.materials),
+            {name: faces for name, faces in groups.items() if len(faces)})
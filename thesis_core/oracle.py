@@ -0,0 +1,170 @@
+"""Frozen reference implementation of the thesis detect and fix
+
+This is the breadth first search of the original Detect and Fix operators,
+ported from BMesh to plain Python lists and kept as is: the definition every
+faster engine must match (see thesis_core.fuzz). Do not optimize it.
+
+BMesh is stood in for by:
+
+    v.link_faces    faces using the vertex, in face index order
+    f.edges         the edges of the face, in corner order
+    e.link_faces    faces using the edge, in face index order
+
+Faces must have distinct vertices and no two faces the same vertex set, as
+BMesh enforces. The original Fix joined the components with Blender's
+shortest path select; the reference walks the fan (then the fan grown ring
+by ring) breadth first instead, neighbours in face index order, as the core
+defines the bridging path.
+"""
+
+import operator
+
+
+class ReferenceMesh:
+    """Faces, labels and the BMesh-like incidence the searches walk"""
+
+    def __init__(self, n_verts, faces, labels):
+        self.n_verts = n_verts
+        self.faces = [list(f) for f in faces]
+        self.labels = list(labels)
+
+        self.edge_faces = {}
+        self.face_edges = []
+        for fi, fv in enumerate(self.faces):
+            edges = []
+            for i in range(len(fv)):
+                e = frozenset((fv[i], fv[(i + 1) % len(fv)]))
+                if e not in edges:
+                    edges.append(e)
+                    self.edge_faces.setdefault(e, []).append(fi)
+            self.face_edges.append(edges)
+
+        self.link_faces = [[] for _ in range(n_verts)]
+        for fi, fv in enumerate(self.faces):
+            for v in dict.fromkeys(fv):
+                self.link_faces[v].append(fi)
+
+    @classmethod
+    def from_mesh(cls, mesh, labels=None):
+        """From a LabeledMesh (its labels unless others are given)"""
+        labels = mesh.labels if labels is None else labels
+        return cls(mesh.n_verts, mesh.faces(), [int(l) for l in labels])
+
+    def neighbours(self, node):
+        """Faces sharing an edge with a face, in face index order"""
+        found = set()
+        for e in self.face_edges[node]:
+            found.update(self.edge_faces[e])
+        found.discard(node)
+        return sorted(found)
+
+
+def fan_components(ref, poly_fan, labels):
+    """Same-label components of a fan, breadth first as the operators did"""
+    comps = []
+    for p in poly_fan:
+        flag = False
+        for c in comps:
+            if p in c:
+                flag = True
+        if not flag:
+            visited = []
+            queue = [p]
+
+            while queue:  # select adj faces
+                node = queue.pop(0)
+                label = labels[node]
+                if node not in visited:
+                    visited.append(node)
+                    neighbours = []
+                    for e in ref.face_edges[node]:
+                        for f in ref.edge_faces[e]:
+                            if f in poly_fan and labels[f] == label and f not in neighbours and f not in visited:
+                                neighbours.append(f)
+                        for neighbour in neighbours:
+                            queue.append(neighbour)
+
+            comps.append(visited)
+    return comps
+
+
+def detect(ref):
+    """Non manifold flag of every vertex, as a list of bools"""
+    selected = [False] * ref.n_verts
+    for v in range(ref.n_verts):
+        poly_fan = ref.link_faces[v]
+        labels = {}
+        for poly in poly_fan:
+            if ref.labels[poly] not in labels:
+                labels[ref.labels[poly]] = 1
+            else:
+                labels[ref.labels[poly]] += 1
+
+        if len(labels) > 1:  # vertex has only 1 label polys -> MANIFOLD 100%
+            comps = fan_components(ref, poly_fan, ref.labels)
+            if len(labels) < len(comps):
+                selected[v] = True
+    return selected
+
+
+def bridging_path(ref, source, targets, region):
+    """Faces on the breadth first paths from source to targets in region
+
+    Returns the path faces and whether every target was reached.
+    """
+    targets = [t for t in targets if t != source]
+    prev = {source: source}
+    queue = [source]
+    found = []
+    while queue and len(found) < len(targets):
+        node = queue.pop(0)
+        for f in ref.neighbours(node):
+            if f in region and f not in prev:
+                prev[f] = node
+                queue.append(f)
+                if f in targets:
+                    found.append(f)
+
+    path = [source]
+    for f in found:
+        while f not in path:
+            path.append(f)
+            f = prev[f]
+    return path, len(found) == len(targets)
+
+
+def fix(ref, vertices, rings=2):
+    """Labels after fixing the given vertices in order, as a new list"""
+    labels = list(ref.labels)
+    for v in vertices:
+        poly_fan = ref.link_faces[v]
+        comps = fan_components(ref, poly_fan, labels)
+
+        counts = {}
+        for c in comps:
+            if labels[c[0]] not in counts:
+                counts[labels[c[0]]] = 1
+            else:
+                counts[labels[c[0]]] += 1
+
+        if len(counts) < len(comps):
+            most_labels = max(counts.items(), key=operator.itemgetter(1))[0]
+            seeds = [c[0] for c in comps if labels[c[0]] == most_labels]
+
+            region = list(poly_fan)
+            path, complete = bridging_path(ref, seeds[0], seeds[1:], region)
+            for _ in range(rings):
+                if complete:
+                    break
+                grown = list(region)
+                for f in region:
+                    for g in ref.neighbours(f):
+                        if g not in grown:
+                            grown.append(g)
+                region = grown
+                path, complete = bridging_path(ref, seeds[0], seeds[1:],
+                                               region)
+
+            for f in path:
+                labels[f] = most_labels
+    return labels
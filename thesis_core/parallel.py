@@ -0,0 +1,179 @@
+"""Multi-process detection over vertex partitions
+
+Every vertex only reads its own fan, so vertices are split into ranges of
+similar fan size and their fan components are computed in a process pool.
+The topology and label arrays are placed in shared memory once, workers
+attach to them instead of receiving pickled copies and write the component
+roots of their nodes into a shared output array.
+"""
+
+import importlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from .components import LabelComponents
+from .instrument import phase
+from .topology import Topology, local_fan_components
+
+
+# Below this many vertices the pool start-up costs more than it saves
+MIN_PARALLEL_VERTS = 200_000
+
+
+def worker_count(workers=None):
+    """Resolve a worker setting, 0 or None meaning every core"""
+    if not workers:
+        workers = os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+class SharedArrays:
+    """NumPy arrays copied into named shared memory blocks"""
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.spec = {}
+        self.arrays = {}
+
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                block = shared_memory.SharedMemory(
+                    create=True, size=max(array.nbytes, 1))
+                self.blocks.append(block)
+                view = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+                view[...] = array
+                self.arrays[name] = view
+                self.spec[name] = (block.name, array.shape, array.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec):
+    """Open shared arrays from a SharedArrays spec, returns (arrays, blocks)"""
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+    return arrays, blocks
+
+
+def fan_roots_chunk(spec, n_verts, n_faces, start, stop):
+    """Worker: fan component roots of the nodes of vertices [start, stop)"""
+    arrays, blocks = attach(spec)
+    try:
+        topo = Topology.from_arrays(
+            n_verts, n_faces,
+            arrays["vf_offsets"], arrays["vf_faces"],
+            arrays["ff_offsets"], arrays["ff_faces"])
+        first, last = topo.vf_offsets[start], topo.vf_offsets[stop]
+        roots = local_fan_components(
+            topo, np.arange(start, stop), arrays["labels"])
+        arrays["node_root"][first:last] = roots + first
+        # Drop the views before closing the blocks they point into
+        del topo, arrays
+    finally:
+        for block in blocks:
+            block.close()
+    return stop - start
+
+
+def partition(vf_offsets, n_chunks):
+    """Vertex ranges holding about the same number of fan faces each"""
+    total = vf_offsets[-1]
+    bounds = np.searchsorted(
+        vf_offsets, np.linspace(0, total, n_chunks + 1)[1:-1])
+    bounds = np.unique(np.concatenate(([0], bounds, [len(vf_offsets) - 1])))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def worker_module(name="parallel"):
+    """A core module importable by its top level name in spawned workers
+
+    Inside Blender the core is a subpackage of the addon, whose __init__
+    needs bpy. Workers run plain Python, so they import thesis_core from
+    the addon directory instead.
+    """
+    root = str(Path(__file__).resolve().parent.parent)
+    if root not in sys.path:
+        sys.path.append(root)
+    return importlib.import_module(f"thesis_core.{name}")
+
+
+def label_components(mesh, workers=None, topology=None,
+                     chunks_per_worker=4, min_verts=MIN_PARALLEL_VERTS):
+    """LabelComponents of a mesh, fan components computed in a process pool
+
+    Falls back to a serial run for one worker, meshes under `min_verts`
+    vertices or when no process pool can be started.
+    """
+    if topology is None:
+        with phase("topology"):
+            topology = Topology(mesh)
+    topo = topology
+    workers = worker_count(workers)
+
+    if workers > 1 and mesh.n_verts >= min_verts:
+        try:
+            with phase("process pool"):
+                node_root = _fan_roots_pool(
+                    mesh, topo, workers, chunks_per_worker)
+            return LabelComponents(mesh, topo, node_root)
+        except (OSError, BrokenProcessPool):
+            pass
+
+    return LabelComponents(mesh, topo)
+
+
+def _fan_roots_pool(mesh, topo, workers, chunks_per_worker):
+    arrays = {
+        "vf_offsets": topo.vf_offsets,
+        "vf_faces": topo.vf_faces,
+        "ff_offsets": topo.ff_offsets,
+        "ff_faces": topo.ff_faces,
+        "labels": mesh.labels,
+        "node_root": np.zeros(len(topo.vf_faces), dtype=np.int64),
+    }
+
+    ranges = partition(topo.vf_offsets, workers * chunks_per_worker)
+    task = worker_module().fan_roots_chunk
+
+    with SharedArrays(arrays) as shared:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=get_context("spawn")) as pool:
+            futures = [pool.submit(task, shared.spec, mesh.n_verts,
+                                   mesh.n_faces, start, stop)
+                       for start, stop in ranges]
+            for future in futures:
+                future.result()
+
+        return shared.arrays["node_root"].copy()
+
+
+def detect_non_manifold_parallel(mesh, workers=None, topology=None,
+                                 min_verts=MIN_PARALLEL_VERTS):
+    """Boolean mask of non manifold vertices, computed in a process pool"""
+    return label_components(mesh, workers, topology,
+                            min_verts=min_verts).non_manifold()
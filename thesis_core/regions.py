@@ -0,0 +1,207 @@
+"""Label boundary index and independent submeshes
+
+Only a vertex whose fan holds more than one label can be non manifold, and
+on labeled scans those boundary vertices are usually a small share of the
+mesh. The boundary is found with a few passes over the face corners; the
+faces around it can be cut out as submeshes (bands) that are processed
+alone, in a process pool or anywhere else, and mapped back by their
+global vertex and face ids:
+
+    bands = boundary_bands(mesh, n_bands=8)
+    ids = np.concatenate([band.non_manifold() for band in bands])
+
+Per-label submeshes (label_submeshes) hold the faces of one label each and
+own the vertices inside it.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import numpy as np
+
+from .components import LabelComponents
+from .instrument import count, phase
+from .mesh import LabeledMesh
+from .parallel import MIN_PARALLEL_VERTS, worker_count, worker_module
+from .topology import csr_ranges, loop_faces, unique
+
+
+def boundary_mask(mesh):
+    """Boolean mask of the vertices whose fan holds more than one label"""
+    with phase("boundary"):
+        corner_label = np.repeat(mesh.labels, np.diff(mesh.face_offsets))
+
+        # Any label of the fan is a reference, a different one marks a boundary
+        reference = np.zeros(mesh.n_verts, dtype=mesh.labels.dtype)
+        reference[mesh.face_verts] = corner_label
+        other = corner_label != reference[mesh.face_verts]
+
+        mask = np.zeros(mesh.n_verts, dtype=bool)
+        mask[mesh.face_verts[other]] = True
+    count("boundary_vertices", np.count_nonzero(mask))
+    return mask
+
+
+def boundary_vertices(mesh):
+    """Sorted ids of the vertices whose fan holds more than one label"""
+    return np.flatnonzero(boundary_mask(mesh))
+
+
+class Submesh:
+    """Some faces of a mesh, renumbered as a mesh of their own
+
+    mesh: LabeledMesh of the faces, vertices renumbered
+    vert_ids: global id of every local vertex
+    face_ids: global id of every local face
+    owned: local ids of the vertices this submesh answers for
+    """
+
+    def __init__(self, mesh, vert_ids, face_ids, owned):
+        self.mesh = mesh
+        self.vert_ids = vert_ids
+        self.face_ids = face_ids
+        self.owned = owned
+
+    def non_manifold(self):
+        """Global ids of the owned non manifold vertices"""
+        mask = LabelComponents(self.mesh).non_manifold()
+        return self.vert_ids[self.owned[mask[self.owned]]]
+
+    def apply_labels(self, mesh):
+        """Copy the submesh labels back onto the faces of the full mesh"""
+        mesh.labels[self.face_ids] = self.mesh.labels
+
+    def __repr__(self):
+        return (f"Submesh(verts={self.mesh.n_verts}, "
+                f"faces={self.mesh.n_faces}, owned={len(self.owned)})")
+
+
+def extract(mesh, faces, owned=None):
+    """Submesh of the given faces, owning the given global vertices
+
+    Every owned vertex needs its whole fan among the faces for its
+    detection result to hold. Without `owned` the submesh owns nothing.
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    sizes = np.diff(mesh.face_offsets)[faces]
+    offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+
+    loops = csr_ranges(mesh.face_offsets, faces)
+    vert_ids, local = unique(mesh.face_verts[loops], return_inverse=True)
+    if owned is None:
+        owned = np.empty(0, dtype=np.int64)
+    owned = np.searchsorted(vert_ids, np.asarray(owned, dtype=np.int64))
+
+    sub = LabeledMesh(mesh.verts[vert_ids], offsets, local,
+                      mesh.labels[faces], mesh.materials)
+    return Submesh(sub, vert_ids, faces, owned)
+
+
+def faces_around(mesh, vertex_mask, rings=0):
+    """Sorted faces with a vertex in the mask, grown by `rings` vertex rings"""
+    corner_face = loop_faces(mesh.face_offsets)
+    faces = unique(corner_face[vertex_mask[mesh.face_verts]])
+    for _ in range(rings):
+        vertex_mask = np.zeros(mesh.n_verts, dtype=bool)
+        vertex_mask[mesh.face_verts[csr_ranges(mesh.face_offsets, faces)]] = True
+        faces = unique(corner_face[vertex_mask[mesh.face_verts]])
+    return faces
+
+
+def boundary_bands(mesh, n_bands=1, boundary=None, rings=0):
+    """Submeshes of the faces around the label boundary
+
+    The boundary vertices are split into `n_bands` slabs along the longest
+    axis of their bounding box; each band owns one slab and holds the faces
+    around it, grown by `rings` vertex rings (a margin for fix, whose paths
+    leave the fans). Interior vertices belong to no band.
+    """
+    if boundary is None:
+        boundary = boundary_mask(mesh)
+    vertices = np.flatnonzero(boundary)
+    if not len(vertices):
+        return []
+
+    with phase("bands"):
+        coords = mesh.verts[vertices]
+        axis = int(np.argmax(np.ptp(coords, axis=0)))
+        vertices = vertices[np.argsort(coords[:, axis], kind="stable")]
+
+        bands = []
+        n_bands = max(min(n_bands, len(vertices)), 1)
+        for owned in np.array_split(vertices, n_bands):
+            mask = np.zeros(mesh.n_verts, dtype=bool)
+            mask[owned] = True
+            bands.append(extract(mesh, faces_around(mesh, mask, rings),
+                                 np.sort(owned)))
+    count("bands", len(bands))
+    return bands
+
+
+def label_submeshes(mesh, boundary=None):
+    """Submesh of the faces of every label, owning the vertices inside it"""
+    if boundary is None:
+        boundary = boundary_mask(mesh)
+
+    order = np.argsort(mesh.labels, kind="stable")
+    labels = mesh.labels[order]
+    starts = np.flatnonzero(np.concatenate(([True], labels[1:] != labels[:-1])))
+    stops = np.append(starts[1:], len(order))
+
+    submeshes = {}
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        faces = np.sort(order[start:stop])
+        sub = extract(mesh, faces)
+        sub.owned = np.flatnonzero(~boundary[sub.vert_ids])
+        submeshes[int(labels[start])] = sub
+    return submeshes
+
+
+def boundary_non_manifold(mesh, boundary=None):
+    """Boolean mask of non manifold vertices from the faces around the boundary"""
+    mask = np.zeros(mesh.n_verts, dtype=bool)
+    for band in boundary_bands(mesh, 1, boundary):
+        mask[band.non_manifold()] = True
+    return mask
+
+
+def band_non_manifold(n_verts, face_offsets, face_verts, labels, owned):
+    """Worker: local ids of the owned non manifold vertices of one band"""
+    mesh = LabeledMesh(np.zeros((n_verts, 3), dtype=np.float32),
+                       face_offsets, face_verts, labels)
+    return owned[LabelComponents(mesh).non_manifold()[owned]]
+
+
+def detect_non_manifold_bands(mesh, workers=None, bands_per_worker=4,
+                              min_verts=MIN_PARALLEL_VERTS):
+    """Boolean mask of non manifold vertices, only the boundary is scanned
+
+    Interior vertices are skipped in bulk. The boundary is split into bands
+    run in a process pool; one worker, meshes under `min_verts` vertices or
+    no usable pool run a single band serially.
+    """
+    boundary = boundary_mask(mesh)
+    workers = worker_count(workers)
+
+    if workers > 1 and mesh.n_verts >= min_verts:
+        mask = np.zeros(mesh.n_verts, dtype=bool)
+        bands = boundary_bands(mesh, workers * bands_per_worker, boundary)
+        task = worker_module("regions").band_non_manifold
+        try:
+            with phase("process pool"):
+                with ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=get_context("spawn")) as pool:
+                    futures = [pool.submit(task, b.mesh.n_verts,
+                                           b.mesh.face_offsets,
+                                           b.mesh.face_verts, b.mesh.labels,
+                                           b.owned) for b in bands]
+                    for band, future in zip(bands, futures):
+                        mask[band.vert_ids[future.result()]] = True
+            return mask
+        except (OSError, BrokenProcessPool):
+            pass
+
+    return boundary_non_manifold(mesh, boundary)
@@ -0,0 +1,72 @@
+"""Regions of interest: vertex masks and detection restricted to them
+
+A region is a boolean vertex mask: a selection grown by vertex rings, the
+vertices inside an axis aligned box or a sphere, or those inside a view
+frustum. Detection in a region builds the fan components of the faces
+around its vertices only. Building the masks and finding those faces still
+take vectorized passes over the whole mesh, but the component search, the
+costly part, follows the size of the area:
+
+    roi = sphere_mask(mesh.verts, center, radius)
+    mask = detect_non_manifold_roi(mesh, roi)
+"""
+
+import numpy as np
+
+from .instrument import count, phase
+from .regions import extract, faces_around
+from .topology import csr_ranges
+
+
+def ring_mask(mesh, vertex_mask, rings=1):
+    """Vertex mask grown by `rings` vertex rings (through shared faces)"""
+    mask = np.array(vertex_mask, dtype=bool)
+    if rings > 0 and mask.any():
+        faces = faces_around(mesh, mask, rings - 1)
+        mask[mesh.face_verts[csr_ranges(mesh.face_offsets, faces)]] = True
+    return mask
+
+
+def box_mask(points, lo, hi):
+    """Points inside the axis aligned box [lo, hi]"""
+    points = np.asarray(points)
+    return ((points >= np.asarray(lo)) & (points <= np.asarray(hi))).all(axis=1)
+
+
+def sphere_mask(points, center, radius):
+    """Points inside the sphere"""
+    offset = np.asarray(points, dtype=np.float64) - np.asarray(center)
+    return np.einsum("ij,ij->i", offset, offset) <= radius * radius
+
+
+def frustum_mask(points, matrix):
+    """Points inside the view frustum of a 4x4 object -> clip space matrix
+
+    E.g. a viewport perspective matrix times the object's world matrix.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    matrix = np.asarray(matrix, dtype=np.float64)
+    clip = points @ matrix[:3, :3].T + matrix[:3, 3]
+    w = points @ matrix[3, :3] + matrix[3, 3]
+    return (w > 0) & (np.abs(clip) <= w[:, None]).all(axis=1)
+
+
+def detect_non_manifold_roi(mesh, roi):
+    """Boolean mask of the non manifold vertices inside a region
+
+    Components are only built on the faces around the region, found with
+    a vectorized pass over the mesh; vertices outside it are False whatever
+    their state.
+    """
+    roi = np.asarray(roi, dtype=bool)
+    mask = np.zeros(mesh.n_verts, dtype=bool)
+    count("roi_vertices", np.count_nonzero(roi))
+    if not roi.any():
+        return mask
+
+    with phase("roi"):
+        sub = extract(mesh, faces_around(mesh, roi))
+        # Region vertices without faces are manifold, and not in the submesh
+        sub.owned = np.flatnonzero(roi[sub.vert_ids])
+    mask[sub.non_manifold()] = True
+    return mask
@@ -0,0 +1,254 @@
+"""Out-of-core detection for meshes larger than memory
+
+The OBJ file is streamed in blocks of lines, never loaded whole (a binary
+.lmesh cache is streamed in blocks through its memory map):
+
+1. vertex pass: bounding box and vertex count
+2. vertex pass: every vertex gets the spatial chunk (grid cell) holding it,
+   kept in a memory-mapped array on disk
+3. face pass: every face is appended to the on-disk face list of each chunk
+   owning one of its vertices, so a chunk holds the complete fan of every
+   vertex it owns (its halo ring comes along with it)
+4. chunk pass: each chunk is loaded alone, detection runs on it and the
+   non manifold vertices it owns are streamed to the output file
+
+Memory use follows the block and chunk sizes rather than the mesh size.
+
+    python -m thesis_core.stream big.obj non_manifold.txt --chunks 4 4 4
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .cache import SUFFIX, load_arrays
+from .detect import detect_non_manifold
+from .mesh import LabeledMesh
+from .obj import iter_obj
+from .topology import unique
+
+
+BLOCK_LINES = 1 << 20
+# OBJ files are read in blocks of about this many bytes per line
+LINE_BYTES = 32
+
+
+def iter_vertex_blocks(path, block_lines=BLOCK_LINES):
+    """(n, 3) float64 arrays of vertex positions, in file order"""
+    if Path(path).suffix == SUFFIX:
+        verts = load_arrays(path)[1]["verts"]
+        for start in range(0, len(verts), block_lines):
+            yield verts[start:start + block_lines].astype(np.float64)
+        return
+
+    for block in iter_obj(path, block_lines * LINE_BYTES, faces=False):
+        if len(block.verts):
+            yield block.verts.astype(np.float64)
+
+
+def iter_face_blocks(path, block_lines=BLOCK_LINES):
+    """(sizes, face_verts, labels) arrays of faces, in file order
+
+    Vertex indices are 0-based, negative OBJ indices are resolved. Labels
+    number the usemtl materials in order of first use.
+    """
+    if Path(path).suffix == SUFFIX:
+        yield from iter_cached_face_blocks(path, block_lines)
+        return
+
+    for block in iter_obj(path, block_lines * LINE_BYTES, verts=False):
+        if len(block.sizes):
+            yield block.sizes, block.face_verts, block.labels
+
+
+def iter_cached_face_blocks(path, block_faces):
+    """Face blocks of a memory-mapped binary cache, read block by block"""
+    arrays = load_arrays(path)[1]
+    face_offsets = arrays["face_offsets"]
+    n_faces = len(face_offsets) - 1
+    for start in range(0, n_faces, block_faces):
+        stop = min(start + block_faces, n_faces)
+        offsets = np.asarray(face_offsets[start:stop + 1])
+        yield (np.diff(offsets),
+               arrays["face_verts"][offsets[0]:offsets[-1]].astype(np.int64),
+               arrays["labels"][start:stop].astype(np.int32))
+
+
+class ChunkGrid:
+    """Uniform grid of spatial chunks over a bounding box"""
+
+    def __init__(self, lo, hi, shape):
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.shape = np.asarray(shape, dtype=np.int64)
+        extent = np.asarray(hi, dtype=np.float64) - self.lo
+        self.cell = np.where(extent > 0, extent, 1.0) / self.shape
+
+    @property
+    def n_chunks(self):
+        return int(np.prod(self.shape))
+
+    def chunk_of(self, coords):
+        cell = np.floor((coords - self.lo) / self.cell).astype(np.int64)
+        cell = np.clip(cell, 0, self.shape - 1)
+        return (cell[:, 0] * self.shape[1] + cell[:, 1]) * self.shape[2] \
+            + cell[:, 2]
+
+
+class ChunkStore:
+    """Append-only on-disk face lists (sizes, labels, vertices) per chunk"""
+
+    def __init__(self, directory, n_chunks):
+        self.directory = Path(directory)
+        self.n_chunks = n_chunks
+
+    def path(self, chunk, part):
+        return self.directory / f"chunk_{chunk}.{part}"
+
+    def append(self, chunk, sizes, labels, face_verts):
+        for part, array, dtype in (("sizes", sizes, np.int32),
+                                   ("labels", labels, np.int32),
+                                   ("verts", face_verts, np.int64)):
+            with open(self.path(chunk, part), "ab") as f:
+                np.asarray(array, dtype=dtype).tofile(f)
+
+    def load(self, chunk):
+        """(sizes, labels, face_verts) of a chunk, None when it is empty"""
+        if not self.path(chunk, "sizes").exists():
+            return None
+        return (np.fromfile(self.path(chunk, "sizes"), dtype=np.int32),
+                np.fromfile(self.path(chunk, "labels"), dtype=np.int32),
+                np.fromfile(self.path(chunk, "verts"), dtype=np.int64))
+
+    def remove(self, chunk):
+        for part in ("sizes", "labels", "verts"):
+            self.path(chunk, part).unlink(missing_ok=True)
+
+
+def bounds(path, block_lines=BLOCK_LINES):
+    """Bounding box and vertex count, streaming"""
+    lo = np.full(3, np.inf)
+    hi = np.full(3, -np.inf)
+    n_verts = 0
+    for coords in iter_vertex_blocks(path, block_lines):
+        lo = np.minimum(lo, coords.min(axis=0))
+        hi = np.maximum(hi, coords.max(axis=0))
+        n_verts += len(coords)
+    return lo, hi, n_verts
+
+
+def split_faces(sizes, face_verts, labels, vertex_chunk, n_chunks):
+    """Yield (chunk, sizes, labels, face_verts) for every chunk of a block"""
+    n_faces = len(sizes)
+    face = np.repeat(np.arange(n_faces, dtype=np.int64), sizes)
+    offsets = np.zeros(n_faces + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+
+    # Every (chunk, face) pair once: a face goes to each chunk of its vertices
+    pairs = unique(np.asarray(vertex_chunk[face_verts], dtype=np.int64)
+                   * n_faces + face)
+    pair_chunk = pairs // n_faces
+    pair_face = pairs % n_faces
+
+    starts = np.searchsorted(pair_chunk, np.arange(n_chunks + 1))
+    for chunk in np.flatnonzero(np.diff(starts)).tolist():
+        faces = pair_face[starts[chunk]:starts[chunk + 1]]
+        counts = sizes[faces]
+        loops = (np.arange(counts.sum(), dtype=np.int64)
+                 - np.repeat(np.cumsum(counts) - counts, counts)
+                 + np.repeat(offsets[faces], counts))
+        yield chunk, counts, labels[faces], face_verts[loops]
+
+
+def detect_chunk(sizes, labels, face_verts, vertex_chunk, chunk):
+    """Global ids of the non manifold vertices owned by a chunk"""
+    global_ids, local = unique(face_verts, return_inverse=True)
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+
+    mesh = LabeledMesh(np.zeros((len(global_ids), 3), dtype=np.float32),
+                       offsets, local, labels)
+    mask = detect_non_manifold(mesh)
+
+    # Halo vertices may miss part of their fan, only owned ones are final
+    owned = np.asarray(vertex_chunk[global_ids]) == chunk
+    return global_ids[mask & owned]
+
+
+def detect_non_manifold_streaming(path, output, shape=(4, 4, 4), workdir=None,
+                                  block_lines=BLOCK_LINES, log=None):
+    """Detect non manifold vertices of an OBJ file chunk by chunk
+
+    Writes the 0-based ids of the non manifold vertices to `output`, one per
+    line, and returns how many were found.
+    """
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        lo, hi, n_verts = bounds(path, block_lines)
+        grid = ChunkGrid(lo, hi, shape)
+        dtype = np.uint16 if grid.n_chunks <= np.iinfo(np.uint16).max \
+            else np.uint32
+
+        # Chunk of every vertex, on disk
+        vertex_chunk = np.memmap(Path(tmp) / "vertex_chunk", dtype=dtype,
+                                 mode="w+", shape=(max(n_verts, 1),))
+        start = 0
+        for coords in iter_vertex_blocks(path, block_lines):
+            vertex_chunk[start:start + len(coords)] = grid.chunk_of(coords)
+            start += len(coords)
+        vertex_chunk.flush()
+
+        # Faces to the chunks of their vertices
+        store = ChunkStore(tmp, grid.n_chunks)
+        for sizes, face_verts, labels in iter_face_blocks(path, block_lines):
+            for chunk, *faces in split_faces(sizes, face_verts, labels,
+                                             vertex_chunk, grid.n_chunks):
+                store.append(chunk, *faces)
+
+        # Detection chunk by chunk, streaming the results
+        found = 0
+        with open(output, "w") as out:
+            for chunk in range(grid.n_chunks):
+                faces = store.load(chunk)
+                if faces is None:
+                    continue
+                ids = detect_chunk(*faces, vertex_chunk, chunk)
+                store.remove(chunk)
+                np.savetxt(out, ids, fmt="%d")
+                found += len(ids)
+                if log:
+                    log(f"chunk {chunk}: {len(faces[0])} faces, "
+                        f"{len(ids)} non manifold")
+
+        del vertex_chunk
+
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m thesis_core.stream",
+        description="Out-of-core non manifold vertex detection of an OBJ")
+    parser.add_argument("input", help="labeled OBJ file or .lmesh cache")
+    parser.add_argument("output", help="text file of non manifold vertex ids")
+    parser.add_argument("--chunks", type=int, nargs=3, default=(4, 4, 4),
+                        metavar=("X", "Y", "Z"), help="spatial chunk grid")
+    parser.add_argument("--block-lines", type=int, default=BLOCK_LINES,
+                        help="lines read per block")
+    parser.add_argument("--workdir", help="directory for temporary files")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    found = detect_non_manifold_streaming(
+        args.input, args.output, tuple(args.chunks), args.workdir,
+        args.block_lines, None if args.quiet else print)
+    print(f"{found} non manifold vertices, "
+          f"{time.perf_counter() - start:.2f} seconds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
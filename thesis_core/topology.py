@@ -0,0 +1,270 @@
+"""Array topology helpers: CSR incidence, adjacency and connected components"""
+
+import numpy as np
+
+from . import kernels
+
+
+def unique(values, return_inverse=False):
+    """Sorted unique values, sort based (hash based np.unique is slower here)"""
+    values = np.asarray(values)
+    if return_inverse:
+        order = np.argsort(values, kind="stable")
+        ordered = values[order]
+    else:
+        ordered = np.sort(values)
+    first = np.ones(len(ordered), dtype=bool)
+    first[1:] = ordered[1:] != ordered[:-1]
+    result = ordered[first]
+
+    if not return_inverse:
+        return result
+
+    inverse = np.empty(len(values), dtype=np.int64)
+    inverse[order] = np.cumsum(first) - 1
+    return result, inverse
+
+
+def loop_faces(face_offsets):
+    """Face index of every loop"""
+    n_faces = len(face_offsets) - 1
+    return np.repeat(np.arange(n_faces, dtype=np.int64), np.diff(face_offsets))
+
+
+def loop_next(face_offsets):
+    """Index of the next loop of the same face for every loop"""
+    sizes = np.diff(face_offsets)
+    nxt = np.arange(1, face_offsets[-1] + 1, dtype=np.int64)
+    closed = sizes > 0
+    nxt[face_offsets[1:][closed] - 1] = face_offsets[:-1][closed]
+    return nxt
+
+
+def vertex_face_csr(n_verts, face_offsets, face_verts):
+    """Vertex -> face incidence in CSR layout, faces sorted per vertex"""
+    n_faces = len(face_offsets) - 1
+
+    key = unique(face_verts.astype(np.int64) * n_faces
+                    + loop_faces(face_offsets))
+    vf_faces = key % max(n_faces, 1)
+    vf_offsets = np.zeros(n_verts + 1, dtype=np.int64)
+    np.cumsum(np.bincount(key // max(n_faces, 1), minlength=n_verts),
+              out=vf_offsets[1:])
+
+    return vf_offsets, vf_faces
+
+
+def edge_keys(n_verts, face_offsets, face_verts):
+    """Undirected edge key (min * n_verts + max) of every loop"""
+    a = face_verts.astype(np.int64)
+    b = a[loop_next(face_offsets)]
+    return np.minimum(a, b) * n_verts + np.maximum(a, b)
+
+
+def face_adjacency(n_verts, face_offsets, face_verts):
+    """Unique pairs of faces (f < g) sharing at least one edge"""
+    n_faces = len(face_offsets) - 1
+
+    edge_key = edge_keys(n_verts, face_offsets, face_verts)
+    order = np.argsort(edge_key, kind="stable")
+    edge_key = edge_key[order]
+    edge_face = loop_faces(face_offsets)[order]
+
+    # Pair every two loops lying on the same edge (non manifold edges too)
+    first, second = [], []
+    d = 1
+    while d < len(edge_key):
+        same = np.flatnonzero(edge_key[:-d] == edge_key[d:])
+        if len(same) == 0:
+            break
+        first.append(edge_face[same])
+        second.append(edge_face[same + d])
+        d += 1
+
+    if not first:
+        return np.empty((0, 2), dtype=np.int64)
+
+    f = np.concatenate(first)
+    g = np.concatenate(second)
+    keep = f != g
+    f, g = np.minimum(f[keep], g[keep]), np.maximum(f[keep], g[keep])
+    pairs = unique(f * n_faces + g)
+
+    return np.stack((pairs // n_faces, pairs % n_faces), axis=1)
+
+
+def face_face_csr(n_faces, pairs):
+    """Face -> face (edge) adjacency in CSR layout from unique pairs"""
+    src = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    dst = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    order = np.lexsort((dst, src))
+    ff_offsets = np.zeros(n_faces + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_faces), out=ff_offsets[1:])
+
+    return ff_offsets, dst[order]
+
+
+def connected_components(n_nodes, a, b):
+    """Root of each node's component for the undirected graph a[i] - b[i]"""
+    parent = np.arange(n_nodes, dtype=np.int64)
+
+    while True:
+        pa = parent[a]
+        pb = parent[b]
+        lo = np.minimum(pa, pb)
+        hi = np.maximum(pa, pb)
+        hook = lo != hi
+        if not hook.any():
+            break
+        # Hook the higher root below the lower one, lo < hi so no cycles
+        parent[hi[hook]] = lo[hook]
+        # Pointer jumping until every node points at its root
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+    return parent
+
+
+def csr_ranges(offsets, rows):
+    """Concatenated CSR value indices of the given rows"""
+    rows = np.asarray(rows, dtype=np.int64)
+    start = offsets[rows]
+    counts = offsets[rows + 1] - start
+    return (np.arange(counts.sum(), dtype=np.int64)
+            - np.repeat(np.cumsum(counts) - counts, counts)
+            + np.repeat(start, counts))
+
+
+class Topology:
+    """Vertex -> face incidence and face adjacency of a mesh
+
+    The incidence is kept in CSR layout, every (vertex, face) entry of it is
+    an incidence node. Face adjacency is kept as unique pairs, its CSR form
+    is built on first use.
+    """
+
+    def __init__(self, mesh):
+        self.n_verts = mesh.n_verts
+        self.n_faces = mesh.n_faces
+        self.vf_offsets, self.vf_faces = vertex_face_csr(
+            mesh.n_verts, mesh.face_offsets, mesh.face_verts)
+        self.face_pairs = face_adjacency(
+            mesh.n_verts, mesh.face_offsets, mesh.face_verts)
+        self._ff = None
+
+    @classmethod
+    def from_arrays(cls, n_verts, n_faces, vf_offsets, vf_faces,
+                    ff_offsets=None, ff_faces=None, face_pairs=None):
+        """Wrap precomputed arrays, face_pairs or the face CSR is required"""
+        topo = cls.__new__(cls)
+        topo.n_verts = n_verts
+        topo.n_faces = n_faces
+        topo.vf_offsets = vf_offsets
+        topo.vf_faces = vf_faces
+        topo.face_pairs = face_pairs
+        topo._ff = (ff_offsets, ff_faces) if ff_offsets is not None else None
+        return topo
+
+    @property
+    def ff_offsets(self):
+        return self._face_face()[0]
+
+    @property
+    def ff_faces(self):
+        return self._face_face()[1]
+
+    def _face_face(self):
+        if self._ff is None:
+            self._ff = face_face_csr(self.n_faces, self.face_pairs)
+        return self._ff
+
+    @property
+    def node_verts(self):
+        """Vertex of every incidence node"""
+        return np.repeat(np.arange(self.n_verts, dtype=np.int64),
+                         np.diff(self.vf_offsets))
+
+    def vertex_faces(self, v):
+        return self.vf_faces[self.vf_offsets[v]:self.vf_offsets[v + 1]]
+
+    def face_neighbours(self, f):
+        return self.ff_faces[self.ff_offsets[f]:self.ff_offsets[f + 1]]
+
+    def face_vertices(self, mesh, faces):
+        """Unique vertices of the given faces"""
+        return unique(mesh.face_verts[csr_ranges(mesh.face_offsets, faces)])
+
+
+def fan_components(mesh, labels, topo):
+    """Fan-local component root of every incidence node
+
+    Same-label faces sharing an edge are joined inside every fan they
+    share. Roots are incidence node indices, a root always belongs to the
+    same vertex as its nodes.
+    """
+    if kernels.enabled():
+        return kernels.fan_roots(topo, np.arange(topo.n_verts), labels)
+
+    n_faces = max(mesh.n_faces, 1)
+    face_offsets = mesh.face_offsets
+    sizes = np.diff(face_offsets)
+    labels = np.asarray(labels)
+
+    node_key = topo.node_verts * n_faces + topo.vf_faces
+
+    pairs = topo.face_pairs
+    pairs = pairs[labels[pairs[:, 0]] == labels[pairs[:, 1]]]
+
+    f = pairs[:, 0]
+    g = pairs[:, 1]
+    rep = np.repeat(np.arange(len(pairs), dtype=np.int64), sizes[f])
+    loop = (np.arange(len(rep), dtype=np.int64)
+            - np.repeat(np.cumsum(sizes[f]) - sizes[f], sizes[f])
+            + np.repeat(face_offsets[:-1][f], sizes[f]))
+    v = mesh.face_verts[loop].astype(np.int64)
+
+    # Keep the vertices of f that also belong to g
+    key_g = v * n_faces + g[rep]
+    pos = np.minimum(np.searchsorted(node_key, key_g),
+                     max(len(node_key) - 1, 0))
+    shared = node_key[pos] == key_g
+
+    node_g = pos[shared]
+    node_f = np.searchsorted(node_key, v[shared] * n_faces + f[rep[shared]])
+
+    return connected_components(len(node_key), node_f, node_g)
+
+
+def local_fan_components(topo, vertices, labels):
+    """Fan-local component roots of the incidence nodes of some vertices
+
+    `vertices` must be unique. Nodes come in vertex -> face CSR order of
+    those vertices, so they match csr_ranges(topo.vf_offsets, vertices);
+    roots index into that same local node list.
+    """
+    if kernels.enabled():
+        return kernels.fan_roots(topo, vertices, labels)
+
+    vertices = np.asarray(vertices, dtype=np.int64)
+    n_faces = max(topo.n_faces, 1)
+
+    counts = topo.vf_offsets[vertices + 1] - topo.vf_offsets[vertices]
+    node_slot = np.repeat(np.arange(len(vertices), dtype=np.int64), counts)
+    node_face = topo.vf_faces[csr_ranges(topo.vf_offsets, vertices)]
+    node_key = node_slot * n_faces + node_face
+
+    # Neighbours of each fan face that lie in the same fan with the same label
+    ff_offsets, ff_faces = topo.ff_offsets, topo.ff_faces
+    nb_counts = ff_offsets[node_face + 1] - ff_offsets[node_face]
+    rep = np.repeat(np.arange(len(node_face), dtype=np.int64), nb_counts)
+    nb = ff_faces[csr_ranges(ff_offsets, node_face)]
+
+    key = node_slot[rep] * n_faces + nb
+    pos = np.minimum(np.searchsorted(node_key, key),
+                     max(len(node_key) - 1, 0))
+    hit = (node_key[pos] == key) & (labels[nb] == labels[node_face[rep]])
+
+    return connected_components(len(node_key), rep[hit], pos[hit])
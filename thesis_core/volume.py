@@ -0,0 +1,275 @@
+"""Non manifold vertices and edges of labeled tetrahedral meshes
+
+The volume counterpart of the surface detection: around a vertex (or an
+edge) the same-label cells, connected through the triangles they share,
+form components; the vertex (edge) is non manifold when its cells hold more
+than one label and more components than labels.
+
+Cells are stored as a compact (n_cells, 4) vertex array. Every cell corner
+is a node of the vertex stars and every cell edge a node of the edge rings,
+so the components come from one array union-find over the corners (edge
+slots) of same-label cells sharing a triangle, as fan_components does for
+polygon fans.
+
+Tet meshes are read from MEDIT .mesh files (Tetrahedra reference = label)
+or TetGen .node + .ele files (first cell attribute = label):
+
+    python -m thesis_core.volume model.mesh --vertices nm_verts.txt
+"""
+
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .components import is_non_manifold
+from .instrument import count, phase
+from .topology import connected_components, unique
+
+
+# Corners of the face opposite each corner
+TET_FACES = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+# Corners of the six edges, and the edge slot of every corner pair
+TET_EDGES = np.array([[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]])
+EDGE_SLOT = np.full((4, 4), -1, dtype=np.int64)
+EDGE_SLOT[TET_EDGES[:, 0], TET_EDGES[:, 1]] = np.arange(6)
+EDGE_SLOT[TET_EDGES[:, 1], TET_EDGES[:, 0]] = np.arange(6)
+
+
+class TetMesh:
+    """Tetrahedral mesh with one label per cell
+
+    verts: (n_verts, 3) float32 coordinates
+    cells: (n_cells, 4) int32 vertex indices of every tetrahedron
+    labels: (n_cells,) int32 label of every cell
+    """
+
+    def __init__(self, verts, cells, labels=None):
+        self.verts = np.ascontiguousarray(
+            verts, dtype=np.float32).reshape(-1, 3)
+        self.cells = np.ascontiguousarray(cells, dtype=np.int32).reshape(-1, 4)
+        if labels is None:
+            labels = np.zeros(len(self.cells), dtype=np.int32)
+        self.labels = np.ascontiguousarray(labels, dtype=np.int32)
+
+    @property
+    def n_verts(self):
+        return len(self.verts)
+
+    @property
+    def n_cells(self):
+        return len(self.cells)
+
+    def __repr__(self):
+        return (f"TetMesh(verts={self.n_verts}, cells={self.n_cells}, "
+                f"labels={len(unique(self.labels))})")
+
+
+def _read_rows(lines, n, dtype):
+    """Next n rows of numbers from an iterator of lines, parsed by NumPy"""
+    rows = np.loadtxt(itertools.islice(lines, n), dtype=dtype, ndmin=2,
+                      comments="#")
+    if len(rows) != n:
+        raise ValueError(f"expected {n} rows, got {len(rows)}")
+    return rows
+
+
+def _data_lines(f):
+    """Non empty, non comment lines"""
+    for line in f:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def load_medit(path):
+    """Read the Vertices and Tetrahedra of an ASCII MEDIT .mesh file"""
+    sections = {}
+    with open(path, "r") as f:
+        lines = _data_lines(f)
+        for line in lines:
+            words = line.split()
+            keyword = words[0].lower()
+            if keyword not in ("vertices", "tetrahedra"):
+                continue
+            n = int(words[1]) if len(words) > 1 else int(next(lines))
+            dtype = np.float64 if keyword == "vertices" else np.int64
+            sections[keyword] = _read_rows(lines, n, dtype)
+
+    for name in ("vertices", "tetrahedra"):
+        if name not in sections:
+            raise ValueError(f"{path} has no {name.capitalize()} section")
+    tets = sections["tetrahedra"]
+    return TetMesh(sections["vertices"][:, :3], tets[:, :4] - 1, tets[:, 4])
+
+
+def load_tetgen(path):
+    """Read a TetGen .node file and the .ele file next to it
+
+    The first cell attribute is the label (0 without attributes). Indices
+    start at the first node number of the .node file.
+    """
+    path = Path(path)
+    with open(path.with_suffix(".node"), "r") as f:
+        lines = _data_lines(f)
+        n_verts = int(next(lines).split()[0])
+        nodes = _read_rows(lines, n_verts, np.float64)
+    base = int(nodes[0, 0]) if n_verts else 0
+
+    with open(path.with_suffix(".ele"), "r") as f:
+        lines = _data_lines(f)
+        n_cells, per_cell, n_attrs = (int(t) for t in next(lines).split()[:3])
+        if per_cell != 4:
+            raise ValueError(f"only linear tetrahedra, got {per_cell} nodes")
+        rows = _read_rows(lines, n_cells, np.float64)
+
+    labels = rows[:, 5] if n_attrs else None
+    return TetMesh(nodes[:, 1:4], rows[:, 1:5].astype(np.int64) - base,
+                   labels)
+
+
+def load_tet_mesh(path):
+    """Read a .mesh (MEDIT) or .node/.ele (TetGen) tetrahedral mesh"""
+    if Path(path).suffix == ".mesh":
+        return load_medit(path)
+    return load_tetgen(path)
+
+
+def shared_faces(mesh):
+    """Corners of every triangle shared by two cells
+
+    Returns (a, b): (n_shared, 3) corner indices (cell * 4 + local) in the
+    two cells, aligned so that a[i, k] and b[i, k] hold the same vertex. A
+    triangle shared by more than two cells pairs each with the first one.
+    """
+    n_cells = mesh.n_cells
+    corners = (np.arange(n_cells, dtype=np.int64)[:, None, None] * 4
+               + TET_FACES[None]).reshape(-1, 3)
+
+    # Corners of each face ordered by vertex, so shared faces line up
+    verts = mesh.cells.reshape(-1)[corners]
+    order = np.argsort(verts, axis=1)
+    corners = np.take_along_axis(corners, order, axis=1)
+    verts = np.take_along_axis(verts, order, axis=1).astype(np.int64)
+
+    if mesh.n_verts < 1 << 21:
+        key = (verts[:, 0] << 42) | (verts[:, 1] << 21) | verts[:, 2]
+        perm = np.argsort(key, kind="stable")
+        same = key[perm[1:]] == key[perm[:-1]]
+    else:
+        perm = np.lexsort((verts[:, 2], verts[:, 1], verts[:, 0]))
+        ordered = verts[perm]
+        same = (ordered[1:] == ordered[:-1]).all(axis=1)
+
+    # Pair every face with the first face of its run of equal faces
+    run_start = np.zeros(len(perm), dtype=np.int64)
+    run_start[1:] = np.where(same, 0, np.arange(1, len(perm)))
+    run_start = np.maximum.accumulate(run_start)
+    second = np.flatnonzero(np.concatenate(([False], same)))
+
+    return corners[perm[run_start[second]]], corners[perm[second]]
+
+
+def vertex_components(mesh, shared=None):
+    """Same-label cell components and distinct labels around every vertex"""
+    a, b = shared if shared is not None else shared_faces(mesh)
+    corner_label = np.repeat(mesh.labels, 4)
+
+    with phase("vertex components"):
+        same = corner_label[a[:, 0]] == corner_label[b[:, 0]]
+        roots = connected_components(
+            mesh.n_cells * 4, a[same].ravel(), b[same].ravel())
+
+        corner_vert = mesh.cells.reshape(-1).astype(np.int64)
+        is_root = roots == np.arange(len(roots))
+        n_comps = np.bincount(corner_vert[is_root], minlength=mesh.n_verts)
+        n_labels = _label_counts(corner_vert, corner_label, mesh.n_verts)
+
+    count("vertices_scanned", mesh.n_verts)
+    return n_comps, n_labels
+
+
+def edge_components(mesh, shared=None):
+    """Edges, with the same-label cell components and labels around each
+
+    Returns (edges, n_comps, n_labels), edges being (n_edges, 2) sorted
+    vertex pairs.
+    """
+    a, b = shared if shared is not None else shared_faces(mesh)
+
+    with phase("edge components"):
+        # Edge slots (cell * 6 + slot) are the nodes of the edge rings
+        ends = mesh.cells[:, TET_EDGES].astype(np.int64)
+        lo = ends.min(axis=2).ravel()
+        hi = ends.max(axis=2).ravel()
+        edges, slot_edge = unique(lo * mesh.n_verts + hi, return_inverse=True)
+        edges = np.stack((edges // mesh.n_verts, edges % mesh.n_verts), axis=1)
+
+        same = mesh.labels[a[:, 0] // 4] == mesh.labels[b[:, 0] // 4]
+        a, b = a[same], b[same]
+
+        # The three edges of every shared triangle join their two slots
+        src = []
+        dst = []
+        for i, j in ((0, 1), (0, 2), (1, 2)):
+            src.append(a[:, 0] // 4 * 6 + EDGE_SLOT[a[:, i] % 4, a[:, j] % 4])
+            dst.append(b[:, 0] // 4 * 6 + EDGE_SLOT[b[:, i] % 4, b[:, j] % 4])
+        roots = connected_components(mesh.n_cells * 6, np.concatenate(src),
+                                     np.concatenate(dst))
+
+        is_root = roots == np.arange(len(roots))
+        n_comps = np.bincount(slot_edge[is_root], minlength=len(edges))
+        n_labels = _label_counts(slot_edge, np.repeat(mesh.labels, 6),
+                                 len(edges))
+
+    count("edges_scanned", len(edges))
+    return edges, n_comps, n_labels
+
+
+def _label_counts(owner, label, n):
+    """Distinct labels per owner"""
+    label = label.astype(np.int64)
+    n_values = int(label.max()) + 1 if len(label) else 1
+    pairs = unique(owner * n_values + label)
+    return np.bincount(pairs // n_values, minlength=n)
+
+
+def detect_non_manifold_volume(mesh):
+    """Non manifold vertex mask and (n, 2) non manifold edges of a TetMesh"""
+    with phase("shared faces"):
+        shared = shared_faces(mesh)
+    vertex_mask = is_non_manifold(*vertex_components(mesh, shared))
+    edges, n_comps, n_labels = edge_components(mesh, shared)
+    return vertex_mask, edges[is_non_manifold(n_comps, n_labels)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m thesis_core.volume",
+        description="Non manifold vertices and edges of a labeled tet mesh")
+    parser.add_argument("input", help=".mesh (MEDIT) or .node/.ele (TetGen)")
+    parser.add_argument("--vertices", help="write non manifold vertex ids")
+    parser.add_argument("--edges", help="write non manifold edges")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    mesh = load_tet_mesh(args.input)
+    loaded = time.perf_counter()
+    vertex_mask, edges = detect_non_manifold_volume(mesh)
+
+    if args.vertices:
+        np.savetxt(args.vertices, np.flatnonzero(vertex_mask), fmt="%d")
+    if args.edges:
+        np.savetxt(args.edges, edges, fmt="%d")
+
+    print(f"{mesh}: {int(vertex_mask.sum())} non manifold vertices, "
+          f"{len(edges)} non manifold edges, load {loaded - start:.2f}s, "
+          f"detect {time.perf_counter() - loaded:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())